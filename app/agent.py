@@ -1,128 +1,254 @@
 from typing import List
+import logging
 import os
+import time
 from dotenv import load_dotenv
-from openai import OpenAI
 from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
 from langchain.agents import create_tool_calling_agent
-from langchain.agents import AgentExecutor
 from langchain_core.messages import AIMessage, HumanMessage
 import tools as t
+import async_tools as at
 import tool_agents
-from langchain.globals import set_verbose, set_debug
-
-set_debug(True)
-
-set_verbose(True)
-
-
+import cassette
+from parallel_executor import ParallelAgentExecutor
+from prompts import build_prompt
+from history import HistoryManager
+import faq
+from response_cache import response_cache
+from sessions import agent_sessions
+from streaming import stream_text
+import metrics
+import tracing
 from datetime import datetime
 
 # Ensure environment variables are loaded
 load_dotenv()
 
-# Get the OpenAI API key from environment variables
-openai_api_key = os.getenv("OPENAI_API_KEY")
+# Build what the first turns would otherwise wait for when the server starts
+WARM_UP = os.getenv("WARM_UP", "false").lower() == "true"
 
-# Check if the OpenAI API key is not None before creating the client
-if openai_api_key is not None:
-    client = OpenAI(api_key=openai_api_key)
-else:
+if os.getenv("OPENAI_API_KEY") is None:
     raise ValueError("OPENAI_API_KEY environment variable is not set")
 
+# One chat model for all calls, so its HTTP connection pool is shared too.
+# It always streams so that /run_agent/stream can forward tokens as they arrive.
+# LLM_CASSETTE_MODE can record its calls or replay them (see cassette.py).
+llm = ChatOpenAI(
+    model="gpt-4o-mini",
+    temperature=0,
+    streaming=True,
+    stream_usage=True,
+    http_client=cassette.http_client(),
+    http_async_client=cassette.http_async_client(),
+)
+
 
 class LangChainAgent:
     def __init__(self, phone_number):
-        self.model = "gpt-4o-mini"
-        member_information = t.get_member_information(phone_number)
-        now = datetime.now()
-        formatted_time = now.strftime("%A, %B %d, %I:%M%p")
-        system_message = f"""
-        You are a call center agent at Signify Health. You have received a call from a call from a member. Members usually call regarding their appointments. Your task is to answer their questions, manage their appointments, and provide them with the necessary information.
-        
-        ### Frequently Asked Questions:
-        - What does Signify Health do? Signify Health provides in-home and virtual health evaluations to Medicare members. These evaluations help members understand their health better and close gaps in care by addressing chronic conditions and preventive health needs. The service is designed to support a member’s existing healthcare, not replace it, by offering convenient, personalized care directly in their homes.
-        - What is an In-Home Health Evaluation (IHE)? An In-Home Health Evaluation is a one-on-one assessment where a licensed clinician visits a member at their home. The clinician reviews the member's medical history, checks vital signs, and may conduct tests for chronic conditions. The goal is to offer personalized health insights, identify potential health risks, and connect members to additional healthcare resources.
-        - Will I be charged for the health evaluation? No, there is no cost to members for the in-home or virtual health evaluations provided by Signify Health. The service is part of your health plan's benefits, and there are no out-of-pocket expenses for the visit.
-        - How do I schedule or reschedule my visit? You can easily schedule or reschedule your In-Home Health Evaluation by calling the Signify Health customer service line or visiting their scheduling portal online. Flexible appointment options are available, including weekends and evenings, to accommodate your schedule.
-        - What should I expect during my visit? During the visit, a licensed clinician will review your medical history, conduct a physical exam and check your vitals, answer any health-related questions you may have, provide recommendations based on your current health status. 
-        - How long does an evaluation take? In-home evaluations usually take between 45 minutes to an hour, depending on the complexity of your health conditions and any specific tests that may be conducted during the visit.
-        - Is my personal health information safe? Yes, all personal health information collected during the evaluation is protected under HIPAA regulations. Signify Health ensures the confidentiality and security of your data, which will be shared only with your healthcare providers as needed.
-        - Do I need to prepare for my In-Home Health Evaluation? To prepare for your evaluation, have your current medications and medical history available for the clinician. It is also helpful to write down any questions or concerns you may have about your health so the clinician can address them during the visit.
-        - Who will be conducting the evaluation? Your evaluation will be conducted by a licensed clinician, which could be a physician, nurse practitioner, or physician assistant. All clinicians are highly trained and certified to perform comprehensive health evaluations.
-        - What happens after my evaluation? After your evaluation, the clinician will send a detailed report to your primary care provider. This report will outline the findings from your evaluation and offer recommendations for any further care or testing that may be needed. You may also receive a follow-up from Signify Health if any immediate action is required.
-        
-        ### Instructions
-        - Only use the information provided and the existing tools and databases for your answers. 
-        - Be brief. Keep answers under 100 words.
-        - Address the member by their first name, as opposed to first and last name.
-        - Be mindful of the member's privacy. Do not share any information about other members.
-        - If you cannot verify the first and last names of the member associated with the phone number, do not disclose any information about the member associated with the phone number.
-        - Verify the member's name. Do not proceed unless the first name and last name match the ones associated with the phone number. If the member only provides a first name, ask for their last name.
-        - Confirm any actions taken during the call with the member to ensure clarity.
-        - Before making any new appointments, or changes to existing appointments or the member's information, confirm the information with the member to ensure clarity.
-        - If you are unable to answer a question, escalate the call.
-        - If the member wants to speak with a supervisor or a human agent, escalate the call.
-        - If there are technical issues that cannot be resolved, escalate the call.
-        - If a member information cannot be found, escalate the call.
-        - If the member has a health emergency issue, aske them to hang up and dial 911.        
-        - To escalate a call, politely apologize for the inconvenience, inform the member that they will receive a call from a supervisor shortly, and use the scalation tool to notify the supervisor.
-        - To reschedule an existing appointment, first schedule a new appointment and then cancel the original appointment.
-        ### Current Date and Time:
-        {formatted_time}
-
-        ### Member Information:
-        {member_information}
-
-        """
-        print(f'system message: {system_message}')
-
-        # Initialize LangChain OpenAI LLM
-        if openai_api_key is not None:
-            self.llm = ChatOpenAI(model=self.model, temperature=0)
-        else:
-            raise ValueError("OPENAI_API_KEY environment variable is not set")
-
-        self.prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", system_message),
-                ("placeholder", "{chat_history}"),
-                ("human", "{input}"),
-                ("placeholder", "{agent_scratchpad}"),
-            ]
-        )
+        self.model = llm.model_name
+        self.phone_number = phone_number
+        self.messages = []
+        self.llm = llm
+
+        # The member information and the time are filled in on every turn, so
+        # the agent can be kept for the whole call and still see fresh data.
+        self.prompt = build_prompt()
+
+        # Older turns of long calls are summarized, see history.py
+        self.history = HistoryManager(llm)
 
-        # Create a simple tool
-        self.tools = [
-            tool_agents.update_databse,
-            t.cancel_appointment,
-            t.get_provider_information,
-            t.schedule_appointment,
-            t.escalate_call,
-        ]
+        # The tools have both sync and async implementations
+        self.tools = at.TOOLS
 
         self.agent = create_tool_calling_agent(self.llm, self.tools, self.prompt)
 
-        self.agent_executor = AgentExecutor(
-            agent=self.agent, tools=self.tools, verbose=True
+        # Runs the tool calls of a step concurrently, see parallel_executor.py.
+        # The intermediate steps tell whether an answer used a tool,
+        # answers that did are never shared through the response cache
+        self.agent_executor = ParallelAgentExecutor(
+            agent=self.agent,
+            tools=self.tools,
+            return_intermediate_steps=True,
         )
 
-    def get_response(self, transcript: List[str]) -> str:
-        last_msg = transcript[-1]
-        chat_history = []
-        for idx, val in enumerate(transcript[:-1]):
-            if idx % 2 == 0:
-                chat_history.append(AIMessage(content=val))
-            else:
-                chat_history.append(HumanMessage(content=val))
-        print("chat_history: ", chat_history)
-
+    def _inputs(self, chat_history, utterance: str, member_information: str) -> dict:
+        return {
+            "chat_history": chat_history,
+            "input": utterance,
+            "faq": faq.render(faq.faq_index.search(utterance)),
+            "current_time": datetime.now().strftime("%A, %B %d, %I:%M%p"),
+            "member_information": member_information,
+        }
+
+    def _direct_answer(self, utterance: str):
+        """The stored answer when the utterance is clearly a FAQ question, else None."""
+        if not faq.FAQ_DIRECT_ANSWERS:
+            return None
+        entry = faq.faq_index.direct_answer(utterance)
+        return entry["answer"] if entry is not None else None
+
+    def _invoke(self, chat_history, utterance: str, callbacks=None) -> str:
+        start = time.perf_counter()
+        with tracing.request("turn", history=len(chat_history)) as turn:
+            answer, answered_by = self._answer(chat_history, utterance, callbacks)
+            turn.set(answered_by=answered_by)
+        if answered_by != "agent":
+            stream_text(callbacks, answer)
+        metrics.turn_seconds.observe(time.perf_counter() - start, answered_by)
+        return answer
+
+    def _answer(self, chat_history, utterance: str, callbacks=None):
+        """The answer to utterance, and what gave it: faq, response_cache or agent."""
+        answer = self._direct_answer(utterance)
+        if answer is not None:
+            return answer, "faq"
+        member_information = t.get_member_information(self.phone_number)
+        cache_key = response_cache.key(utterance, member_information)
+        if cache_key is not None:
+            answer = response_cache.lookup(cache_key, member_information)
+            if answer is not None:
+                return answer, "response_cache"
+        start = time.perf_counter()
+        with tracing.span("history"):
+            chat_history = self.history.window(chat_history)
         res = self.agent_executor.invoke(
-            {"chat_history": chat_history, "input": last_msg}
+            self._inputs(chat_history, utterance, member_information),
+            config={"callbacks": tracing.callbacks(callbacks) + [metrics.callback_handler]},
+        )
+        self._record_iterations(res)
+        self._cache_response(cache_key, res, member_information, start)
+        return res["output"], "agent"
+
+    async def _ainvoke(self, chat_history, utterance: str, callbacks=None) -> str:
+        start = time.perf_counter()
+        with tracing.request("turn", history=len(chat_history)) as turn:
+            answer, answered_by = await self._aanswer(chat_history, utterance, callbacks)
+            turn.set(answered_by=answered_by)
+        if answered_by != "agent":
+            stream_text(callbacks, answer)
+        metrics.turn_seconds.observe(time.perf_counter() - start, answered_by)
+        return answer
+
+    async def _aanswer(self, chat_history, utterance: str, callbacks=None):
+        answer = self._direct_answer(utterance)
+        if answer is not None:
+            return answer, "faq"
+        member_information = await at.aget_member_information(self.phone_number)
+        cache_key = response_cache.key(utterance, member_information)
+        if cache_key is not None:
+            answer = response_cache.lookup(cache_key, member_information)
+            if answer is not None:
+                return answer, "response_cache"
+        start = time.perf_counter()
+        with tracing.span("history"):
+            chat_history = await self.history.awindow(chat_history)
+        res = await self.agent_executor.ainvoke(
+            self._inputs(chat_history, utterance, member_information),
+            config={"callbacks": tracing.callbacks(callbacks) + [metrics.callback_handler]},
+        )
+        self._record_iterations(res)
+        self._cache_response(cache_key, res, member_information, start)
+        return res["output"], "agent"
+
+    @staticmethod
+    def _record_iterations(res):
+        # Tool calls of one LLM response share its message; one more call gave the answer
+        responses = {id(action.message_log[0]) for action, _ in res["intermediate_steps"]
+                     if getattr(action, "message_log", None)}
+        metrics.turn_iterations.observe(len(responses) + 1)
+
+    @staticmethod
+    def _cache_response(cache_key, res, member_information, start):
+        if cache_key is None:
+            return
+        response_cache.store(
+            cache_key,
+            res["output"],
+            member_information,
+            latency=time.perf_counter() - start,
+            used_tools=bool(res.get("intermediate_steps")),
         )
-        return res["output"]
+
+    def get_response(self, transcript: List[str], callbacks=None) -> str:
+        chat_history, utterance = parse_transcript(transcript)
+        return self._invoke(chat_history, utterance, callbacks)
+
+    async def aget_response(self, transcript: List[str], callbacks=None) -> str:
+        chat_history, utterance = parse_transcript(transcript)
+        return await self._ainvoke(chat_history, utterance, callbacks)
+
+    def start_call(self, greeting: str):
+        """Start a call whose conversation is kept here, see arespond()."""
+        self.messages = [AIMessage(content=greeting)]
+
+    async def arespond(self, utterance: str, callbacks=None) -> str:
+        """Answer the next utterance of a call started with start_call()."""
+        output = await self._ainvoke(self.messages, utterance, callbacks)
+        self.messages.extend([HumanMessage(content=utterance), AIMessage(content=output)])
+        return output
+
+
+def parse_transcript(transcript: List[str]):
+    """
+    Split a transcript that alternates agent and member turns, starting with
+    the agent's greeting, into chat history messages and the last utterance.
+    """
+    chat_history = []
+    for idx, val in enumerate(transcript[:-1]):
+        if idx % 2 == 0:
+            chat_history.append(AIMessage(content=val))
+        else:
+            chat_history.append(HumanMessage(content=val))
+    return chat_history, transcript[-1]
+
+
+def session_key(phone_number, call_id) -> str:
+    """
+    Registry key of a call. It includes the phone number, so a call id sent
+    from another number never reaches the call's agent and its member data.
+    """
+    return f"{phone_number}:{call_id}"
+
+
+def get_agent(phone_number, call_id=None) -> LangChainAgent:
+    """
+    Return the agent of an ongoing call, building it on the first turn.
+    Without a call id the calls of one phone number cannot be told apart, so
+    the request gets an agent of its own that is not kept.
+    """
+    if call_id is None:
+        return LangChainAgent(phone_number)
+    return agent_sessions.get_or_create(
+        session_key(phone_number, call_id), lambda: LangChainAgent(phone_number)
+    )
 
 
-def run_agent(transcript: List[str], phone_number) -> str:
-    lc_agent = LangChainAgent(phone_number)
+def end_call(phone_number, call_id) -> bool:
+    """Drop the agent of a call that has ended; whether there was one."""
+    if call_id is None:
+        return False
+    return agent_sessions.end(session_key(phone_number, call_id)) is not None
+
+
+def run_agent(transcript: List[str], phone_number, call_id=None) -> str:
+    lc_agent = get_agent(phone_number, call_id)
     return lc_agent.get_response(transcript)
+
+
+async def arun_agent(transcript: List[str], phone_number, call_id=None) -> str:
+    lc_agent = get_agent(phone_number, call_id)
+    return await lc_agent.aget_response(transcript)
+
+
+def warm_up():
+    """
+    Open the database pool and build the SQL agent now instead of on first
+    use. Failures are logged: the first request that needs them retries.
+    """
+    start = time.perf_counter()
+    try:
+        t.get_pool()
+        tool_agents.get_sql_agent()
+        logging.info(f"Warmed up in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        logging.error(f"Warm-up failed: {e}")
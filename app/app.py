@@ -1,10 +1,23 @@
 # app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 import agent
+from streaming import stream_response
+from sessions import agent_sessions
+from db import get_pool
+from shared import member_info_cache
+from faq import faq_index
+import health
+import invalidation
+import metrics
+import prefetch
+import tracing
+from response_cache import response_cache
 import logging
 from pyngrok import ngrok
 import os
 import argparse
+import threading
+import time
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -30,24 +43,120 @@ def start_ngrok(start_ngrok):
         return "http://localhost:5001"  # Use localhost if ngrok is not started
 
 
+@app.before_request
+def start_request():
+    g.started = time.perf_counter()
+    tracing.set_request_id(request.headers.get("X-Request-ID") or tracing.new_id())
+
+
+@app.after_request
+def finish_request(response):
+    response.headers["X-Request-ID"] = tracing.request_id()
+    route = request.url_rule.rule if request.url_rule is not None else "other"
+    metrics.http_request_seconds.observe(
+        time.perf_counter() - g.started, route, request.method, response.status_code)
+    return response
+
+
 @app.route("/", methods=["GET"])
 def health_check():
     return jsonify(status="App is running"), 200
 
 
+@app.route("/ready", methods=["GET"])
+def ready():
+    result = health.readiness()
+    return jsonify(result), 200 if result["ready"] else 503
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype=metrics.CONTENT_TYPE)
+
+
 @app.route("/run_agent", methods=["POST"])
 def _run_agent():
     data = request.json
     logging.info(f"Received request body: {data}")
     result = agent.run_agent(
-        data["transcript"], data["phone_number"])
+        data["transcript"], data["phone_number"], data.get("call_id"))
     return jsonify(result=result)
 
 
+@app.route("/run_agent/stream", methods=["POST"])
+def _run_agent_stream():
+    data = request.json
+    logging.info(f"Received request body: {data}")
+    lc_agent = agent.get_agent(data["phone_number"], data.get("call_id"))
+    return Response(
+        stream_with_context(stream_response(lc_agent, data["transcript"])),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/call/start", methods=["POST"])
+def start_call():
+    """Warm the caches for a call being answered, see prefetch.py."""
+    data = request.json
+    prefetch.start(data["phone_number"], data.get("call_id"))
+    return jsonify(prefetching=True), 202
+
+
+@app.route("/call/end", methods=["POST"])
+def end_call():
+    data = request.json
+    ended = agent.end_call(data["phone_number"], data.get("call_id"))
+    return jsonify(ended=ended)
+
+
+@app.route("/sessions", methods=["GET"])
+def session_stats():
+    return jsonify(agent_sessions.stats())
+
+
+@app.route("/db/stats", methods=["GET"])
+def db_stats():
+    return jsonify(get_pool().stats())
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(member_info_cache.stats())
+
+
+@app.route("/faq/stats", methods=["GET"])
+def faq_stats():
+    return jsonify(faq_index.stats())
+
+
+@app.route("/trace/stats", methods=["GET"])
+def trace_stats():
+    return jsonify(tracing.stats())
+
+
+@app.route("/cache/responses", methods=["GET"])
+def response_cache_stats():
+    return jsonify(response_cache.stats())
+
+
+@app.route("/cache/responses/flush", methods=["POST"])
+def flush_response_cache():
+    return jsonify(flushed=response_cache.flush())
+
+
+@app.route("/cache/invalidation", methods=["GET"])
+def invalidation_stats():
+    return jsonify(invalidation.stats())
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--start_ngrok', action='store_true',
                         help='Start ngrok tunnel')
+    parser.add_argument('--server', choices=['flask', 'asgi'],
+                        default=os.getenv('SERVER_MODE', 'flask'),
+                        help='Serve with the Flask app or the async ASGI app')
     args = parser.parse_args()
 
     public_url = start_ngrok(args.start_ngrok)
@@ -57,4 +166,13 @@ if __name__ == "__main__":
         exit(1)
 
     logging.info(f"App is running. Public URL: {public_url}")
-    app.run(host="0.0.0.0", port=5001)
+    if agent.WARM_UP:
+        threading.Thread(target=agent.warm_up, daemon=True).start()
+    invalidation.start()
+    if args.server == 'asgi':
+        import uvicorn
+        from asgi_app import app as asgi_app
+
+        uvicorn.run(asgi_app, host="0.0.0.0", port=5001)
+    else:
+        app.run(host="0.0.0.0", port=5001)
@@ -0,0 +1,273 @@
+# asgi_app.py
+"""
+ASGI version of app.py. It serves the same routes, but a turn waiting on the
+LLM or the database does not hold a worker thread, so one process can keep
+hundreds of calls in flight. Started with `python app/app.py --server asgi`.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+import agent
+from async_db import async_pool_stats, close_async_pool, get_async_pool
+from sessions import agent_sessions
+from shared import member_info_cache
+from faq import faq_index
+import health
+import invalidation
+import metrics
+import prefetch
+import tracing
+from response_cache import response_cache
+from streaming import astream_events, astream_response
+
+
+# Startup tasks, referenced until the process ends
+_background = set()
+
+
+class RequestMiddleware:
+    """
+    Takes the request id from X-Request-ID, or makes one, and returns it in
+    the response; times the request for /metrics.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode() or tracing.new_id()
+        tracing.set_request_id(request_id)
+        status = [500]
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            route = scope["path"] if scope["path"] in ROUTE_PATHS else "other"
+            metrics.http_request_seconds.observe(
+                time.perf_counter() - start, route, scope["method"], status[0])
+
+
+async def _warm_up_async_pool():
+    try:
+        await get_async_pool()
+    except Exception as e:
+        logging.error(f"Warm-up of the async pool failed: {e}")
+
+
+async def warm_up():
+    if agent.WARM_UP:
+        # In the background: the server accepts requests meanwhile
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(None, agent.warm_up)
+        _background.add(loop.create_task(_warm_up_async_pool()))
+
+
+async def start_invalidation():
+    invalidation.start()
+
+
+async def stop_invalidation():
+    invalidation.listener.stop()
+
+
+async def health_check(request):
+    return JSONResponse({"status": "App is running"})
+
+
+async def _run_agent(request):
+    data = await request.json()
+    logging.info(f"Received request body: {data}")
+    result = await agent.arun_agent(
+        data["transcript"], data["phone_number"], data.get("call_id"))
+    return JSONResponse({"result": result})
+
+
+async def _run_agent_stream(request):
+    data = await request.json()
+    logging.info(f"Received request body: {data}")
+    lc_agent = agent.get_agent(data["phone_number"], data.get("call_id"))
+    return StreamingResponse(
+        astream_response(lc_agent, data["transcript"]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def call_socket(websocket: WebSocket):
+    """
+    A whole call over one WebSocket; the server keeps the conversation.
+
+    The client sends JSON messages:
+        {"type": "start", "phone_number": ..., "greeting": ...}
+        {"type": "resume", "call_id": ..., "phone_number": ...}
+                                               (after a dropped connection)
+        {"type": "utterance", "text": ...}
+        {"type": "end"}
+    and receives "started" with the call id to resume with, or "resumed", then for every utterance the streaming
+    events of /run_agent/stream ("token", "sentence", "tool_start",
+    "tool_end") followed by "response" with the full answer, or "error".
+    """
+    await websocket.accept()
+    lc_agent = None
+    call_id = phone_number = None
+    try:
+        while True:
+            message = await websocket.receive_json()
+            kind = message.get("type")
+
+            if kind == "start":
+                # Minted here: a call id chosen by the client could be another call's
+                call_id = str(uuid.uuid4())
+                phone_number = message["phone_number"]
+                lc_agent = agent.get_agent(phone_number, call_id)
+                lc_agent.start_call(message.get("greeting", ""))
+                await websocket.send_json({"type": "started", "call_id": call_id})
+
+            elif kind == "resume":
+                # Only the caller can resume a call: sessions are keyed by
+                # phone number and call id, see agent.session_key()
+                session = agent_sessions.get(
+                    agent.session_key(message.get("phone_number"), message["call_id"]))
+                if session is None:
+                    await websocket.send_json(
+                        {"type": "error", "message": f"Unknown call {message['call_id']}"})
+                    continue
+                call_id, lc_agent = message["call_id"], session
+                phone_number = message["phone_number"]
+                # The turns recorded so far, and the last answer, tell the
+                # client whether its last utterance arrived before the drop
+                await websocket.send_json({
+                    "type": "resumed",
+                    "call_id": call_id,
+                    "turns": len(lc_agent.messages),
+                    "last_response": lc_agent.messages[-1].content if lc_agent.messages else None,
+                })
+
+            elif kind == "utterance":
+                if lc_agent is None:
+                    await websocket.send_json(
+                        {"type": "error", "message": "Call not started"})
+                    continue
+                text = message["text"]
+                events = astream_events(
+                    lambda callbacks: lc_agent.arespond(text, callbacks=callbacks))
+                async for event, data in events:
+                    if event == "done":
+                        await websocket.send_json(
+                            {"type": "response", "text": data["result"]})
+                    else:
+                        await websocket.send_json({"type": event, **data})
+
+            elif kind == "end":
+                if lc_agent is not None:
+                    agent.end_call(phone_number, call_id)
+                await websocket.send_json({"type": "ended", "call_id": call_id})
+                await websocket.close()
+                return
+
+            else:
+                await websocket.send_json(
+                    {"type": "error", "message": f"Unknown message type {kind}"})
+    except WebSocketDisconnect:
+        # The session stays in the registry so the client can resume the call.
+        logging.info(f"Call socket disconnected, call_id={call_id}")
+
+
+async def start_call(request):
+    data = await request.json()
+    prefetch.astart(data["phone_number"], data.get("call_id"))
+    return JSONResponse({"prefetching": True}, status_code=202)
+
+
+async def end_call(request):
+    data = await request.json()
+    ended = agent.end_call(data["phone_number"], data.get("call_id"))
+    return JSONResponse({"ended": ended})
+
+
+async def session_stats(request):
+    return JSONResponse(agent_sessions.stats())
+
+
+async def db_stats(request):
+    return JSONResponse(async_pool_stats())
+
+
+async def cache_stats(request):
+    return JSONResponse(member_info_cache.stats())
+
+
+async def faq_stats(request):
+    return JSONResponse(faq_index.stats())
+
+
+async def metrics_endpoint(request):
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+async def ready(request):
+    result = await health.areadiness()
+    return JSONResponse(result, status_code=200 if result["ready"] else 503)
+
+
+async def trace_stats(request):
+    return JSONResponse(tracing.stats())
+
+
+async def response_cache_stats(request):
+    return JSONResponse(response_cache.stats())
+
+
+async def flush_response_cache(request):
+    return JSONResponse({"flushed": response_cache.flush()})
+
+
+async def invalidation_stats(request):
+    return JSONResponse(invalidation.stats())
+
+
+app = Starlette(
+    routes=[
+        Route("/", health_check, methods=["GET"]),
+        Route("/ready", ready, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+        Route("/run_agent", _run_agent, methods=["POST"]),
+        Route("/run_agent/stream", _run_agent_stream, methods=["POST"]),
+        Route("/call/start", start_call, methods=["POST"]),
+        Route("/call/end", end_call, methods=["POST"]),
+        WebSocketRoute("/call", call_socket),
+        Route("/sessions", session_stats, methods=["GET"]),
+        Route("/db/stats", db_stats, methods=["GET"]),
+        Route("/cache/stats", cache_stats, methods=["GET"]),
+        Route("/faq/stats", faq_stats, methods=["GET"]),
+        Route("/cache/responses", response_cache_stats, methods=["GET"]),
+        Route("/cache/responses/flush", flush_response_cache, methods=["POST"]),
+        Route("/cache/invalidation", invalidation_stats, methods=["GET"]),
+        Route("/trace/stats", trace_stats, methods=["GET"]),
+    ],
+    middleware=[Middleware(RequestMiddleware)],
+    on_startup=[warm_up, start_invalidation],
+    on_shutdown=[close_async_pool, stop_invalidation],
+)
+
+ROUTE_PATHS = {route.path for route in app.routes}
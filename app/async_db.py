@@ -0,0 +1,83 @@
+"""
+asyncpg connection pool for the async serving mode.
+
+asyncpg prepares and caches every statement it runs per connection, so the
+tool queries are only parsed and planned once per pooled connection.
+"""
+
+import asyncio
+import os
+import weakref
+from contextlib import asynccontextmanager
+
+import asyncpg
+from dotenv import load_dotenv
+
+import tracing
+
+load_dotenv()
+
+connection_string = os.getenv("DATABASE_URL")
+
+# One pool per event loop, asyncpg connections cannot be shared across loops.
+# Each entry is the task creating the pool, so concurrent first callers share it.
+_pools = weakref.WeakKeyDictionary()
+
+
+async def _init_connection(conn):
+    # Statements of traced requests become spans, see tracing.py
+    conn.add_query_logger(tracing.record_query)
+
+
+async def _create_pool() -> asyncpg.Pool:
+    if connection_string is None:
+        raise ValueError("DATABASE_URL environment variable is not set")
+    return await asyncpg.create_pool(
+        connection_string,
+        min_size=int(os.getenv("DB_POOL_MIN", "1")),
+        max_size=int(os.getenv("DB_POOL_MAX", "10")),
+        max_queries=int(os.getenv("DB_POOL_MAX_USES", "1000")),
+        max_inactive_connection_lifetime=float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+        init=_init_connection,
+    )
+
+
+async def get_async_pool() -> asyncpg.Pool:
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = _pools[loop] = loop.create_task(_create_pool())
+    try:
+        return await pool
+    except Exception:
+        _pools.pop(loop, None)
+        raise
+
+
+@asynccontextmanager
+async def connection():
+    pool = await get_async_pool()
+    async with pool.acquire(timeout=float(os.getenv("DB_POOL_TIMEOUT", "5"))) as conn:
+        yield conn
+
+
+async def close_async_pool():
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await (await pool).close()
+
+
+def async_pool_stats():
+    pools = [
+        task.result() for task in list(_pools.values())
+        if task.done() and not task.exception()
+    ]
+    size = sum(pool.get_size() for pool in pools)
+    idle = sum(pool.get_idle_size() for pool in pools)
+    return {
+        "size": size,
+        "idle": idle,
+        "in_use": size - idle,
+        "min_size": int(os.getenv("DB_POOL_MIN", "1")),
+        "max_size": int(os.getenv("DB_POOL_MAX", "10")),
+    }
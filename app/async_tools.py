@@ -0,0 +1,302 @@
+"""
+Async implementations of the tools in tools.py, running on asyncpg.
+
+Each tool in TOOLS keeps the synchronous implementation from tools.py and
+adds the coroutine below, so the same tool list serves both the Flask app
+(invoke) and the ASGI app (ainvoke).
+"""
+
+import asyncio
+from datetime import date, datetime, time
+
+import asyncpg
+
+from langchain_core.tools import StructuredTool
+
+import tools as t
+import tool_agents
+from async_db import connection
+from queries import (
+    numbered_params,
+    MEMBER_PROFILE_QUERY,
+    PROVIDER_QUERY,
+    NEARBY_AVAILABILITY_QUERY,
+    MEMBER_ADDRESS_QUERY,
+    OPEN_SLOT_QUERY,
+    OPEN_SLOT_EXISTS_QUERY,
+    CLAIM_SLOT_QUERY,
+    INSERT_APPOINTMENT_QUERY,
+    ACTIVE_APPOINTMENT_QUERY,
+    CANCEL_APPOINTMENT_QUERY,
+    RELEASE_SLOT_QUERY,
+    RELEASE_AVAILABILITY_QUERY,
+    INSERT_ESCALATION_QUERY,
+    member_update_query,
+)
+from shared import member_info_cache, provider_cache, availability_cache
+from cache import NOT_FOUND
+
+
+async def aget_member_information(phone_number: str) -> str:
+    member_information = member_info_cache.get(phone_number)
+    if member_information == NOT_FOUND:
+        return t.member_not_found(phone_number)
+    if member_information is not None:
+        return member_information
+
+    async with connection() as conn:
+        member = await conn.fetchrow(numbered_params(MEMBER_PROFILE_QUERY), phone_number)
+    if member is None:
+        member_info_cache.set_not_found(phone_number)
+        return t.member_not_found(phone_number)
+
+    appointments = t.profile_appointments(member["appointments"])
+    member_info = t.render_member_information(member, appointments)
+    member_info_cache.set(phone_number, member_info, member["id"],
+                          t.appointment_provider_ids(appointments))
+    return member_info
+
+
+async def aget_provider_information(provider_id: str):
+    key = str(provider_id)
+    provider_information = provider_cache.get(key)
+    if provider_information is not None:
+        return provider_information
+
+    try:
+        provider_id = int(provider_id)
+    except ValueError:
+        return {"error": "Provider not found"}
+
+    async with connection() as conn:
+        result = await conn.fetchrow(numbered_params(PROVIDER_QUERY), provider_id)
+
+    if not result:
+        return {"error": "Provider not found"}
+
+    provider_information = t.render_provider_information(result)
+    provider_cache.set(key, provider_information)
+    return provider_information
+
+
+async def afetch_availability(conn, zip_prefix) -> str:
+    start, end = t.availability_window()
+    rows = await conn.fetch(
+        numbered_params(NEARBY_AVAILABILITY_QUERY),
+        f"{zip_prefix}%", start, end, t.AVAILABILITY_LIMIT,
+    )
+    availability = t.render_availability(rows, zip_prefix)
+    availability_cache.set(zip_prefix, availability)
+    return availability
+
+
+async def aget_availability(member_phone: str) -> str:
+    member_information = await aget_member_information(member_phone)
+    zip_prefix = t.member_zip_prefix(member_information)
+    if zip_prefix is None:
+        return "Error: Member not found with the given phone number."
+    availability = availability_cache.get(zip_prefix)
+    if availability is not None:
+        return availability
+
+    async with connection() as conn:
+        return await afetch_availability(conn, zip_prefix)
+
+
+async def aschedule_appointment(
+    member_phone: str, appointment_date: str, appointment_time: str
+) -> str:
+    try:
+        day = date.fromisoformat(appointment_date)
+        start = time.fromisoformat(appointment_time)
+    except ValueError as e:
+        return f"Error scheduling appointment: {str(e)}"
+
+    try:
+        async with connection() as conn:
+            member_result = await conn.fetchrow(
+                numbered_params(MEMBER_ADDRESS_QUERY), member_phone
+            )
+            if not member_result:
+                return "Error: Member not found with the given phone number."
+
+            member_id, street_address, city, state, zip_code = member_result
+
+            taken = []
+            for attempt in range(t.BOOKING_MAX_ATTEMPTS):
+                try:
+                    async with conn.transaction():
+                        slot = await conn.fetchrow(
+                            numbered_params(OPEN_SLOT_QUERY), day, start, start, taken
+                        )
+                        if slot is not None:
+                            slot_id, provider_id = slot
+                            await conn.execute(numbered_params(CLAIM_SLOT_QUERY), slot_id)
+                            appointment_id = await conn.fetchval(
+                                numbered_params(INSERT_APPOINTMENT_QUERY),
+                                member_id,
+                                provider_id,
+                                member_phone,
+                                day,
+                                start,
+                                street_address,
+                                city,
+                                state,
+                                zip_code,
+                                slot_id,
+                            )
+                            return f"Appointment scheduled successfully. Appointment ID: {appointment_id}"
+                except asyncpg.UniqueViolationError:
+                    # A scheduled appointment already holds this slot
+                    taken.append(slot_id)
+                    continue
+
+                still_open = await conn.fetchval(
+                    numbered_params(OPEN_SLOT_EXISTS_QUERY), day, start, start
+                )
+                if not still_open:
+                    return t.SLOT_FULLY_BOOKED
+                await asyncio.sleep(t.booking_retry_delay(attempt))
+
+        return t.SLOT_BUSY
+
+    except Exception as e:
+        return f"Error scheduling appointment: {str(e)}"
+
+    finally:
+        member_info_cache.invalidate_phone(member_phone)
+
+
+class _Rollback(Exception):
+    """Raised inside a transaction block to roll it back with a message."""
+
+
+async def acancel_appointment(appointment_id: int, phone_number: str) -> str:
+    try:
+        async with connection() as conn:
+            async with conn.transaction():
+                appointment = await conn.fetchrow(
+                    numbered_params(ACTIVE_APPOINTMENT_QUERY), int(appointment_id)
+                )
+                if not appointment:
+                    return f"Error: Appointment with ID {appointment_id} not found or already cancelled."
+
+                provider_id, appointment_date, appointment_time, slot_id = appointment
+
+                status = await conn.execute(
+                    numbered_params(CANCEL_APPOINTMENT_QUERY), int(appointment_id)
+                )
+                if status.endswith(" 0"):
+                    raise _Rollback(
+                        f"Error: Failed to cancel appointment with ID {appointment_id}."
+                    )
+
+                if slot_id is not None:
+                    status = await conn.execute(numbered_params(RELEASE_SLOT_QUERY), slot_id)
+                else:
+                    status = await conn.execute(
+                        numbered_params(RELEASE_AVAILABILITY_QUERY),
+                        provider_id,
+                        appointment_date,
+                        appointment_time,
+                        appointment_time,
+                    )
+                if status.endswith(" 0"):
+                    raise _Rollback(
+                        "Warning: Appointment cancelled, but failed to update provider availability."
+                    )
+        return f"Appointment with ID {appointment_id} has been successfully cancelled."
+
+    except _Rollback as e:
+        return str(e)
+    except Exception as e:
+        return f"Error cancelling appointment: {str(e)}"
+
+    finally:
+        member_info_cache.invalidate_phone(phone_number)
+
+
+async def aescalate_call(phone_number, description):
+    try:
+        async with connection() as conn:
+            await conn.execute(
+                numbered_params(INSERT_ESCALATION_QUERY),
+                phone_number,
+                "escalated",
+                description,
+                datetime.now(),
+            )
+        return "Call escalated and supervisor will call back shortly."
+
+    except Exception as e:
+        return f"Error escalating call: {str(e)}"
+
+
+async def aupdate_member_information(
+    phone_number: str,
+    email=None,
+    street_address=None,
+    city=None,
+    state=None,
+    zip_code=None,
+    new_phone_number=None,
+    gender=None,
+) -> str:
+    changes, errors = t.validate_member_update(
+        email=email,
+        street_address=street_address,
+        city=city,
+        state=state,
+        zip_code=zip_code,
+        phone_number=new_phone_number,
+        gender=gender,
+    )
+    if errors:
+        return "Error: " + "; ".join(errors)
+    if not changes:
+        return "Error: No changes were given."
+
+    try:
+        async with connection() as conn:
+            member_id = await conn.fetchval(
+                numbered_params(member_update_query(list(changes))),
+                *changes.values(),
+                phone_number,
+            )
+        if member_id is None:
+            return "Error: Member not found with the given phone number."
+        return f"Member information updated: {t.describe_member_update(changes)}."
+
+    except asyncpg.UniqueViolationError:
+        return "Error: That email address or phone number is already used by another member."
+
+    except Exception as e:
+        return f"Error updating member information: {str(e)}"
+
+    finally:
+        member_info_cache.invalidate_phone(phone_number)
+        if "phone_number" in changes:
+            member_info_cache.invalidate_phone(changes["phone_number"])
+
+
+def _with_coroutine(sync_tool, coroutine):
+    return StructuredTool.from_function(
+        func=sync_tool.func,
+        coroutine=coroutine,
+        name=sync_tool.name,
+        description=sync_tool.description,
+        args_schema=sync_tool.args_schema,
+    )
+
+
+# update_databse drives the synchronous SQL agent; LangChain runs it in a
+# worker thread when the agent is invoked asynchronously.
+TOOLS = [
+    _with_coroutine(t.update_member_information, aupdate_member_information),
+    tool_agents.update_databse,
+    _with_coroutine(t.cancel_appointment, acancel_appointment),
+    _with_coroutine(t.get_provider_information, aget_provider_information),
+    _with_coroutine(t.get_availability, aget_availability),
+    _with_coroutine(t.schedule_appointment, aschedule_appointment),
+    _with_coroutine(t.escalate_call, aescalate_call),
+]
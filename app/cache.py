@@ -0,0 +1,164 @@
+"""
+Thread-safe, size-bounded LRU caches with per-entry expiry.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Cached result for a phone number that does not belong to any member.
+NOT_FOUND = "__not_found__"
+
+
+class TTLCache:
+    def __init__(self, maxsize=1000, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at)
+            self._added(key, value)
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop key, returning its value if it was cached."""
+        with self._lock:
+            if key not in self._data:
+                return None
+            self.invalidations += 1
+            return self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._data):
+                self._remove(key)
+
+    def _remove(self, key):
+        value, _ = self._data.pop(key)
+        self._removed(key, value)
+        return value
+
+    def _added(self, key, value):
+        """Hook for subclasses maintaining secondary indexes; called with the lock held."""
+
+    def _removed(self, key, value):
+        """Hook for subclasses maintaining secondary indexes; called with the lock held."""
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class MemberInfoCache(TTLCache):
+    """
+    Rendered member information keyed by phone number. Also indexed by
+    member id so writes that only know the member id can invalidate it, and
+    by the ids of the providers it mentions so a provider change drops only
+    the members who have an appointment with that provider.
+    Phone numbers with no member are cached as NOT_FOUND for negative_ttl.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300.0, negative_ttl=60.0):
+        super().__init__(maxsize, ttl)
+        self.negative_ttl = negative_ttl
+        self._phones_by_member = {}
+        self._phones_by_provider = {}
+
+    def set(self, phone_number, info, member_id=None, provider_ids=()):
+        super().set(phone_number, (info, member_id, frozenset(provider_ids)))
+
+    def set_not_found(self, phone_number):
+        super().set(phone_number, (NOT_FOUND, None, frozenset()), ttl=self.negative_ttl)
+
+    def get(self, phone_number, default=None):
+        entry = super().get(phone_number)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def invalidate_phone(self, phone_number):
+        """Drop the entry for phone_number and any other phone of the same member."""
+        with self._lock:
+            entry = self.invalidate(phone_number)
+            if entry is not None and entry[1] is not None:
+                self.invalidate_member_id(entry[1])
+
+    def invalidate_member_id(self, member_id):
+        with self._lock:
+            for phone_number in list(self._phones_by_member.get(member_id, ())):
+                self.invalidate(phone_number)
+
+    def invalidate_provider_id(self, provider_id):
+        """Drop the entries of the members with an appointment with provider_id."""
+        with self._lock:
+            for phone_number in list(self._phones_by_provider.get(provider_id, ())):
+                self.invalidate(phone_number)
+
+    def _added(self, phone_number, entry):
+        _, member_id, provider_ids = entry
+        if member_id is not None:
+            self._phones_by_member.setdefault(member_id, set()).add(phone_number)
+        for provider_id in provider_ids:
+            self._phones_by_provider.setdefault(provider_id, set()).add(phone_number)
+
+    def _removed(self, phone_number, entry):
+        _, member_id, provider_ids = entry
+        _unindex(self._phones_by_member, member_id, phone_number)
+        for provider_id in provider_ids:
+            _unindex(self._phones_by_provider, provider_id, phone_number)
+
+    def stats(self):
+        stats = super().stats()
+        stats["negative_ttl"] = self.negative_ttl
+        return stats
+
+
+def _unindex(index, key, phone_number):
+    phones = index.get(key)
+    if phones is not None:
+        phones.discard(phone_number)
+        if not phones:
+            del index[key]
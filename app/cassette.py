@@ -0,0 +1,294 @@
+"""
+Record and replay of the LLM HTTP calls.
+
+With LLM_CASSETTE_MODE=record every chat completion request made by the
+agents goes to the API as usual and the request, the response (tool calls
+included) and its duration are appended to the cassette, a gzipped JSON
+lines file at LLM_CASSETTE_PATH. With LLM_CASSETTE_MODE=replay the responses
+are served from the cassette without touching the network, so a benchmark
+measures only the agent pipeline and gives the same answers on every run.
+
+Requests are matched on a hash of their JSON body, after masking the values
+that change from run to run (timestamps, tool call ids, and any pattern in
+LLM_CASSETTE_IGNORE, a comma separated list of regular expressions).
+
+LLM_CASSETTE_LATENCY sets the delay of replayed responses: "none" (the
+default), "recorded" to take as long as the recorded call, or a number of
+seconds. Streamed responses are paced event by event over that delay.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODES = ("off", "record", "replay")
+
+# Values that differ between otherwise identical requests
+VOLATILE_PATTERNS = [
+    r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?",
+    # The current time in the agent prompt, e.g. "Sunday, October 18, 03:12PM"
+    r"[A-Z][a-z]+day, [A-Z][a-z]+ \d{2}, \d{2}:\d{2}[AP]M",
+    r"\bcall_[A-Za-z0-9]+",
+]
+
+
+class CassetteMiss(Exception):
+    """A replayed request has no recorded response."""
+
+
+def _normalize(value, patterns):
+    if isinstance(value, str):
+        for pattern in patterns:
+            value = pattern.sub("<volatile>", value)
+        return value
+    if isinstance(value, list):
+        return [_normalize(item, patterns) for item in value]
+    if isinstance(value, dict):
+        return {key: _normalize(item, patterns) for key, item in value.items()}
+    return value
+
+
+class Cassette:
+    def __init__(self, path, mode="replay", latency="none", ignore=()):
+        if mode not in MODES:
+            raise ValueError(f"LLM cassette mode must be one of {', '.join(MODES)}, got {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.patterns = [re.compile(p) for p in list(VOLATILE_PATTERNS) + list(ignore)]
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._served = {}
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        if mode == "replay":
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"LLM cassette {self.path} does not exist, record it first")
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], []).append(entry)
+
+    def key(self, request: httpx.Request) -> str:
+        body = request.content
+        try:
+            payload = _normalize(json.loads(body), self.patterns)
+            body = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+        except ValueError:
+            pass
+        digest = hashlib.sha256()
+        digest.update(request.method.encode())
+        digest.update(request.url.path.encode())
+        digest.update(body)
+        return digest.hexdigest()
+
+    def record(self, request, response, body: bytes, elapsed: float):
+        entry = {
+            "key": self.key(request),
+            "method": request.method,
+            "path": request.url.path,
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type", "application/json"),
+            "body": body.decode("utf-8"),
+            "elapsed": round(elapsed, 4),
+        }
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Each append adds a gzip member; gzip.open reads them back as one stream
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line)
+            self._entries.setdefault(entry["key"], []).append(entry)
+            self.recorded += 1
+
+    def lookup(self, request):
+        """The recorded entry for request. Repeated requests get the recorded responses in order."""
+        key = self.key(request)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                raise CassetteMiss(
+                    f"No recorded response for {request.method} {request.url.path} "
+                    f"(key {key[:12]}) in {self.path}"
+                )
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            self.replayed += 1
+            return entries[min(served, len(entries) - 1)]
+
+    def delay(self, entry) -> float:
+        if self.latency == "recorded":
+            return entry["elapsed"]
+        if self.latency in ("none", "", None):
+            return 0.0
+        return float(self.latency)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "path": self.path,
+                "entries": sum(len(entries) for entries in self._entries.values()),
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "misses": self.misses,
+            }
+
+
+def _events(body: str):
+    """Split a server-sent events body into its events, each with its terminator."""
+    return [event + "\n\n" for event in body.split("\n\n") if event.strip()]
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, chunks, delay):
+        self.chunks = chunks
+        self.delay = delay
+
+    def __iter__(self):
+        pause = self.delay / len(self.chunks) if self.chunks else 0
+        for chunk in self.chunks:
+            if pause:
+                time.sleep(pause)
+            yield chunk.encode("utf-8")
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks, delay):
+        self.chunks = chunks
+        self.delay = delay
+
+    async def __aiter__(self):
+        pause = self.delay / len(self.chunks) if self.chunks else 0
+        for chunk in self.chunks:
+            if pause:
+                await asyncio.sleep(pause)
+            yield chunk.encode("utf-8")
+
+
+def _replayed(entry, stream, request):
+    return httpx.Response(
+        entry["status"],
+        headers={"content-type": entry["content_type"]},
+        stream=stream,
+        request=request,
+    )
+
+
+def _chunks(entry):
+    if entry["content_type"].startswith("text/event-stream"):
+        return _events(entry["body"])
+    return [entry["body"]]
+
+
+class CassetteTransport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self._transport = httpx.HTTPTransport() if cassette.mode == "record" else None
+
+    def handle_request(self, request):
+        if self.cassette.mode == "replay":
+            entry = self.cassette.lookup(request)
+            stream = _ReplayStream(_chunks(entry), self.cassette.delay(entry))
+            return _replayed(entry, stream, request)
+
+        start = time.monotonic()
+        response = self._transport.handle_request(request)
+        body = response.read()
+        response.close()
+        self.cassette.record(request, response, body, time.monotonic() - start)
+        return httpx.Response(
+            response.status_code,
+            headers={"content-type": response.headers.get("content-type", "application/json")},
+            content=body,
+            request=request,
+        )
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self._transport = httpx.AsyncHTTPTransport() if cassette.mode == "record" else None
+
+    async def handle_async_request(self, request):
+        if self.cassette.mode == "replay":
+            entry = self.cassette.lookup(request)
+            stream = _AsyncReplayStream(_chunks(entry), self.cassette.delay(entry))
+            return _replayed(entry, stream, request)
+
+        start = time.monotonic()
+        response = await self._transport.handle_async_request(request)
+        body = await response.aread()
+        await response.aclose()
+        self.cassette.record(request, response, body, time.monotonic() - start)
+        return httpx.Response(
+            response.status_code,
+            headers={"content-type": response.headers.get("content-type", "application/json")},
+            content=body,
+            request=request,
+        )
+
+    async def aclose(self):
+        if self._transport is not None:
+            await self._transport.aclose()
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """The cassette configured by LLM_CASSETTE_*, or None when the mode is off."""
+    global _cassette
+    mode = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+    if mode == "off":
+        return None
+    if _cassette is None:
+        with _cassette_lock:
+            if _cassette is None:
+                ignore = [p for p in os.getenv("LLM_CASSETTE_IGNORE", "").split(",") if p]
+                _cassette = Cassette(
+                    os.getenv("LLM_CASSETTE_PATH", "cassettes/llm.jsonl.gz"),
+                    mode=mode,
+                    latency=os.getenv("LLM_CASSETTE_LATENCY", "none").lower(),
+                    ignore=ignore,
+                )
+    return _cassette
+
+
+def http_client():
+    """httpx client for ChatOpenAI(http_client=...), None to use the default one."""
+    cassette = get_cassette()
+    if cassette is None:
+        return None
+    return httpx.Client(transport=CassetteTransport(cassette), timeout=None)
+
+
+def http_async_client():
+    """httpx client for ChatOpenAI(http_async_client=...), None to use the default one."""
+    cassette = get_cassette()
+    if cassette is None:
+        return None
+    return httpx.AsyncClient(transport=AsyncCassetteTransport(cassette), timeout=None)
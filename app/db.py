@@ -0,0 +1,314 @@
+"""
+Process-wide PostgreSQL connection pool.
+
+All tools, and the SQLAlchemy engine used by the SQL agent, borrow their
+connections from the same pool so the process never holds more than
+DB_POOL_MAX connections. Calling close() on a pooled connection returns it
+to the pool instead of closing it.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+import tracing
+from queries import numbered_params
+
+load_dotenv()
+
+connection_string = os.getenv("DATABASE_URL")
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """A psycopg2 connection whose close() gives it back to its pool."""
+
+    def close(self):
+        pool = getattr(self, "pool", None)
+        if pool is None:
+            super().close()
+        else:
+            # Even a broken connection goes back: release() discards it and
+            # frees its slot
+            pool.release(self)
+
+    def really_close(self):
+        psycopg2.extensions.connection.close(self)
+
+
+class TracedCursor(psycopg2.extensions.cursor):
+    """A cursor recording each statement as a span of the traced request, see tracing.py."""
+
+    def execute(self, query, vars=None):
+        if not tracing.sampled():
+            return super().execute(query, vars)
+        with tracing.span("sql", statement=tracing.statement(query)) as span:
+            result = super().execute(query, vars)
+            span.set(rows=self.rowcount)
+        return result
+
+    def executemany(self, query, vars_list):
+        if not tracing.sampled():
+            return super().executemany(query, vars_list)
+        with tracing.span("sql", statement=tracing.statement(query)) as span:
+            result = super().executemany(query, vars_list)
+            span.set(rows=self.rowcount)
+        return result
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        dsn,
+        min_size=1,
+        max_size=10,
+        timeout=5.0,
+        max_uses=1000,
+        health_check_after=30.0,
+    ):
+        """
+        Args:
+            dsn: the connection string.
+            min_size: connections opened up front and kept open.
+            max_size: upper bound on open connections.
+            timeout: seconds to wait for a free connection before raising PoolTimeout.
+            max_uses: a connection is closed and replaced after this many checkouts.
+            health_check_after: connections idle for longer than this many
+                seconds are pinged before being handed out.
+        """
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_uses = max_uses
+        self.health_check_after = health_check_after
+
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+        self.created = 0
+        self.closed = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.failed_health_checks = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+        for _ in range(min_size):
+            with self._cond:
+                self._size += 1
+            self._idle.append(self._open())
+
+    def _open(self):
+        try:
+            conn = psycopg2.connect(
+                self.dsn, connection_factory=PooledConnection, cursor_factory=TracedCursor
+            )
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        conn.pool = self
+        conn.prepared = set()
+        conn.uses = 0
+        # Set while the connection is not checked out, so closing twice releases once
+        conn.released = True
+        conn.released_at = time.monotonic()
+        with self._cond:
+            self.created += 1
+        return conn
+
+    def _discard(self, conn):
+        # Closing it again must not count it out of the pool twice
+        conn.pool = None
+        try:
+            conn.really_close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self.closed += 1
+            self._cond.notify()
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        status = conn.get_transaction_status()
+        if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - conn.released_at < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def acquire(self):
+        """Check a connection out of the pool, opening one if there is room."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {self.timeout}s"
+                        )
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if conn is None:
+                conn = self._open()
+            elif not self._healthy(conn):
+                with self._cond:
+                    self.failed_health_checks += 1
+                self._discard(conn)
+                continue
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self._in_use += 1
+                self.checkouts += 1
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+            conn.uses += 1
+            conn.released = False
+            return conn
+
+    def release(self, conn):
+        with self._cond:
+            if conn.released:
+                # Already back in the pool, or discarded
+                return
+            conn.released = True
+            self._in_use -= 1
+        if conn.closed:
+            self._discard(conn)
+            return
+        try:
+            if (
+                conn.get_transaction_status()
+                != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+            ):
+                conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+        if conn.uses >= self.max_uses:
+            self._discard(conn)
+            return
+        conn.released_at = time.monotonic()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def close_all(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "created": self.created,
+                "closed": self.closed,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "failed_health_checks": self.failed_health_checks,
+                "wait_time_total": self.wait_time_total,
+                "wait_time_avg": (
+                    self.wait_time_total / self.checkouts if self.checkouts else 0.0
+                ),
+                "wait_time_max": self.wait_time_max,
+            }
+
+
+def execute_prepared(cur, name, query, params):
+    """
+    Execute query as the server-side prepared statement `name`, preparing it
+    the first time it is used on the cursor's connection. Prepared statements
+    live as long as the connection, so pooled connections reuse their plans.
+    """
+    conn = cur.connection
+    prepared = getattr(conn, "prepared", None)
+    if prepared is None:
+        prepared = conn.prepared = set()
+    if name not in prepared:
+        cur.execute(f"PREPARE {name} AS {numbered_params(query)}")
+        prepared.add(name)
+    placeholders = ", ".join(["%s"] * len(params))
+    cur.execute(f"EXECUTE {name} ({placeholders})", params)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if connection_string is None:
+                    raise ValueError("DATABASE_URL environment variable is not set")
+                _pool = ConnectionPool(
+                    connection_string,
+                    min_size=int(os.getenv("DB_POOL_MIN", "1")),
+                    max_size=int(os.getenv("DB_POOL_MAX", "10")),
+                    timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+                    max_uses=int(os.getenv("DB_POOL_MAX_USES", "1000")),
+                    health_check_after=float(
+                        os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30")
+                    ),
+                )
+    return _pool
+
+
+def get_engine():
+    """
+    SQLAlchemy engine whose connections come from the shared pool.
+    SQLAlchemy's own pooling is disabled so it does not keep connections
+    of its own; closing its connections hands them back to our pool.
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+
+    return create_engine(
+        "postgresql+psycopg2://", creator=get_pool().acquire, poolclass=NullPool
+    )
@@ -0,0 +1,155 @@
+"""
+Frequently asked questions, retrieved per turn instead of sent in full.
+
+The entries live in data/faq.json (or FAQ_PATH) and are indexed with BM25,
+in process. Each turn the agent gets the FAQ_TOP_K entries closest to the
+member's utterance. When an utterance is clearly one of the FAQ questions
+the stored answer is returned as is, without calling the LLM.
+
+A direct answer needs all of:
+  - a BM25 score of at least FAQ_DIRECT_MIN_SCORE times the score the
+    entry's own question gets, so the match is as good as asking it,
+  - the runner-up scoring at most FAQ_DIRECT_MAX_RUNNER_UP times the best
+    entry, so the question is not ambiguous,
+  - at least FAQ_DIRECT_MIN_COVERAGE of the utterance's terms appearing in
+    the entry's question, so the member is not also asking something else.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+FAQ_PATH = os.getenv("FAQ_PATH", os.path.join(os.path.dirname(__file__), "data", "faq.json"))
+FAQ_TOP_K = int(os.getenv("FAQ_TOP_K", "3"))
+FAQ_DIRECT_ANSWERS = os.getenv("FAQ_DIRECT_ANSWERS", "true").lower() == "true"
+FAQ_DIRECT_MIN_SCORE = float(os.getenv("FAQ_DIRECT_MIN_SCORE", "0.6"))
+FAQ_DIRECT_MAX_RUNNER_UP = float(os.getenv("FAQ_DIRECT_MAX_RUNNER_UP", "0.6"))
+FAQ_DIRECT_MIN_COVERAGE = float(os.getenv("FAQ_DIRECT_MIN_COVERAGE", "0.75"))
+
+STOPWORDS = {
+    "a", "about", "an", "and", "any", "are", "as", "at", "be", "by", "can", "could",
+    "do", "does", "for", "from", "get", "have", "hi", "hello", "how", "i", "if", "in",
+    "is", "it", "me", "my", "of", "on", "or", "please", "so", "that", "the", "there",
+    "this", "to", "was", "what", "when", "where", "which", "who", "will", "with",
+    "would", "you", "your", "yes", "ok", "okay", "thanks", "thank", "also", "just",
+    "need", "want", "know", "tell", "like", "its",
+}
+
+
+def _stem(word):
+    for suffix, replacement in (("ies", "y"), ("ing", ""), ("ed", ""), ("es", ""), ("s", "")):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: len(word) - len(suffix)] + replacement
+    return word
+
+
+def tokenize(text):
+    return [_stem(word) for word in re.findall(r"[a-z0-9]+", text.lower())
+            if word not in STOPWORDS]
+
+
+class FAQIndex:
+    """BM25 over the FAQ entries; questions count twice as much as answers."""
+
+    def __init__(self, entries, k1=1.5, b=0.75):
+        self.entries = entries
+        self.k1 = k1
+        self.b = b
+        self.question_terms = [set(tokenize(e["question"])) for e in entries]
+        self.docs = [
+            Counter(tokenize(e["question"]) * 2 + tokenize(e["answer"])) for e in entries
+        ]
+        self.lengths = [sum(doc.values()) for doc in self.docs]
+        self.avg_length = sum(self.lengths) / len(self.lengths) if entries else 0.0
+        self.postings = {}
+        for i, doc in enumerate(self.docs):
+            for term in doc:
+                self.postings.setdefault(term, []).append(i)
+        df = {term: len(ids) for term, ids in self.postings.items()}
+        n = len(entries)
+        self.idf = {
+            term: math.log(1 + (n - count + 0.5) / (count + 0.5)) for term, count in df.items()
+        }
+        self.self_scores = [
+            self._score(list(self.question_terms[i]), i) for i in range(len(entries))
+        ]
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.direct_answers = 0
+
+    def _score(self, terms, i):
+        doc = self.docs[i]
+        norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / self.avg_length)
+        score = 0.0
+        for term in terms:
+            tf = doc.get(term)
+            if tf:
+                score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+        return score
+
+    def _ranked(self, terms):
+        """(score, index) of the entries sharing a term with terms, best first."""
+        candidates = {i for term in terms for i in self.postings.get(term, ())}
+        return sorted(((self._score(terms, i), i) for i in candidates), reverse=True)
+
+    def search(self, query, k=FAQ_TOP_K):
+        """The k entries most relevant to query, best first; none if nothing matches."""
+        with self._lock:
+            self.searches += 1
+        terms = list(set(tokenize(query)))
+        return [self.entries[i] for _, i in self._ranked(terms)[:k]]
+
+    def matches(self, query, min_score):
+        """Whether the best entry for query scores at least min_score times its own question."""
+        ranked = self._ranked(list(set(tokenize(query))))
+        if not ranked:
+            return False
+        best, i = ranked[0]
+        return best >= min_score * self.self_scores[i]
+
+    def direct_answer(self, query):
+        """The entry query unambiguously asks, or None. See the module docstring."""
+        terms = list(set(tokenize(query)))
+        if not terms:
+            return None
+        ranked = self._ranked(terms)
+        if not ranked:
+            return None
+        best, i = ranked[0]
+        runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+        coverage = len(self.question_terms[i].intersection(terms)) / len(terms)
+        if (
+            best >= FAQ_DIRECT_MIN_SCORE * self.self_scores[i]
+            and runner_up <= FAQ_DIRECT_MAX_RUNNER_UP * best
+            and coverage >= FAQ_DIRECT_MIN_COVERAGE
+        ):
+            with self._lock:
+                self.direct_answers += 1
+            return self.entries[i]
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self.entries),
+                "searches": self.searches,
+                "direct_answers": self.direct_answers,
+            }
+
+
+def render(entries):
+    """FAQ entries in the format the agent prompt uses."""
+    if not entries:
+        return "No frequently asked question matches the member's last message."
+    return "\n".join(f"- {e['question']} {e['answer']}" for e in entries)
+
+
+def load(path=FAQ_PATH):
+    with open(path, encoding="utf-8") as f:
+        return FAQIndex(json.load(f))
+
+
+faq_index = load()
@@ -0,0 +1,120 @@
+"""
+Readiness checks for /ready: can this process reach Postgres and the LLM?
+
+The LLM check only opens an HTTP request to the API's base URL: any response,
+even an authentication error, means it is reachable, and it costs no tokens.
+With an LLM cassette replaying, there is nothing to reach.
+
+Results are kept for READY_CACHE_SECONDS so frequent probes do not add load.
+"""
+
+import os
+import threading
+import time
+
+import httpx
+
+import async_db
+import cassette
+from db import get_pool
+
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "2"))
+READY_CACHE_SECONDS = float(os.getenv("READY_CACHE_SECONDS", "5"))
+
+_lock = threading.Lock()
+_last = {"checked_at": 0.0, "result": None}
+
+
+def _llm_url():
+    return os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/") + "/models"
+
+
+def _llm_replayed():
+    c = cassette.get_cassette()
+    return c is not None and c.mode == "replay"
+
+
+def _ok(start):
+    return {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+
+def _failed(e):
+    return {"ok": False, "error": f"{type(e).__name__}: {e}"[:200]}
+
+
+def check_database():
+    start = time.perf_counter()
+    try:
+        conn = get_pool().acquire()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+        finally:
+            conn.close()
+        return _ok(start)
+    except Exception as e:
+        return _failed(e)
+
+
+def check_llm():
+    if _llm_replayed():
+        return {"ok": True, "replayed": True}
+    start = time.perf_counter()
+    try:
+        httpx.get(_llm_url(), timeout=READY_TIMEOUT)
+        return _ok(start)
+    except Exception as e:
+        return _failed(e)
+
+
+async def acheck_database():
+    start = time.perf_counter()
+    try:
+        async with async_db.connection() as conn:
+            await conn.fetchval("SELECT 1", timeout=READY_TIMEOUT)
+        return _ok(start)
+    except Exception as e:
+        return _failed(e)
+
+
+async def acheck_llm():
+    if _llm_replayed():
+        return {"ok": True, "replayed": True}
+    start = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(timeout=READY_TIMEOUT) as client:
+            await client.get(_llm_url())
+        return _ok(start)
+    except Exception as e:
+        return _failed(e)
+
+
+def _result(checks):
+    return {"ready": all(check["ok"] for check in checks.values()), "checks": checks}
+
+
+def _cached():
+    with _lock:
+        if time.monotonic() - _last["checked_at"] < READY_CACHE_SECONDS:
+            return _last["result"]
+    return None
+
+
+def _store(result):
+    with _lock:
+        _last["checked_at"] = time.monotonic()
+        _last["result"] = result
+    return result
+
+
+def readiness():
+    """{"ready": bool, "checks": {...}} for the sync server."""
+    return _cached() or _store(_result({"database": check_database(), "llm": check_llm()}))
+
+
+async def areadiness():
+    cached = _cached()
+    if cached is not None:
+        return cached
+    return _store(_result({"database": await acheck_database(), "llm": await acheck_llm()}))
@@ -0,0 +1,175 @@
+"""
+Bounded conversation history for long calls.
+
+The agent sees the last turns of a call verbatim, as long as they fit in
+HISTORY_TOKEN_BUDGET tokens and HISTORY_MAX_TURNS turns. Older turns are
+folded into a running summary, which is kept with the call's agent and only
+extended with the newly folded turns, HISTORY_FOLD_TURNS turns at a time, so
+the summary is not regenerated on every turn and the prompt prefix stays the
+same between folds.
+
+Lines that verify the member's identity or record an action on their
+appointments or information are never lost to summarization: they are kept
+word for word next to the summary.
+"""
+
+import logging
+import os
+import re
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import metrics
+
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "6"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_FOLD_TURNS = int(os.getenv("HISTORY_FOLD_TURNS", "4"))
+HISTORY_MAX_PINNED = int(os.getenv("HISTORY_MAX_PINNED", "8"))
+
+SUMMARY_INSTRUCTIONS = """\
+You summarize the earlier part of a phone call between a call center agent and a member.
+Update the existing summary with the new lines of the conversation. Keep it under 120 words.
+Always keep: whether the member's name was verified and the name they gave, every
+appointment that was scheduled, cancelled or rescheduled (with ids, dates and times),
+changes to the member's information, escalations, and open questions or requests.
+Leave out greetings and small talk. Reply with the updated summary only.
+"""
+
+# Member lines that state who is calling
+IDENTITY_PATTERN = re.compile(
+    r"\b(this is|my name is|my name's|i am|i'm|speaking)\b", re.IGNORECASE
+)
+# Agent lines that confirm an action
+ACTION_PATTERN = re.compile(
+    r"\b(appointment id|scheduled|cancell?ed|rescheduled|escalat\w*|updated|"
+    r"verified|confirm\w*)\b",
+    re.IGNORECASE,
+)
+
+_SUMMARY_CONFIG = {"callbacks": [metrics.callback_handler]}
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens of text for the agent's model, estimated when tiktoken has no encoding."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.encoding_for_model("gpt-4o-mini")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def _pinned(message) -> bool:
+    if isinstance(message, HumanMessage):
+        return bool(IDENTITY_PATTERN.search(message.content))
+    return bool(ACTION_PATTERN.search(message.content))
+
+
+def _line(message) -> str:
+    speaker = "Member" if isinstance(message, HumanMessage) else "Agent"
+    return f"{speaker}: {message.content}"
+
+
+class HistoryManager:
+    """The history window of one call. Keep one per call, it caches the summary."""
+
+    def __init__(self, llm, max_turns=HISTORY_MAX_TURNS, token_budget=HISTORY_TOKEN_BUDGET,
+                 fold_turns=HISTORY_FOLD_TURNS, max_pinned=HISTORY_MAX_PINNED):
+        self.llm = llm
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.fold_turns = fold_turns
+        self.max_pinned = max_pinned
+        self.summary = ""
+        self.pinned = []
+        # Messages folded into the summary, to check the next history extends them
+        self._folded = []
+        self.summaries = 0
+
+    def _split(self, messages):
+        """Index where the verbatim window starts, within the budget and the turn limit."""
+        tokens = 0
+        start = len(messages)
+        while start > 0:
+            cost = count_tokens(messages[start - 1].content)
+            kept = len(messages) - start
+            # Always keep the last exchange, whatever its size
+            if kept >= 2 and (kept >= 2 * self.max_turns or tokens + cost > self.token_budget):
+                break
+            tokens += cost
+            start -= 1
+        return start
+
+    def _to_fold(self, messages):
+        """The messages to fold into the summary now, or [] to keep them verbatim for now."""
+        if messages[:len(self._folded)] != self._folded:
+            # Not the conversation the summary was made from, start over
+            self.summary = ""
+            self.pinned = []
+            self._folded = []
+        start = self._split(messages)
+        pending = messages[len(self._folded):start]
+        # Fold whole chunks, so the summary changes every few turns, not every turn
+        if len(pending) < 2 * self.fold_turns:
+            return []
+        return pending
+
+    def _summary_request(self, fold):
+        lines = "\n".join(_line(message) for message in fold)
+        return [
+            SystemMessage(content=SUMMARY_INSTRUCTIONS),
+            HumanMessage(
+                content=f"Existing summary:\n{self.summary or '(none)'}\n\nNew lines:\n{lines}"
+            ),
+        ]
+
+    def _folded_in(self, fold, summary):
+        self.summary = summary.strip()
+        self.pinned = (self.pinned + [_line(m) for m in fold if _pinned(m)])[-self.max_pinned:]
+        self._folded = self._folded + fold
+        self.summaries += 1
+
+    def _window(self, messages):
+        verbatim = messages[len(self._folded):]
+        if not self._folded:
+            return verbatim
+        context = f"Summary of the earlier part of the call:\n{self.summary}"
+        if self.pinned:
+            context += "\n\nSaid earlier in the call, word for word:\n" + "\n".join(
+                f"- {line}" for line in self.pinned
+            )
+        return [SystemMessage(content=context)] + verbatim
+
+    def window(self, messages):
+        """The history to send for messages, the whole conversation so far."""
+        fold = self._to_fold(messages)
+        if fold:
+            try:
+                with metrics.agent_label("summary"):
+                    summary = self.llm.invoke(self._summary_request(fold),
+                                              config=_SUMMARY_CONFIG).content
+                self._folded_in(fold, summary)
+            except Exception as e:
+                # Send the turns verbatim rather than fail the turn
+                logging.error(f"Could not summarize the call history: {e}")
+        return self._window(messages)
+
+    async def awindow(self, messages):
+        fold = self._to_fold(messages)
+        if fold:
+            try:
+                with metrics.agent_label("summary"):
+                    summary = (await self.llm.ainvoke(self._summary_request(fold),
+                                                      config=_SUMMARY_CONFIG)).content
+                self._folded_in(fold, summary)
+            except Exception as e:
+                logging.error(f"Could not summarize the call history: {e}")
+        return self._window(messages)
+
@@ -0,0 +1,164 @@
+"""
+Cache invalidation driven by the database.
+
+Migration 4 adds triggers to members, appointments, providers and
+availability that NOTIFY, on queries.CACHE_CHANNEL, the cache keys a changed
+row affects. With CACHE_LISTEN=true a background thread LISTENs on its own
+connection and drops the matching entries:
+
+    members, appointments   member information, by phone and by member id
+    providers               provider information, the availability near the
+                            provider and, on update or delete, the member
+                            information of the provider's patients (it shows
+                            provider names)
+    availability            the availability near the slot's provider
+
+Changes are seen whoever makes them: the tools, the SQL agent, sql.py,
+another instance of the app or another system. While the listener is
+connected the caches no longer rely on expiry to catch up, so they store
+entries with the longer TTLs of shared.set_listening().
+
+Notifications sent while the listener is disconnected are lost. So when it
+disconnects, the caches are cleared and go back to their usual TTLs, and
+they are cleared again when it connects.
+"""
+
+import json
+import logging
+import os
+import select
+import threading
+
+import psycopg2
+from dotenv import load_dotenv
+
+from queries import CACHE_CHANNEL
+from shared import availability_cache, member_info_cache, provider_cache, set_listening
+
+load_dotenv()
+
+connection_string = os.getenv("DATABASE_URL")
+
+CACHE_LISTEN = os.getenv("CACHE_LISTEN", "false").lower() == "true"
+CACHE_LISTEN_RETRY_SECONDS = float(os.getenv("CACHE_LISTEN_RETRY_SECONDS", "5"))
+
+
+def clear_caches():
+    member_info_cache.clear()
+    provider_cache.clear()
+    availability_cache.clear()
+
+
+def invalidate(event):
+    """Drop the cache entries of a notification from notify_cache_invalidation()."""
+    for phone_number in event.get("phones") or ():
+        if phone_number:
+            member_info_cache.invalidate_phone(phone_number)
+    for member_id in event.get("member_ids") or ():
+        if member_id is not None:
+            member_info_cache.invalidate_member_id(member_id)
+    for provider_id in event.get("provider_ids") or ():
+        provider_cache.invalidate(str(provider_id))
+        if event.get("op") != "INSERT":
+            # A new provider has no appointments yet
+            member_info_cache.invalidate_provider_id(provider_id)
+    for zip_prefix in event.get("zip_prefixes") or ():
+        availability_cache.invalidate(zip_prefix)
+
+
+class Listener:
+    """LISTENs for cache invalidations in a background thread, reconnecting as needed."""
+
+    def __init__(self, dsn, channel):
+        self.dsn = dsn
+        self.channel = channel
+        self.connected = False
+        self.connections = 0
+        self.notifications = 0
+        self.errors = 0
+        self.last_error = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="cache-invalidation", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"[:300]
+                logging.warning(f"Cache invalidation listener disconnected: {e}")
+            if self.connected:
+                # Entries stored with the long TTLs may miss the changes made from now on
+                self.connected = False
+                set_listening(False)
+                clear_caches()
+            self._stopped.wait(CACHE_LISTEN_RETRY_SECONDS)
+
+    def _listen(self):
+        # Keepalives, so a connection dropped by the network is noticed
+        conn = psycopg2.connect(
+            self.dsn, keepalives=1, keepalives_idle=30, keepalives_interval=10,
+            keepalives_count=3,
+        )
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {self.channel}")
+            # Whatever changed while nobody was listening is unknown
+            clear_caches()
+            self.connected = True
+            set_listening(True)
+            self.connections += 1
+            logging.info(f"Listening for cache invalidations on {self.channel}")
+            while not self._stopped.is_set():
+                if select.select([conn], [], [], 5.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self.handle(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+    def handle(self, payload):
+        self.notifications += 1
+        try:
+            invalidate(json.loads(payload))
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"Could not apply cache invalidation {payload[:200]!r}: {e}")
+
+    def stats(self):
+        return {
+            "enabled": CACHE_LISTEN,
+            "channel": self.channel,
+            "connected": self.connected,
+            "connections": self.connections,
+            "notifications": self.notifications,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+listener = Listener(connection_string, CACHE_CHANNEL)
+
+
+def start():
+    """Start listening, when CACHE_LISTEN is on."""
+    if CACHE_LISTEN:
+        listener.start()
+
+
+def stats():
+    return listener.stats()
@@ -0,0 +1,323 @@
+"""
+Process metrics in the Prometheus text format, served at /metrics.
+
+Request, turn, LLM and tool timings are recorded as they happen into the
+histograms and counters below. Pool, cache and session numbers are read from
+their own stats() when /metrics is scraped, through collectors.
+
+Histograms are cumulative, as Prometheus expects: each bucket counts the
+observations less than or equal to its bound.
+"""
+
+import contextvars
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import async_db
+import db
+import invalidation
+from faq import faq_index
+from response_cache import response_cache
+from sessions import agent_sessions
+from shared import member_info_cache, provider_cache, availability_cache, schema_cache
+from tracing import token_counts
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ITERATION_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        with self._lock:
+            for labels, (counts, count, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    lines.append(
+                        f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labels, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, collect):
+        """
+        Register collect(), returning (name, type, help, [(labels dict, value)])
+        tuples read at scrape time. Usable as a decorator.
+        """
+        self._collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, kind, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(
+                        f"{name}{_labels(tuple(labels), tuple(labels.values()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("route", "method", "status"))
+turn_seconds = registry.histogram(
+    "agent_turn_duration_seconds", "Latency of a turn, by what answered it.", ("answered_by",))
+turn_iterations = registry.histogram(
+    "agent_iterations_per_turn", "LLM calls of the agent loop per turn answered by the agent.",
+    buckets=ITERATION_BUCKETS)
+llm_seconds = registry.histogram(
+    "llm_request_duration_seconds", "LLM call latency.", ("agent",))
+llm_tokens = registry.counter(
+    "llm_tokens_total", "LLM tokens, by kind (prompt, completion, cached).", ("agent", "kind"))
+llm_prompt_tokens = registry.histogram(
+    "llm_prompt_tokens", "Prompt tokens per LLM call.", ("agent",), buckets=TOKEN_BUCKETS)
+llm_errors = registry.counter("llm_errors_total", "LLM calls that failed.", ("agent",))
+tool_seconds = registry.histogram("tool_duration_seconds", "Tool call latency.", ("tool",))
+tool_errors = registry.counter(
+    "tool_errors_total", "Tool calls that raised or returned an error.", ("tool",))
+
+# Which agent the LLM calls of the current context belong to
+_agent = contextvars.ContextVar("metrics_agent", default="main")
+
+
+class agent_label:
+    """Label the LLM calls made inside the block with agent, e.g. "sql"."""
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    def __enter__(self):
+        self._token = _agent.set(self.agent)
+
+    def __exit__(self, exc_type, exc, tb):
+        _agent.reset(self._token)
+        return False
+
+
+def _tool_failed(output) -> bool:
+    if isinstance(output, dict):
+        return "error" in output
+    content = getattr(output, "content", output)
+    return isinstance(content, str) and content.startswith(("Error", "An error occurred"))
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Times the LLM and tool calls of every turn. One instance serves all turns."""
+
+    # Run in the caller's context, to read the agent label
+    run_inline = True
+
+    def __init__(self):
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, *labels):
+        with self._lock:
+            self._started[run_id] = (time.perf_counter(), labels)
+
+    def _stop(self, run_id):
+        with self._lock:
+            entry = self._started.pop(run_id, None)
+        if entry is None:
+            return None, ()
+        started, labels = entry
+        return time.perf_counter() - started, labels
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, _agent.get())
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, _agent.get())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        elapsed, labels = self._stop(run_id)
+        if elapsed is None:
+            return
+        agent = labels[0]
+        llm_seconds.observe(elapsed, agent)
+        counts = token_counts(response)
+        for kind in ("prompt", "completion", "cached"):
+            if counts.get(f"{kind}_tokens"):
+                llm_tokens.inc(agent, kind, amount=counts[f"{kind}_tokens"])
+        if "prompt_tokens" in counts:
+            llm_prompt_tokens.observe(counts["prompt_tokens"], agent)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        elapsed, labels = self._stop(run_id)
+        if elapsed is not None:
+            llm_errors.inc(labels[0])
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, serialized.get("name"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        elapsed, labels = self._stop(run_id)
+        if elapsed is None:
+            return
+        tool_seconds.observe(elapsed, *labels)
+        if _tool_failed(output):
+            tool_errors.inc(*labels)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        elapsed, labels = self._stop(run_id)
+        if elapsed is None:
+            return
+        tool_seconds.observe(elapsed, *labels)
+        tool_errors.inc(*labels)
+
+
+callback_handler = MetricsCallbackHandler()
+
+
+def cache_samples(name, caches):
+    """Collector samples for TTLCache-like stats() of {cache label: cache}."""
+    stats = {label: cache.stats() for label, cache in caches.items()}
+    return [
+        (f"{name}_hits_total", "counter", "Cache lookups that found an entry.",
+         [({"cache": label}, s["hits"]) for label, s in stats.items()]),
+        (f"{name}_misses_total", "counter", "Cache lookups that found no entry.",
+         [({"cache": label}, s["misses"]) for label, s in stats.items()]),
+        (f"{name}_hit_ratio", "gauge", "Share of cache lookups that found an entry.",
+         [({"cache": label}, s["hit_rate"]) for label, s in stats.items()]),
+        (f"{name}_entries", "gauge", "Entries in the cache.",
+         [({"cache": label}, s["size"]) for label, s in stats.items()]),
+        (f"{name}_evictions_total", "counter", "Entries evicted to make room.",
+         [({"cache": label}, s["evictions"]) for label, s in stats.items()]),
+    ]
+
+
+def pool_samples(name, stats):
+    """Collector samples for a connection pool's stats()."""
+    return [
+        (f"{name}_connections", "gauge", "Open connections by state.",
+         [({"state": "in_use"}, stats["in_use"]), ({"state": "idle"}, stats["idle"])]),
+        (f"{name}_max_connections", "gauge", "Most connections the pool opens.",
+         [({}, stats["max_size"])]),
+    ] + [
+        (f"{name}_{key}_total", "counter", help, [({}, stats[key])])
+        for key, help in (
+            ("checkouts", "Connections handed out."),
+            ("timeouts", "Checkouts that timed out waiting for a connection."),
+        )
+        if key in stats
+    ] + ([
+        (f"{name}_wait_seconds_total", "counter", "Time spent waiting for a connection.",
+         [({}, stats["wait_time_total"])]),
+    ] if "wait_time_total" in stats else [])
+
+
+@registry.collector
+def _collect():
+    samples = cache_samples("cache", {
+        "member_info": member_info_cache,
+        "provider": provider_cache,
+        "availability": availability_cache,
+        "sql_schema": schema_cache,
+        "response": response_cache,
+    })
+    # Only the pools this process uses; reading them must not open one
+    if db._pool is not None:
+        samples += pool_samples("db_pool", db._pool.stats())
+    if async_db._pools:
+        samples += pool_samples("db_async_pool", async_db.async_pool_stats())
+    sessions = agent_sessions.stats()
+    faq = faq_index.stats()
+    listener = invalidation.stats()
+    samples += [
+        ("agent_sessions", "gauge", "Live call sessions.", [({}, sessions["live_sessions"])]),
+        ("faq_direct_answers_total", "counter", "Turns answered from the FAQ without the LLM.",
+         [({}, faq["direct_answers"])]),
+        ("response_cache_latency_saved_seconds_total", "counter",
+         "Agent time saved by cached answers.",
+         [({}, response_cache.stats()["latency_saved"])]),
+    ]
+    if listener["enabled"]:
+        samples += [
+            ("cache_invalidation_listener_connected", "gauge",
+             "Whether the cache invalidation listener is connected.",
+             [({}, int(listener["connected"]))]),
+            ("cache_invalidation_notifications_total", "counter",
+             "Cache invalidations received from the database.",
+             [({}, listener["notifications"])]),
+        ]
+    return samples
@@ -0,0 +1,424 @@
+# migrations.py
+"""
+Versioned, forward-only schema migrations for the call center tables.
+
+sql.py creates the base tables (version 0). Each migration below is applied
+once, in order, and recorded in schema_migrations:
+
+    python app/migrations.py upgrade   # apply pending migrations
+    python app/migrations.py status    # show applied and pending migrations
+    python app/migrations.py check     # EXPLAIN the tool queries, fail on table scans
+
+Migrations marked transactional=False run outside a transaction so their
+indexes can be built CONCURRENTLY, without blocking writes on large tables.
+Their statements must be idempotent (IF NOT EXISTS) since a failure part way
+leaves the earlier statements applied. A concurrent build that fails leaves
+an invalid index behind, which IF NOT EXISTS would then skip: it is dropped
+before the index is built again, and `check` fails while one exists.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from collections import namedtuple
+
+import psycopg2
+from dotenv import load_dotenv
+
+import queries
+
+load_dotenv()
+
+connection_string = os.getenv("DATABASE_URL")
+
+# Arbitrary key of the advisory lock serializing migration runs.
+MIGRATION_LOCK_ID = 72_410_001
+
+# Index built by a statement, to drop it first if an earlier build left it invalid
+CONCURRENT_INDEX = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE)
+
+INVALID_INDEXES_QUERY = """
+    SELECT c.relname
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE NOT i.indisvalid AND c.relnamespace = current_schema()::regnamespace
+    ORDER BY c.relname
+"""
+
+Migration = namedtuple("Migration", ["version", "name", "statements", "transactional"])
+
+# Tables whose row changes are sent to the app, see migration 4
+CACHE_TRIGGER_TABLES = ["members", "appointments", "providers", "availability"]
+
+MIGRATIONS = [
+    Migration(
+        1,
+        "index the lookups made by the tools",
+        [
+            # Member profile: appointments of a member, newest first
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS appointments_member_phone_date_idx
+            ON appointments (member_phone, date DESC, time DESC)
+            """,
+            # schedule_appointment: open slots covering a date and time
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS availability_open_slots_idx
+            ON availability (date, start_time, end_time, provider_id)
+            WHERE status = 'available'
+            """,
+            # Claiming and releasing a provider's slot
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS availability_provider_date_idx
+            ON availability (provider_id, date, start_time)
+            """,
+            # Appointments of a provider, for provider-side lookups and joins
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS appointments_provider_date_idx
+            ON appointments (provider_id, date, time)
+            """,
+        ],
+        False,
+    ),
+    Migration(
+        2,
+        "give availability slots ids and allow one booking per slot",
+        [
+            "ALTER TABLE availability ADD COLUMN IF NOT EXISTS id BIGSERIAL PRIMARY KEY",
+            """
+            ALTER TABLE appointments
+            ADD COLUMN IF NOT EXISTS availability_id BIGINT REFERENCES availability(id)
+            """,
+            # At most one scheduled appointment holds a slot, whatever the
+            # application does; a cancelled appointment frees it again
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS appointments_one_per_slot_idx
+            ON appointments (availability_id)
+            WHERE status = 'scheduled'
+            """,
+        ],
+        True,
+    ),
+    Migration(
+        3,
+        "index providers by zip code prefix",
+        [
+            # Availability near a member: providers whose zip code starts
+            # with the member's three digit prefix
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS providers_zip_code_idx
+            ON providers (zip_code text_pattern_ops)
+            """,
+        ],
+        False,
+    ),
+    Migration(
+        4,
+        "notify the app of changes to cached rows",
+        [
+            # Sends the cache keys a row change affects on CACHE_CHANNEL, see
+            # app/invalidation.py: the member ids and phones of members and
+            # appointments, the provider ids and zip code prefixes of
+            # providers and of the providers of availability slots
+            f"""
+            CREATE OR REPLACE FUNCTION notify_cache_invalidation() RETURNS trigger AS $$
+            DECLARE
+                changed jsonb[] := ARRAY[]::jsonb[];
+                payload jsonb;
+            BEGIN
+                IF TG_OP <> 'INSERT' THEN
+                    changed := changed || to_jsonb(OLD);
+                END IF;
+                IF TG_OP <> 'DELETE' THEN
+                    changed := changed || to_jsonb(NEW);
+                END IF;
+                IF TG_TABLE_NAME = 'members' THEN
+                    payload := jsonb_build_object(
+                        'member_ids', (SELECT jsonb_agg(DISTINCT r->'id') FROM unnest(changed) r),
+                        'phones', (SELECT jsonb_agg(DISTINCT r->'phone_number')
+                                   FROM unnest(changed) r));
+                ELSIF TG_TABLE_NAME = 'appointments' THEN
+                    payload := jsonb_build_object(
+                        'member_ids', (SELECT jsonb_agg(DISTINCT r->'member_id')
+                                       FROM unnest(changed) r),
+                        'phones', (SELECT jsonb_agg(DISTINCT r->'member_phone')
+                                   FROM unnest(changed) r));
+                ELSIF TG_TABLE_NAME = 'providers' THEN
+                    payload := jsonb_build_object(
+                        'provider_ids', (SELECT jsonb_agg(DISTINCT r->'id') FROM unnest(changed) r),
+                        'zip_prefixes', (SELECT jsonb_agg(DISTINCT left(r->>'zip_code', 3))
+                                         FROM unnest(changed) r));
+                ELSE
+                    payload := jsonb_build_object(
+                        'zip_prefixes', (SELECT jsonb_agg(DISTINCT left(p.zip_code, 3))
+                                         FROM providers p
+                                         WHERE p.id IN (SELECT (r->>'provider_id')::bigint
+                                                        FROM unnest(changed) r)));
+                END IF;
+                PERFORM pg_notify('{queries.CACHE_CHANNEL}', (jsonb_build_object(
+                    'table', TG_TABLE_NAME, 'op', TG_OP) || payload)::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+        ] + [
+            # Dropped and created again: CREATE OR REPLACE TRIGGER needs
+            # PostgreSQL 14, and the migration runs in one transaction
+            statement
+            for table in CACHE_TRIGGER_TABLES
+            for statement in (
+                f"DROP TRIGGER IF EXISTS {table}_cache_invalidation ON {table}",
+                f"""
+                CREATE TRIGGER {table}_cache_invalidation
+                AFTER INSERT OR UPDATE OR DELETE ON {table}
+                FOR EACH ROW EXECUTE PROCEDURE notify_cache_invalidation()
+                """,
+            )
+        ],
+        True,
+    ),
+]
+
+# Tool queries that must be served by an index, with sample parameters.
+INDEX_CHECKS = [
+    ("member profile", queries.MEMBER_PROFILE_QUERY, ("555-000-0000",)),
+    ("provider information", queries.PROVIDER_QUERY, (1,)),
+    ("providers", queries.PROVIDERS_QUERY, ([1, 2],)),
+    (
+        "nearby availability",
+        queries.NEARBY_AVAILABILITY_QUERY,
+        ("021%", "2030-01-02", "2030-01-16", 10),
+    ),
+    ("member address", queries.MEMBER_ADDRESS_QUERY, ("555-000-0000",)),
+    ("open slot", queries.OPEN_SLOT_QUERY, ("2030-01-02", "10:00", "10:00", [])),
+    (
+        "open slot exists",
+        queries.OPEN_SLOT_EXISTS_QUERY,
+        ("2030-01-02", "10:00", "10:00"),
+    ),
+    ("claim slot", queries.CLAIM_SLOT_QUERY, (1,)),
+    ("active appointment", queries.ACTIVE_APPOINTMENT_QUERY, (1,)),
+    ("cancel appointment", queries.CANCEL_APPOINTMENT_QUERY, (1,)),
+    ("release slot", queries.RELEASE_SLOT_QUERY, (1,)),
+    (
+        "release availability",
+        queries.RELEASE_AVAILABILITY_QUERY,
+        (1, "2030-01-02", "10:00", "10:00"),
+    ),
+    (
+        "update member",
+        queries.member_update_query(["email"]),
+        ("member@example.com", "555-000-0000"),
+    ),
+]
+
+
+def connect():
+    if connection_string is None:
+        raise ValueError("DATABASE_URL environment variable is not set")
+    return psycopg2.connect(connection_string)
+
+
+def ensure_migrations_table(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    conn.commit()
+
+
+def _has_migrations_table(cur):
+    cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    return cur.fetchone()[0]
+
+
+def applied_versions(conn):
+    """The applied migration versions; none while schema_migrations does not exist."""
+    with conn.cursor() as cur:
+        if not _has_migrations_table(cur):
+            versions = set()
+        else:
+            cur.execute("SELECT version FROM schema_migrations")
+            versions = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return versions
+
+
+def current_version(conn):
+    """
+    The latest applied migration version, 0 while schema_migrations does not
+    exist. Only reads, so the app can call it without creating tables.
+    """
+    with conn.cursor() as cur:
+        if not _has_migrations_table(cur):
+            version = 0
+        else:
+            cur.execute("SELECT max(version) FROM schema_migrations")
+            version = cur.fetchone()[0] or 0
+    conn.commit()
+    return version
+
+
+def pending_migrations(conn):
+    applied = applied_versions(conn)
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+def _record(cur, migration):
+    cur.execute(
+        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+        (migration.version, migration.name),
+    )
+
+
+def _drop_invalid_index(cur, statement):
+    """Drop the index statement builds if it exists but is invalid; whether it did."""
+    match = CONCURRENT_INDEX.search(statement)
+    if match is None:
+        return False
+    name = match.group(1)
+    cur.execute(
+        "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,))
+    row = cur.fetchone()
+    if row is None or not row[0]:
+        return False
+    print(f"Dropping invalid index {name} left by a failed build")
+    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    return True
+
+
+def rebuild_invalid_indexes(conn, migrations):
+    """Build again the indexes of applied migrations that a failed build left invalid."""
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for migration in migrations:
+                for statement in migration.statements:
+                    if _drop_invalid_index(cur, statement):
+                        cur.execute(statement)
+    finally:
+        conn.autocommit = False
+
+
+def apply_migration(conn, migration):
+    if migration.transactional:
+        with conn.cursor() as cur:
+            for statement in migration.statements:
+                cur.execute(statement)
+            _record(cur, migration)
+        conn.commit()
+    else:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for statement in migration.statements:
+                    _drop_invalid_index(cur, statement)
+                    cur.execute(statement)
+                _record(cur, migration)
+        finally:
+            conn.autocommit = False
+
+
+def upgrade(conn, target=None):
+    """Apply the pending migrations up to target (all by default). Returns the applied ones."""
+    ensure_migrations_table(conn)
+    applied = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+    conn.commit()
+    try:
+        applied_before = applied_versions(conn)
+        rebuild_invalid_indexes(conn, [m for m in MIGRATIONS if m.version in applied_before])
+        # Read the pending list under the lock, another process may have just migrated
+        for migration in pending_migrations(conn):
+            if target is not None and migration.version > target:
+                break
+            print(f"Applying migration {migration.version}: {migration.name}")
+            apply_migration(conn, migration)
+            applied.append(migration)
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        conn.commit()
+    return applied
+
+
+def _scans(plan, found):
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        _scans(child, found)
+    return found
+
+
+def invalid_indexes(conn):
+    """Indexes left invalid by a failed concurrent build; the planner never uses them."""
+    with conn.cursor() as cur:
+        cur.execute(INVALID_INDEXES_QUERY)
+        names = [row[0] for row in cur.fetchall()]
+    conn.rollback()
+    return names
+
+
+def check_indexes(conn):
+    """
+    EXPLAIN each tool query and return the (name, tables) of those that scan a
+    table sequentially. Sequential scans are disabled for the check so the
+    planner picks an index whenever one is usable, as it would once the tables
+    are large; a Seq Scan in the plan then means no index can serve the query.
+    """
+    failures = []
+    with conn.cursor() as cur:
+        for name, query, params in INDEX_CHECKS:
+            cur.execute("SET LOCAL enable_seqscan = off")
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scanned = _scans(plan[0]["Plan"], [])
+            if scanned:
+                failures.append((name, scanned))
+            conn.rollback()
+    return failures
+
+
+def status(conn):
+    applied = applied_versions(conn)
+    for migration in MIGRATIONS:
+        state = "applied" if migration.version in applied else "pending"
+        print(f"{migration.version:4d}  {state:8s} {migration.name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["upgrade", "status", "check"])
+    parser.add_argument("--target", type=int, default=None,
+                        help="Only upgrade up to this version")
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        if args.command == "upgrade":
+            applied = upgrade(conn, args.target)
+            print(f"Schema is at version {current_version(conn)} "
+                  f"({len(applied)} migration(s) applied).")
+        elif args.command == "status":
+            status(conn)
+        else:
+            invalid = invalid_indexes(conn)
+            for name in invalid:
+                print(f"FAIL index {name} is invalid, run upgrade to build it again")
+            failures = check_indexes(conn)
+            for name, tables in failures:
+                print(f"FAIL {name}: sequential scan on {', '.join(tables)}")
+            if failures or invalid:
+                sys.exit(1)
+            print(f"All {len(INDEX_CHECKS)} tool queries use indexes.")
+    finally:
+        conn.close()
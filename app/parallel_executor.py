@@ -0,0 +1,176 @@
+"""
+Agent executor that runs the tool calls of one step concurrently.
+
+When the model asks for several tools in one step (the details of two
+providers, or cancel and schedule to reschedule), AgentExecutor runs them one
+after the other, each waiting on its own database round trips.
+ParallelAgentExecutor starts them together, on a thread pool shared by the
+calls for sync calls and as tasks for async ones, and hands the observations
+back in the order the model asked for them, so each one stays paired with
+its tool call id in the scratchpad.
+
+Tools that change data run one after the other within a step, in the order
+the model gave them, so a reschedule still cancels before it books. Across
+calls each write tool runs at most TOOL_WRITE_CONCURRENCY times at once.
+
+Only reads go to the shared pool. The writes, and update_databse with its
+whole SQL agent among them, run on the call's own thread, so slow writes
+never hold the workers other calls' reads wait on. A call uses at most
+TOOL_CALL_CONCURRENCY workers at once, and the pool has as many workers as
+the database pool has connections (TOOL_POOL_SIZE), since every read holds
+one.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.agents import AgentExecutor
+
+import tracing
+
+TOOL_POOL_SIZE = int(os.getenv("TOOL_POOL_SIZE", os.getenv("DB_POOL_MAX", "10")))
+TOOL_CALL_CONCURRENCY = int(os.getenv("TOOL_CALL_CONCURRENCY", "3"))
+TOOL_WRITE_CONCURRENCY = int(os.getenv("TOOL_WRITE_CONCURRENCY", "4"))
+
+WRITE_TOOLS = {
+    "update_member_information",
+    "update_databse",
+    "cancel_appointment",
+    "schedule_appointment",
+    "escalate_call",
+}
+
+_pool = ThreadPoolExecutor(max_workers=TOOL_POOL_SIZE, thread_name_prefix="tool")
+
+_write_limits = {name: threading.BoundedSemaphore(TOOL_WRITE_CONCURRENCY) for name in WRITE_TOOLS}
+# asyncio semaphores belong to one event loop
+_async_write_limits = weakref.WeakKeyDictionary()
+
+
+def _async_write_limit(name):
+    loop = asyncio.get_running_loop()
+    limits = _async_write_limits.get(loop)
+    if limits is None:
+        limits = _async_write_limits[loop] = {
+            tool: asyncio.Semaphore(TOOL_WRITE_CONCURRENCY) for tool in WRITE_TOOLS
+        }
+    return limits[name]
+
+
+class _Deferred:
+    """A tool call of the current step, run once the whole step is known."""
+
+    def __init__(self, action, args):
+        self.action = action
+        self.args = args
+
+    @property
+    def writes(self):
+        return self.action.tool in WRITE_TOOLS
+
+
+def _plan(deferred):
+    """Groups to start together: each read alone, all the writes as one ordered group."""
+    writes = [d for d in deferred if d.writes]
+    groups = [[d] for d in deferred if not d.writes]
+    if writes:
+        groups.append(writes)
+    return groups
+
+
+def _pooled_plan(deferred, concurrency=None):
+    """
+    The reads of a step spread over at most concurrency groups for the
+    pool, and the group the calling thread runs: the writes, or else the
+    last reads.
+    """
+    concurrency = TOOL_CALL_CONCURRENCY if concurrency is None else concurrency
+    writes = [d for d in deferred if d.writes]
+    reads = [d for d in deferred if not d.writes]
+    pooled = [reads[i::max(concurrency, 1)] for i in range(max(concurrency, 1))]
+    pooled = [group for group in pooled if group]
+    return pooled, writes or (pooled.pop() if pooled else [])
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action,
+                              run_manager=None):
+        # Called by _iter_next_step once per action of the step, see below
+        return _Deferred(agent_action, (name_to_tool_map, color_mapping, agent_action,
+                                        run_manager))
+
+    def _run_action(self, d):
+        if not d.writes:
+            return super()._perform_agent_action(*d.args)
+        with _write_limits[d.action.tool]:
+            return super()._perform_agent_action(*d.args)
+
+    def _run_group(self, group):
+        return [(d, self._run_action(d)) for d in group]
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps,
+                        run_manager=None):
+        # AgentExecutor yields the step's actions, then performs them one by
+        # one; here performing only records them, and they run after the loop.
+        with tracing.span("agent.step", step=len(intermediate_steps) + 1) as step:
+            deferred = []
+            for item in super()._iter_next_step(name_to_tool_map, color_mapping, inputs,
+                                                intermediate_steps, run_manager):
+                if isinstance(item, _Deferred):
+                    deferred.append(item)
+                else:
+                    yield item
+            step.set(tool_calls=len(deferred))
+            if deferred:
+                yield from self._run_deferred(deferred)
+
+    def _run_deferred(self, deferred):
+        pooled, own = _pooled_plan(deferred)
+        # Each task runs in a copy of the caller's context (callbacks, tracing)
+        futures = [
+            _pool.submit(contextvars.copy_context().run, self._run_group, group)
+            for group in pooled
+        ]
+        done = self._run_group(own)
+        done += [pair for future in futures for pair in future.result()]
+        steps = {id(d): step for d, step in done}
+        for d in deferred:
+            yield steps[id(d)]
+
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action,
+                                     run_manager=None):
+        # Called through asyncio.gather by _aiter_next_step, see below
+        return _Deferred(agent_action, (name_to_tool_map, color_mapping, agent_action,
+                                        run_manager))
+
+    async def _arun_action(self, d):
+        if not d.writes:
+            return await super()._aperform_agent_action(*d.args)
+        async with _async_write_limit(d.action.tool):
+            return await super()._aperform_agent_action(*d.args)
+
+    async def _arun_group(self, group):
+        return [(d, await self._arun_action(d)) for d in group]
+
+    async def _aiter_next_step(self, name_to_tool_map, color_mapping, inputs,
+                               intermediate_steps, run_manager=None):
+        with tracing.span("agent.step", step=len(intermediate_steps) + 1) as step:
+            deferred = []
+            async for item in super()._aiter_next_step(name_to_tool_map, color_mapping, inputs,
+                                                       intermediate_steps, run_manager):
+                if isinstance(item, _Deferred):
+                    deferred.append(item)
+                else:
+                    yield item
+            step.set(tool_calls=len(deferred))
+            if not deferred:
+                return
+            results = await asyncio.gather(
+                *[self._arun_group(group) for group in _plan(deferred)])
+            steps = {id(d): s for done in results for d, s in done}
+            for d in deferred:
+                yield steps[id(d)]
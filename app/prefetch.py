@@ -0,0 +1,119 @@
+"""
+Warm the caches of a call before its first turn.
+
+The telephony layer posts to /call/start when a call is answered, and the
+greeting plays for several seconds before the member says anything. In that
+time prefetch() loads the member's profile, the providers of their
+appointments and the open times near them into the caches the tools read,
+and builds the call's agent, so the first turn only waits on the LLM.
+
+The agent is built under agent.session_key() like any turn's, so a prefetch
+sent with another caller's call id never reaches that call. Without a call
+id there is no session to build.
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import agent
+import tracing
+import tools as t
+from async_db import connection
+from async_tools import afetch_availability
+from db import execute_prepared
+from queries import numbered_params, MEMBER_PROFILE_QUERY, PROVIDERS_QUERY
+from shared import member_info_cache, provider_cache, availability_cache
+
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+
+_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+# Running async prefetches, so they are not garbage collected before they finish
+_tasks = set()
+
+
+def _cache_member(phone_number, member):
+    """Cache a MEMBER_PROFILE_QUERY row; returns the ids of providers not cached yet and the zip prefix."""
+    appointments = t.profile_appointments(member[11])
+    member_information = t.render_member_information(member, appointments)
+    provider_ids = t.appointment_provider_ids(appointments)
+    member_info_cache.set(phone_number, member_information, member[0], provider_ids)
+    missing = sorted(p for p in provider_ids if provider_cache.get(str(p)) is None)
+    zip_prefix = t.member_zip_prefix(member_information)
+    if zip_prefix is not None and availability_cache.get(zip_prefix) is not None:
+        zip_prefix = None
+    return missing, zip_prefix
+
+
+def _cache_providers(rows):
+    for row in rows:
+        provider_cache.set(str(row[0]), t.render_provider_information(row))
+
+
+def prefetch(phone_number, call_id=None):
+    conn = t.connect_to_db()
+    try:
+        cur = conn.cursor()
+        execute_prepared(cur, "member_profile", MEMBER_PROFILE_QUERY, (phone_number,))
+        member = cur.fetchone()
+        if member is None:
+            member_info_cache.set_not_found(phone_number)
+        else:
+            missing, zip_prefix = _cache_member(phone_number, member)
+            if missing:
+                cur.execute(PROVIDERS_QUERY, (missing,))
+                _cache_providers(cur.fetchall())
+            if zip_prefix is not None:
+                t.fetch_availability(cur, zip_prefix)
+        conn.rollback()
+    finally:
+        conn.close()
+    _build_agent(phone_number, call_id)
+
+
+async def aprefetch(phone_number, call_id=None):
+    async with connection() as conn:
+        member = await conn.fetchrow(numbered_params(MEMBER_PROFILE_QUERY), phone_number)
+        if member is None:
+            member_info_cache.set_not_found(phone_number)
+        else:
+            missing, zip_prefix = _cache_member(phone_number, member)
+            if missing:
+                _cache_providers(await conn.fetch(numbered_params(PROVIDERS_QUERY), missing))
+            if zip_prefix is not None:
+                await afetch_availability(conn, zip_prefix)
+    _build_agent(phone_number, call_id)
+
+
+def _build_agent(phone_number, call_id):
+    if call_id is not None:
+        agent.get_agent(phone_number, call_id)
+
+
+def _logged(phone_number, call_id):
+    try:
+        with tracing.request("prefetch"):
+            prefetch(phone_number, call_id)
+    except Exception as e:
+        logging.error(f"Prefetch for {phone_number} failed: {e}")
+
+
+async def _alogged(phone_number, call_id):
+    try:
+        with tracing.request("prefetch"):
+            await aprefetch(phone_number, call_id)
+    except Exception as e:
+        logging.error(f"Prefetch for {phone_number} failed: {e}")
+
+
+def start(phone_number, call_id=None):
+    """Prefetch in the background; the first turn works the same if it has not finished."""
+    return _pool.submit(_logged, phone_number, call_id)
+
+
+def astart(phone_number, call_id=None):
+    task = asyncio.get_running_loop().create_task(_alogged(phone_number, call_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
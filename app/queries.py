@@ -0,0 +1,188 @@
+"""
+SQL statements used by the tools.
+
+The statements use psycopg2 placeholders (%s). The async tools run the same
+statements on asyncpg, and hot statements are run as server-side prepared
+statements, after converting the placeholders with numbered_params().
+"""
+
+# Channel the cache invalidation triggers of migration 4 notify on
+CACHE_CHANNEL = "cache_invalidation"
+
+# The member and all their appointments in one round trip. The appointments
+# come back as a JSON array of [id, date, time, street_address, city, state,
+# zip_code, status, provider_first_name, provider_last_name, provider_id],
+# newest first.
+MEMBER_PROFILE_QUERY = """
+SELECT
+    m.id, m.first_name, m.last_name, m.phone_number,
+    m.date_of_birth, m.gender, m.street_address, m.city,
+    m.state, m.zip_code, m.email,
+    COALESCE(
+        (
+            SELECT json_agg(
+                json_build_array(
+                    a.id, a.date, a.time, a.street_address, a.city,
+                    a.state, a.zip_code, a.status, p.first_name, p.last_name,
+                    p.id
+                )
+                ORDER BY a.date DESC, a.time DESC
+            )
+            FROM appointments a
+            JOIN providers p ON a.provider_id = p.id
+            WHERE a.member_phone = m.phone_number
+        ),
+        '[]'::json
+    ) AS appointments
+FROM members m
+WHERE m.phone_number = %s
+"""
+
+PROVIDER_QUERY = """
+SELECT
+    id, first_name, last_name, phone_number,
+    email, street_address, city, state, zip_code, degree, procedures
+FROM providers
+WHERE id = %s
+"""
+
+PROVIDERS_QUERY = """
+SELECT
+    id, first_name, last_name, phone_number,
+    email, street_address, city, state, zip_code, degree, procedures
+FROM providers
+WHERE id = ANY(%s::bigint[])
+"""
+
+# Open slots of the providers whose zip code starts with the given prefix
+# (a LIKE pattern such as '021%'), between two dates, soonest first.
+NEARBY_AVAILABILITY_QUERY = """
+SELECT
+    a.provider_id, p.first_name, p.last_name, p.degree, p.city, p.state,
+    a.date, a.start_time, a.end_time
+FROM providers p
+JOIN availability a ON a.provider_id = p.id
+WHERE p.zip_code LIKE %s
+AND a.date BETWEEN %s AND %s
+AND a.status = 'available'
+ORDER BY a.date, a.start_time, a.provider_id
+LIMIT %s
+"""
+
+MEMBER_ADDRESS_QUERY = """
+SELECT id, street_address, city, state, zip_code
+FROM members
+WHERE phone_number = %s
+"""
+
+# An open slot covering the date and time, locked for the booking. Slots
+# locked by concurrent bookings are skipped rather than waited on, so callers
+# asking for the same time spread over the free providers. The last parameter
+# is an array of slot ids to leave out.
+OPEN_SLOT_QUERY = """
+SELECT id, provider_id
+FROM availability
+WHERE date = %s
+AND %s::time >= start_time
+AND %s::time < end_time
+AND status = 'available'
+AND id <> ALL(%s::bigint[])
+ORDER BY provider_id
+LIMIT 1
+FOR UPDATE SKIP LOCKED
+"""
+
+# Whether any slot covering the date and time is still open, locked or not.
+OPEN_SLOT_EXISTS_QUERY = """
+SELECT EXISTS (
+    SELECT 1
+    FROM availability
+    WHERE date = %s
+    AND %s::time >= start_time
+    AND %s::time < end_time
+    AND status = 'available'
+)
+"""
+
+CLAIM_SLOT_QUERY = """
+UPDATE availability
+SET status = 'unavailable'
+WHERE id = %s
+"""
+
+INSERT_APPOINTMENT_QUERY = """
+INSERT INTO appointments (
+    member_id, provider_id, member_phone, date, time,
+    street_address, city, state, zip_code, availability_id, status
+)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'scheduled')
+RETURNING id
+"""
+
+ACTIVE_APPOINTMENT_QUERY = """
+SELECT provider_id, date, time, availability_id
+FROM appointments
+WHERE id = %s AND status != 'cancelled'
+FOR UPDATE
+"""
+
+CANCEL_APPOINTMENT_QUERY = """
+UPDATE appointments
+SET status = 'cancelled'
+WHERE id = %s
+"""
+
+RELEASE_SLOT_QUERY = """
+UPDATE availability
+SET status = 'available'
+WHERE id = %s
+"""
+
+# Appointments booked before slots had ids: release the slot by its time
+RELEASE_AVAILABILITY_QUERY = """
+UPDATE availability
+SET status = 'available'
+WHERE provider_id = %s
+AND date = %s
+AND %s::time >= start_time
+AND %s::time < end_time
+"""
+
+INSERT_ESCALATION_QUERY = """
+INSERT INTO escalations (phone_number, status, description, created_at)
+VALUES (%s, %s, %s, %s)
+"""
+
+
+# Columns of members that update_member_information may change.
+EDITABLE_MEMBER_COLUMNS = (
+    "email",
+    "street_address",
+    "city",
+    "state",
+    "zip_code",
+    "phone_number",
+    "gender",
+)
+
+
+def member_update_query(columns) -> str:
+    """UPDATE of the given members columns, with the values then the phone number as parameters."""
+    for column in columns:
+        if column not in EDITABLE_MEMBER_COLUMNS:
+            raise ValueError(f"Column {column} of members cannot be updated")
+    assignments = ", ".join(f"{column} = %s" for column in columns)
+    return f"""
+UPDATE members
+SET {assignments}
+WHERE phone_number = %s
+RETURNING id
+"""
+
+
+def numbered_params(query: str) -> str:
+    """Rewrite %s placeholders as the $1, $2, ... placeholders of asyncpg and PREPARE."""
+    parts = query.split("%s")
+    return "".join(
+        part + (f"${i}" if i < len(parts) else "") for i, part in enumerate(parts, 1)
+    )
@@ -0,0 +1,190 @@
+"""
+Cross-call cache of the agent's answers to generic questions.
+
+Many turns are the same general questions ("will I be charged?", "how long
+does it take?") whose answer does not depend on who is calling. For those
+turns the answer the agent gave one caller is reused for the next ones.
+
+Only turns that look member independent are looked up or stored: the
+utterance must match a FAQ entry, and must not carry numbers or ask about
+the member's own appointments, details or an action. An answer is stored
+only if the agent used no tool to produce it and, once the caller's first
+name is replaced by a placeholder, it contains nothing about the member:
+no other part of their name, phone, email, address, dates or ids.
+
+The key is the normalized question plus a coarse fingerprint of the
+member's state (found or not, with an upcoming appointment or not), so a
+caller is only served answers given to callers in the same situation.
+"""
+
+import os
+import re
+import threading
+
+import faq
+from cache import TTLCache
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+# How close the utterance must be to a FAQ question, relative to asking it
+RESPONSE_CACHE_MIN_FAQ_SCORE = float(os.getenv("RESPONSE_CACHE_MIN_FAQ_SCORE", "0.3"))
+
+FIRST_NAME = "{first_name}"
+
+# Utterances about the caller's own data or asking for an action
+MEMBER_SPECIFIC = re.compile(
+    r"\d|\b(my|our) (appointment|visit|address|email|phone|number|information|"
+    r"account|doctor|provider|date|birthday)|\b(cancel|book|schedule|reschedule|"
+    r"change|update|move|escalate|supervisor|manager|human|person|verify|"
+    r"this is|my name)\b",
+    re.IGNORECASE,
+)
+# Answers that must not be reused across callers
+UNSAFE_ANSWER = re.compile(
+    r"\d|@|\b(verify|verified|last name|first name|your name|appointment id|"
+    r"escalat\w*|supervisor)\b",
+    re.IGNORECASE,
+)
+
+
+def _field(member_information, name):
+    found = re.search(rf"^\s*{name}: *(.+)$", member_information or "", re.MULTILINE)
+    return found.group(1).strip() if found else ""
+
+
+def fingerprint(member_information) -> str:
+    """Coarse member state the answer to a generic question may depend on."""
+    if not _field(member_information, "Member ID"):
+        return "unknown"
+    if "Status: Scheduled" in member_information:
+        return "member:scheduled"
+    return "member"
+
+
+# An appointment line of the rendered member information, see tools.py
+APPOINTMENT = re.compile(
+    r"Appointment ID (?P<id>\S+): Appointment on (?P<date>.+?) at (?P<time>.+?) "
+    r"with Dr\. (?P<provider>.+?)\. Location: (?P<location>.+?)\. Status: (?P<status>\w+)"
+)
+FIELD = re.compile(r"^\s*([A-Z][A-Za-z ]*): *(.+?)\s*$", re.MULTILINE)
+
+
+def _address_parts(address):
+    """An address and its parts: street, city, state and zip code."""
+    parts = [address]
+    for part in address.split(","):
+        part = part.strip()
+        parts.append(part)
+        parts.extend(part.split(" ") if re.fullmatch(r"[A-Z]{2} \S+", part) else ())
+    return parts
+
+
+def member_values(member_information) -> set:
+    """
+    Every value of the rendered member information but the first name: each
+    field, the parts of the address and, for each appointment, its date,
+    time, provider (full name and each name), location and status. Values
+    with digits are also caught by UNSAFE_ANSWER.
+    """
+    values = []
+    for label, value in FIELD.findall(member_information or ""):
+        if label == "First Name":
+            continue
+        values.extend(_address_parts(value) if label == "Address" else [value])
+    for line in re.findall(r"^\s*- (.+)$", member_information or "", re.MULTILINE):
+        found = APPOINTMENT.search(line)
+        if found is None:
+            if not line.startswith("No past or future appointments"):
+                values.append(line.strip())
+            continue
+        provider = found["provider"]
+        values += [found["id"], found["date"], found["time"], provider, found["status"]]
+        values += provider.split()
+        values += _address_parts(found["location"])
+    return {value.strip() for value in values if value.strip()}
+
+
+def normalize(utterance) -> str:
+    return " ".join(faq.tokenize(utterance))
+
+
+class ResponseCache(TTLCache):
+    def __init__(self, maxsize=5000, ttl=3600.0):
+        super().__init__(maxsize, ttl)
+        self._stats_lock = threading.Lock()
+        self.stores = 0
+        self.rejected = 0
+        self.latency_saved = 0.0
+
+    def key(self, utterance, member_information):
+        """Cache key of a member-independent turn, None for the others."""
+        if not RESPONSE_CACHE_ENABLED or MEMBER_SPECIFIC.search(utterance):
+            return None
+        question = normalize(utterance)
+        if not question or not faq.faq_index.matches(utterance, RESPONSE_CACHE_MIN_FAQ_SCORE):
+            return None
+        return (question, fingerprint(member_information))
+
+    def lookup(self, key, member_information):
+        """The cached answer for key, addressed to this caller, or None."""
+        entry = self.get(key)
+        if entry is None:
+            return None
+        answer, latency = entry
+        if FIRST_NAME in answer:
+            first_name = _field(member_information, "First Name")
+            if not first_name:
+                return None
+            answer = answer.replace(FIRST_NAME, first_name)
+        with self._stats_lock:
+            self.latency_saved += latency
+        return answer
+
+    def store(self, key, answer, member_information, latency, used_tools=False):
+        """Cache answer if it is safe to give to other callers. Returns whether it was cached."""
+        template = self._template(answer, member_information)
+        if used_tools or template is None:
+            with self._stats_lock:
+                self.rejected += 1
+            return False
+        self.set(key, (template, latency))
+        with self._stats_lock:
+            self.stores += 1
+        return True
+
+    def _template(self, answer, member_information):
+        """answer with the caller's first name as a placeholder, None if it holds member data."""
+        first_name = _field(member_information, "First Name")
+        template = answer
+        if first_name:
+            template = re.sub(rf"\b{re.escape(first_name)}\b", FIRST_NAME, template)
+        rest = template.replace(FIRST_NAME, "")
+        if UNSAFE_ANSWER.search(rest):
+            return None
+        if any(re.search(rf"(?<!\w){re.escape(value)}(?!\w)", rest, re.IGNORECASE)
+               for value in member_values(member_information)):
+            return None
+        return template
+
+    def flush(self):
+        with self._lock:
+            flushed = len(self._data)
+        self.clear()
+        return flushed
+
+    def stats(self):
+        stats = super().stats()
+        with self._stats_lock:
+            stats.update({
+                "enabled": RESPONSE_CACHE_ENABLED,
+                "stores": self.stores,
+                "rejected": self.rejected,
+                "latency_saved": self.latency_saved,
+            })
+        return stats
+
+
+response_cache = ResponseCache(
+    maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "5000")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+)
+
@@ -0,0 +1,103 @@
+"""
+Registry of live call sessions.
+
+A session holds the agent built for one call so that every turn of the call
+reuses it instead of rebuilding the LLM client, prompt and executor.
+Sessions are evicted least-recently-used first when the registry is full,
+and after they have been idle for longer than the idle TTL.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionRegistry:
+    def __init__(self, max_sessions=1000, idle_ttl=900):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_or_create(self, session_id, factory):
+        """
+        Return the session stored under session_id, building it with factory()
+        if there is no live session for that id.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry["last_used"] = now
+                self._sessions.move_to_end(session_id)
+                self.hits += 1
+                return entry["session"]
+            self.misses += 1
+
+        # Build outside the lock, building an agent involves a database lookup.
+        session = factory()
+
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                # Another request for the same call built it first.
+                entry["last_used"] = time.monotonic()
+                return entry["session"]
+            self._sessions[session_id] = {
+                "session": session,
+                "last_used": time.monotonic(),
+            }
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            entry["last_used"] = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return entry["session"]
+
+    def end(self, session_id):
+        """Drop the session of a call that has ended."""
+        with self._lock:
+            return self._sessions.pop(session_id, {}).get("session")
+
+    def _expire(self, now):
+        # Entries are ordered by last use, so the idle ones are at the front.
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if now - entry["last_used"] < self.idle_ttl:
+                break
+            del self._sessions[session_id]
+            self.expirations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "live_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_ttl": self.idle_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+agent_sessions = SessionRegistry(
+    max_sessions=int(os.getenv("AGENT_SESSION_MAX", "1000")),
+    idle_ttl=float(os.getenv("AGENT_SESSION_IDLE_TTL", "900")),
+)
@@ -1 +1,65 @@
-member_info_cache = {}
+import os
+
+from cache import MemberInfoCache, TTLCache
+
+# "memory": each process caches on its own. "sqlite": the worker processes of
+# the machine share one cache file, and each other's invalidations.
+MEMBER_CACHE_BACKEND = os.getenv("MEMBER_CACHE_BACKEND", "memory")
+MEMBER_CACHE_PATH = os.getenv(
+    "MEMBER_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), "..", ".cache", "member_info.sqlite3"),
+)
+
+_member_cache_settings = dict(
+    maxsize=int(os.getenv("MEMBER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("MEMBER_CACHE_TTL", "300")),
+    negative_ttl=float(os.getenv("MEMBER_CACHE_NEGATIVE_TTL", "60")),
+)
+
+if MEMBER_CACHE_BACKEND == "sqlite":
+    from sqlite_cache import SQLiteMemberInfoCache
+
+    member_info_cache = SQLiteMemberInfoCache(MEMBER_CACHE_PATH, **_member_cache_settings)
+elif MEMBER_CACHE_BACKEND == "memory":
+    member_info_cache = MemberInfoCache(**_member_cache_settings)
+else:
+    raise ValueError(f"Unknown MEMBER_CACHE_BACKEND {MEMBER_CACHE_BACKEND!r}")
+
+# Rendered provider information keyed by provider id
+provider_cache = TTLCache(
+    maxsize=int(os.getenv("PROVIDER_CACHE_SIZE", "5000")),
+    ttl=float(os.getenv("PROVIDER_CACHE_TTL", "3600")),
+)
+
+# Rendered open appointment times keyed by zip code prefix. Without the
+# listener, bookings are not reflected until the entry expires;
+# schedule_appointment checks the slot either way.
+availability_cache = TTLCache(
+    maxsize=int(os.getenv("AVAILABILITY_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("AVAILABILITY_CACHE_TTL", "60")),
+)
+
+# Table info (DDL and sample rows) shown to the SQL agent, keyed by migration
+# version and tables. Sample rows are refreshed when the entry expires.
+schema_cache = TTLCache(
+    maxsize=int(os.getenv("SCHEMA_CACHE_SIZE", "100")),
+    ttl=float(os.getenv("SCHEMA_CACHE_TTL", "3600")),
+)
+
+# While the invalidation listener is connected (see invalidation.py), changes
+# made in the database reach the caches as they happen, so entries can live
+# much longer: (cache, attribute, TTL while listening).
+_LISTENING_TTLS = [
+    (member_info_cache, "ttl", float(os.getenv("MEMBER_CACHE_LISTEN_TTL", "3600"))),
+    (member_info_cache, "negative_ttl",
+     float(os.getenv("MEMBER_CACHE_LISTEN_NEGATIVE_TTL", "600"))),
+    (provider_cache, "ttl", float(os.getenv("PROVIDER_CACHE_LISTEN_TTL", "86400"))),
+    (availability_cache, "ttl", float(os.getenv("AVAILABILITY_CACHE_LISTEN_TTL", "600"))),
+]
+_TTLS = [(cache, name, getattr(cache, name)) for cache, name, _ in _LISTENING_TTLS]
+
+
+def set_listening(listening):
+    """Give entries stored from now on the TTLs for a connected listener, or the usual ones."""
+    for cache, name, ttl in _LISTENING_TTLS if listening else _TTLS:
+        setattr(cache, name, ttl)
@@ -0,0 +1,90 @@
+"""
+Schema introspection for the SQL agent, served from memory.
+
+SQLDatabase answers every sql_db_schema call with catalog queries and
+sample-row SELECTs, and the agent usually spends its first two LLM round
+trips listing the tables and reading their schema. CachedSQLDatabase keeps
+the rendered table info (DDL and sample rows) in shared.schema_cache, keyed
+by the migration version it was built for, and notes when a statement the
+agent runs changes the schema so the caller can rebuild it.
+
+The table names and the schema of the tables most requests touch go in the
+agent's prompt instead (prompt_schema), and SchemaInPromptToolkit drops the
+sql_db_list_tables tool.
+"""
+
+import re
+
+from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import InfoSQLDatabaseTool, ListSQLDatabaseTool
+from langchain_community.utilities import SQLDatabase
+
+from shared import schema_cache
+
+# Statements, anywhere in what the agent runs, that change the schema
+DDL = re.compile(r"(^|;)\s*(CREATE|ALTER|DROP|TRUNCATE|RENAME|COMMENT)\b", re.IGNORECASE)
+
+
+class CachedSQLDatabase(SQLDatabase):
+    def __init__(self, engine, version, **kwargs):
+        super().__init__(engine, **kwargs)
+        self.version = version
+        # Set once the agent ran DDL: the reflected schema no longer matches
+        self.changed = False
+
+    def get_table_info(self, table_names=None):
+        key = (self.version, tuple(sorted(table_names)) if table_names is not None else None)
+        info = schema_cache.get(key)
+        if info is None:
+            info = super().get_table_info(table_names)
+            schema_cache.set(key, info)
+        return info
+
+    def run(self, command, *args, **kwargs):
+        try:
+            return super().run(command, *args, **kwargs)
+        finally:
+            if isinstance(command, str) and DDL.search(command):
+                self.changed = True
+                schema_cache.clear()
+
+
+# Replaces the default, which has the agent list the tables and read their schema
+SUFFIX = """Begin!
+
+Question: {input}
+Thought: I should query the relevant tables, using the schema above.
+{agent_scratchpad}"""
+
+
+class SchemaInPromptToolkit(SQLDatabaseToolkit):
+    """The SQL toolkit without sql_db_list_tables, for prompts that list the tables."""
+
+    def get_tools(self):
+        tools = []
+        for t in super().get_tools():
+            if isinstance(t, ListSQLDatabaseTool):
+                continue
+            if isinstance(t, InfoSQLDatabaseTool):
+                t.description = t.description.replace(
+                    " Be sure that the tables actually exist by calling sql_db_list_tables first!",
+                    "")
+            tools.append(t)
+        return tools
+
+
+def _braces(text):
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def prompt_schema(db, tables):
+    """
+    The table names and the table info of tables, for the agent's prefix.
+    create_sql_agent formats the prefix with str.format and then again as a
+    prompt template, so braces (in sample rows) are escaped twice.
+    """
+    text = (
+        f"Tables: {', '.join(db.get_usable_table_names())}\n\n"
+        f"{db.get_table_info(tables)}"
+    )
+    return _braces(_braces(text))
@@ -0,0 +1,236 @@
+"""
+Member information cache shared by the worker processes of one machine.
+
+Each worker process has its own MemberInfoCache, so with N workers a member
+is looked up N times and an invalidation in one worker leaves the others
+serving stale information until it expires. SQLiteMemberInfoCache keeps the
+entries in one SQLite file in WAL mode instead: readers never wait on
+writers, and an invalidation by any worker is seen by all of them on their
+next lookup.
+
+It has the MemberInfoCache interface. Expiry uses the wall clock, which all
+processes share. When there are more than maxsize entries, those closest to
+expiry are evicted. Hit and miss counts are per process.
+
+A failing cache file never fails a tool: lookups become misses and the error
+is logged.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from cache import NOT_FOUND
+
+
+class SQLiteMemberInfoCache:
+    def __init__(self, path, maxsize=10000, ttl=300.0, negative_ttl=60.0):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.errors = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS member_info (
+                    phone_number TEXT PRIMARY KEY,
+                    info TEXT NOT NULL,
+                    member_id INTEGER,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            # The providers each entry mentions, for invalidate_provider_id
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS member_info_provider (
+                    phone_number TEXT NOT NULL,
+                    provider_id INTEGER NOT NULL,
+                    PRIMARY KEY (provider_id, phone_number)
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS member_info_member_id_idx ON member_info (member_id)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS member_info_expires_at_idx ON member_info (expires_at)")
+
+    def _connection(self):
+        # One connection per thread, and a new one in a forked worker: SQLite
+        # connections must not be shared across threads or processes
+        conn, pid = getattr(self._local, "conn", (None, None))
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Durable enough for a cache, and no fsync on every write
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = (conn, os.getpid())
+        return conn
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _failed(self, action, e):
+        self._count("errors")
+        logging.warning(f"Shared member cache {action} failed: {e}")
+
+    def get(self, phone_number, default=None):
+        try:
+            row = self._connection().execute(
+                "SELECT info, expires_at FROM member_info WHERE phone_number = ?",
+                (phone_number,),
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._failed("lookup", e)
+            row = None
+        if row is None:
+            self._count("misses")
+            return default
+        info, expires_at = row
+        if expires_at <= time.time():
+            self._count("expirations")
+            self._count("misses")
+            return default
+        self._count("hits")
+        return info
+
+    def _store(self, phone_number, info, member_id, provider_ids, ttl):
+        now = time.time()
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(
+                    "INSERT OR REPLACE INTO member_info VALUES (?, ?, ?, ?)",
+                    (phone_number, info, member_id, now + ttl),
+                )
+                conn.execute(
+                    "DELETE FROM member_info_provider WHERE phone_number = ?", (phone_number,))
+                conn.executemany(
+                    "INSERT INTO member_info_provider VALUES (?, ?)",
+                    [(phone_number, provider_id) for provider_id in set(provider_ids)],
+                )
+                conn.execute("DELETE FROM member_info WHERE expires_at <= ?", (now,))
+                excess = conn.execute("SELECT count(*) FROM member_info").fetchone()[0] \
+                    - self.maxsize
+                if excess > 0:
+                    conn.execute(
+                        """
+                        DELETE FROM member_info WHERE phone_number IN (
+                            SELECT phone_number FROM member_info ORDER BY expires_at LIMIT ?
+                        )
+                        """,
+                        (excess,),
+                    )
+                    self._count("evictions", excess)
+                _drop_orphans(conn)
+        except sqlite3.Error as e:
+            self._failed("store", e)
+
+    def set(self, phone_number, info, member_id=None, provider_ids=()):
+        self._store(phone_number, info, member_id, provider_ids, self.ttl)
+
+    def set_not_found(self, phone_number):
+        self._store(phone_number, NOT_FOUND, None, (), self.negative_ttl)
+
+    def invalidate_phone(self, phone_number):
+        """Drop the entry for phone_number and any other phone of the same member."""
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT member_id FROM member_info WHERE phone_number = ?", (phone_number,)
+                ).fetchone()
+                member_id = row[0] if row is not None else None
+                removed = conn.execute(
+                    "DELETE FROM member_info WHERE phone_number = ? OR member_id = ?",
+                    (phone_number, member_id),
+                ).rowcount
+                _drop_orphans(conn)
+            self._count("invalidations", removed)
+        except sqlite3.Error as e:
+            self._failed("invalidation", e)
+
+    def invalidate_member_id(self, member_id):
+        try:
+            conn = self._connection()
+            with conn:
+                removed = conn.execute(
+                    "DELETE FROM member_info WHERE member_id = ?", (member_id,)).rowcount
+                _drop_orphans(conn)
+            self._count("invalidations", removed)
+        except sqlite3.Error as e:
+            self._failed("invalidation", e)
+
+    def invalidate_provider_id(self, provider_id):
+        """Drop the entries of the members with an appointment with provider_id."""
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                removed = conn.execute(
+                    """
+                    DELETE FROM member_info WHERE phone_number IN (
+                        SELECT phone_number FROM member_info_provider WHERE provider_id = ?
+                    )
+                    """,
+                    (provider_id,),
+                ).rowcount
+                _drop_orphans(conn)
+            self._count("invalidations", removed)
+        except sqlite3.Error as e:
+            self._failed("invalidation", e)
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM member_info")
+            conn.execute("DELETE FROM member_info_provider")
+
+    def __len__(self):
+        return self._connection().execute(
+            "SELECT count(*) FROM member_info WHERE expires_at > ?", (time.time(),)
+        ).fetchone()[0]
+
+    def stats(self):
+        try:
+            size = len(self)
+        except sqlite3.Error:
+            size = 0
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "sqlite",
+                "path": self.path,
+                "size": size,
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "negative_ttl": self.negative_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "errors": self.errors,
+            }
+
+
+def _drop_orphans(conn):
+    """Drop the provider rows of entries no longer in member_info."""
+    conn.execute("""
+        DELETE FROM member_info_provider WHERE phone_number NOT IN (
+            SELECT phone_number FROM member_info
+        )
+    """)
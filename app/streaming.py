@@ -0,0 +1,190 @@
+"""
+Server-sent event streaming of agent responses.
+
+The answer is streamed token by token as the model generates it. Whenever a
+sentence is complete a `sentence` event is emitted, so text-to-speech can
+start on the first sentence while the rest is still being generated. Tool
+calls are signalled with `tool_start`/`tool_end` events, and the stream ends
+with a `done` event holding the full answer (or an `error` event).
+"""
+
+import asyncio
+import contextvars
+import json
+import queue
+import re
+import threading
+from typing import List
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Words ending in a period that do not end a sentence.
+ABBREVIATIONS = {
+    "dr", "mr", "mrs", "ms", "st", "ave", "jr", "sr", "vs", "etc", "no", "a.m", "p.m",
+}
+
+_SENTENCE_END = re.compile(r"([.!?]+[\"')\]]*)(\s+)|(\n+)")
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class SentenceBuffer:
+    """Accumulates streamed tokens and hands back complete sentences."""
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, token: str) -> List[str]:
+        self.buffer += token
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self.buffer):
+            if match.group(1):
+                words = self.buffer[start:match.start()].split()
+                last_word = words[-1].lower() if words else ""
+                # "Dr. Smith" or "4.5" are not sentence boundaries
+                if last_word in ABBREVIATIONS or (
+                    len(last_word) == 1 and last_word.isalpha()
+                ):
+                    continue
+            sentence = self.buffer[start:match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self) -> List[str]:
+        sentence = self.buffer.strip()
+        self.buffer = ""
+        return [sentence] if sentence else []
+
+
+class StreamingCallbackHandler(BaseCallbackHandler):
+    """
+    Forwards the agent's tokens and tool calls to emit(event, data).
+    Tokens generated while a tool is running (e.g. by the SQL agent inside
+    update_databse) are not part of the answer and are dropped.
+    """
+
+    run_inline = True
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.sentences = SentenceBuffer()
+        self.active_tools = 0
+        self._lock = threading.Lock()
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        if not token or self.active_tools:
+            return
+        self.emit("token", {"text": token})
+        for sentence in self.sentences.feed(token):
+            self.emit("sentence", {"text": sentence})
+
+    def on_tool_start(self, serialized, input_str, **kwargs) -> None:
+        with self._lock:
+            if self.active_tools == 0:
+                # Speak any filler ("Let me check that for you") before the tool runs
+                for sentence in self.sentences.flush():
+                    self.emit("sentence", {"text": sentence})
+            self.active_tools += 1
+        self.emit("tool_start", {"name": serialized.get("name")})
+
+    def on_tool_end(self, output, **kwargs) -> None:
+        with self._lock:
+            self.active_tools -= 1
+        self.emit("tool_end", {"name": kwargs.get("name")})
+
+    def on_tool_error(self, error, **kwargs) -> None:
+        with self._lock:
+            self.active_tools -= 1
+        self.emit("tool_end", {"name": kwargs.get("name"), "error": str(error)})
+
+    def finish(self):
+        for sentence in self.sentences.flush():
+            self.emit("sentence", {"text": sentence})
+
+
+def stream_text(callbacks, text):
+    """
+    Hand an answer found without the LLM (an FAQ or a cached answer) to the
+    callbacks as one generated token, so streaming clients get its token and
+    sentence events like any other answer.
+    """
+    for callback in callbacks or ():
+        if isinstance(callback, StreamingCallbackHandler):
+            callback.on_llm_new_token(text)
+
+
+_DONE = object()
+
+
+def stream_response(lc_agent, transcript):
+    """Run the agent in a worker thread and yield its events as SSE strings."""
+    events = queue.Queue()
+    handler = StreamingCallbackHandler(lambda event, data: events.put((event, data)))
+
+    def run():
+        try:
+            result = lc_agent.get_response(transcript, callbacks=[handler])
+            handler.finish()
+            events.put(("done", {"result": result}))
+        except Exception as e:
+            events.put(("error", {"message": str(e)}))
+        finally:
+            events.put(_DONE)
+
+    # The worker keeps the request's context, e.g. its request id for tracing
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+    while True:
+        item = events.get()
+        if item is _DONE:
+            return
+        yield sse(*item)
+
+
+async def astream_events(run):
+    """
+    Async counterpart of stream_response. run(callbacks) must return an
+    awaitable producing the answer; yields (event, data) tuples.
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def emit(event, data):
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    handler = StreamingCallbackHandler(emit)
+
+    async def _run():
+        try:
+            result = await run([handler])
+            handler.finish()
+            emit("done", {"result": result})
+        except Exception as e:
+            emit("error", {"message": str(e)})
+        finally:
+            loop.call_soon_threadsafe(events.put_nowait, _DONE)
+
+    task = asyncio.create_task(_run())
+    try:
+        while True:
+            item = await events.get()
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def astream_response(lc_agent, transcript):
+    """Async version of stream_response for the ASGI app."""
+    events = astream_events(
+        lambda callbacks: lc_agent.aget_response(transcript, callbacks=callbacks)
+    )
+    async for event, data in events:
+        yield sse(event, data)
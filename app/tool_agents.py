@@ -3,25 +3,36 @@ This script contains tools for the AI agent. These tools are also agents.
 
 """
 
-from langchain_community.utilities import SQLDatabase
-from langchain_community.agent_toolkits.sql.base import create_sql_agent
-from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
-from langchain_openai import ChatOpenAI
-from langchain.agents.agent_types import AgentType
+import hashlib
+import hmac
+import logging
 import os
+import pickle
+import threading
+import time
+
 from dotenv import load_dotenv
 from langchain.tools import tool
 from shared import member_info_cache
+from db import connection_string, get_engine, get_pool
+import cassette
+import metrics
+import migrations
 
 # Load environment variables
 load_dotenv()
 
-# Set up the database connection
-db = SQLDatabase.from_uri(os.getenv("DATABASE_URL"))
-
-# Set up the language model
-llm = ChatOpenAI(temperature=0, model_name="gpt-4o-mini")
-
+# Reflected schema of the database, per database and schema, so a new
+# process does not reflect every table again before its first SQL agent call
+SCHEMA_SNAPSHOT_DIR = os.getenv(
+    "SCHEMA_SNAPSHOT_DIR", os.path.join(os.path.dirname(__file__), "..", ".cache")
+)
+# Signs the snapshots; a snapshot whose signature does not match is never unpickled
+SCHEMA_SNAPSHOT_KEY = os.getenv("SCHEMA_SNAPSHOT_KEY", connection_string or "")
+# How often the SQL agent checks for a new migration version
+SCHEMA_CHECK_SECONDS = float(os.getenv("SCHEMA_CHECK_SECONDS", "30"))
+# Tables whose schema is given in the SQL agent's prompt
+PROMPT_SCHEMA_TABLES = ["members", "appointments"]
 
 prefix = """
         You are an agent designed to interact with a SQL database.
@@ -39,28 +50,170 @@ prefix = """
         appointments: this table holds information about the appointments. Each record is an appointment. \
         When retrieving appointments, pay attention to the appointment date and whether that is a future or a past appointment. \
         For example, if a member is asking about their next appointment, you should use the current time to look for future appointment not a past appointment. \
-        If the query to the appointment table does not return anything, that simply means that the member does not have an appointment. You can search the appointments table by member's phone number.  
+        If the query to the appointment table does not return anything, that simply means that the member does not have an appointment. You can search the appointments table by member's phone number.
+        The schema of the members and appointments tables, with sample rows, is below: query them without looking their schema up. \
+        Only use sql_db_schema for the other tables.
         """
 
-# Create an instance of SQLDatabaseToolkit
-sql_toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-
-query_agent_executor = create_sql_agent(
-    llm=llm,
-    toolkit=sql_toolkit,  # Pass the instance instead of the class
-    verbose=True,
-    agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-    handle_parsing_errors=True,
-    prefix=prefix,
-    top_k=10,
-)
+_sql_agent = None
+_sql_db = None
+_sql_snapshot = None
+_schema_checked_at = 0.0
+_sql_agent_lock = threading.Lock()
+
+
+def _schema_version():
+    conn = get_pool().acquire()
+    try:
+        return migrations.current_version(conn)
+    finally:
+        conn.close()
+
+
+# The columns of every table of the schema the SQL agent reflects
+COLUMNS_QUERY = """
+    SELECT table_name, column_name, ordinal_position, data_type, is_nullable, column_default
+    FROM information_schema.columns
+    WHERE table_schema = current_schema()
+    ORDER BY table_name, ordinal_position
+"""
+
+
+def _snapshot_path(version):
+    """
+    Where the snapshot of the schema goes: keyed by the server, database and
+    schema, the migration version and a hash of the columns, so a snapshot is
+    never used for another database or for a schema changed outside the
+    migrations.
+    """
+    conn = get_pool().acquire()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT current_schema()")
+            schema = cur.fetchone()[0]
+            cur.execute(COLUMNS_QUERY)
+            columns = cur.fetchall()
+        identity = (conn.info.host, conn.info.port, conn.info.dbname, schema, version, columns)
+    finally:
+        conn.close()
+    digest = hashlib.sha256(repr(identity).encode()).hexdigest()
+    return os.path.join(SCHEMA_SNAPSHOT_DIR, f"schema-v{version}-{digest[:32]}.pickle")
+
+
+def _signature(data):
+    return hmac.new(SCHEMA_SNAPSHOT_KEY.encode(), data, hashlib.sha256).hexdigest().encode()
+
+
+def _read_snapshot(path):
+    """The MetaData in the snapshot at path; raises ValueError when its signature does not match."""
+    with open(path, "rb") as f:
+        signature, _, data = f.read().partition(b"\n")
+    if not hmac.compare_digest(signature, _signature(data)):
+        raise ValueError("signature mismatch")
+    return pickle.loads(data)
+
+
+def load_metadata(engine, path):
+    """
+    The reflected MetaData of the schema, from the snapshot at path when
+    there is a valid one, reflected and saved there otherwise.
+    """
+    from sqlalchemy import MetaData
+
+    try:
+        return _read_snapshot(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable schema snapshot {path}: {e}")
+
+    metadata = MetaData()
+    metadata.reflect(bind=engine)
+    try:
+        os.makedirs(SCHEMA_SNAPSHOT_DIR, mode=0o700, exist_ok=True)
+        data = pickle.dumps(metadata)
+        # Written aside then renamed, so concurrent workers never read half a file
+        partial = f"{path}.{os.getpid()}"
+        with open(partial, "wb") as f:
+            f.write(_signature(data) + b"\n" + data)
+        os.replace(partial, path)
+    except OSError as e:
+        logging.warning(f"Could not save the schema snapshot {path}: {e}")
+    return metadata
+
+
+def _schema_changed():
+    """Whether the schema changed since the SQL agent was built; call with the lock held."""
+    global _schema_checked_at
+    if _sql_db.changed:
+        return True
+    if time.monotonic() - _schema_checked_at < SCHEMA_CHECK_SECONDS:
+        return False
+    _schema_checked_at = time.monotonic()
+    return _schema_version() != _sql_db.version
+
+
+def _build_sql_agent(version):
+    global _sql_db, _sql_snapshot
+    from langchain.agents.agent_types import AgentType
+    from langchain_community.agent_toolkits.sql.base import create_sql_agent
+    from langchain_openai import ChatOpenAI
+    from sql_schema import SUFFIX, CachedSQLDatabase, SchemaInPromptToolkit, prompt_schema
+
+    # Set up the database connection, sharing the tools' connection pool
+    engine = get_engine()
+    _sql_snapshot = _snapshot_path(version)
+    _sql_db = CachedSQLDatabase(
+        engine, version, metadata=load_metadata(engine, _sql_snapshot),
+        lazy_table_reflection=True,
+    )
+
+    # Set up the language model
+    llm = ChatOpenAI(
+        temperature=0,
+        model_name="gpt-4o-mini",
+        http_client=cassette.http_client(),
+        http_async_client=cassette.http_async_client(),
+    )
+
+    return create_sql_agent(
+        llm=llm,
+        toolkit=SchemaInPromptToolkit(db=_sql_db, llm=llm),
+        agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+        handle_parsing_errors=True,
+        prefix=prefix + "\n" + prompt_schema(_sql_db, PROMPT_SCHEMA_TABLES),
+        suffix=SUFFIX,
+        top_k=10,
+    )
+
+
+def get_sql_agent():
+    """
+    The SQL agent behind update_databse, built on first use: it needs the
+    database and the schema, which a process that never runs it should not
+    wait for at startup. It is built again when the schema changes: a new
+    migration version, or DDL the agent ran itself.
+    """
+    global _sql_agent, _schema_checked_at
+    with _sql_agent_lock:
+        if _sql_agent is not None and not _schema_changed():
+            return _sql_agent
+        if _sql_db is not None and _sql_db.changed:
+            # The snapshot no longer matches the database
+            try:
+                os.remove(_sql_snapshot)
+            except OSError:
+                pass
+        _sql_agent = _build_sql_agent(_schema_version())
+        _schema_checked_at = time.monotonic()
+        return _sql_agent
 
 
 @tool
 def update_databse(question: str, phone_number) -> str:
     """
-    Use this tool for the following purposes:
-    - update member's information such as their contact information, email, address, medical conditions and demographics.
+    Use this tool to update member's information that update_member_information cannot change, such as medical conditions.
+    For email, address, city, state, zip code, phone number or gender, use update_member_information instead.
 
     Args:
         question (str): The natural language question or instruction.
@@ -69,12 +222,13 @@ def update_databse(question: str, phone_number) -> str:
     Returns:
         str: result of the database update operation.
     """
-    # update the member_info_cache
-    if phone_number in member_info_cache:
-        member_info_cache[phone_number]["up_to_date"] = False
-
     try:
-        result = query_agent_executor.run(question)
+        with metrics.agent_label("sql"):
+            result = get_sql_agent().run(question)
         return result
     except Exception as e:
         return f"An error occurred: {str(e)}"
+    finally:
+        # The SQL agent may have changed anything about the member, including
+        # the phone number, so drop every cached entry of this member.
+        member_info_cache.invalidate_phone(phone_number)
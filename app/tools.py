@@ -1,35 +1,42 @@
-import psycopg2
 from langchain.tools import tool
 from dotenv import load_dotenv
 import os
-from openai import OpenAI
+import json
+import random
+import re
+from datetime import date, time, timedelta
+from typing import Optional
+import psycopg2
 
 from datetime import datetime
-from shared import member_info_cache
+from time import sleep
+from shared import member_info_cache, provider_cache, availability_cache
+from cache import NOT_FOUND
+from db import get_pool, execute_prepared
+from queries import (
+    MEMBER_PROFILE_QUERY,
+    PROVIDER_QUERY,
+    NEARBY_AVAILABILITY_QUERY,
+    MEMBER_ADDRESS_QUERY,
+    OPEN_SLOT_QUERY,
+    OPEN_SLOT_EXISTS_QUERY,
+    CLAIM_SLOT_QUERY,
+    INSERT_APPOINTMENT_QUERY,
+    ACTIVE_APPOINTMENT_QUERY,
+    CANCEL_APPOINTMENT_QUERY,
+    RELEASE_SLOT_QUERY,
+    RELEASE_AVAILABILITY_QUERY,
+    INSERT_ESCALATION_QUERY,
+    member_update_query,
+)
 
 # Ensure environment variables are loaded
 load_dotenv()
 
-# Get the connection string from environment variables
-connection_string = os.getenv("DATABASE_URL")
-openai_api_key = os.getenv("OPENAI_API_KEY")
-
 
 def connect_to_db():
-    # Check if the connection string is not None before creating the database
-    if connection_string is not None:
-        conn = psycopg2.connect(connection_string)
-    else:
-        raise ValueError("DATABASE_URL environment variable is not set")
-    return conn
-
-
-# Check if the OpenAI API key is not None before creating the client
-if openai_api_key is not None:
-    client = OpenAI(api_key=openai_api_key)
-else:
-    raise ValueError("OPENAI_API_KEY environment variable is not set")
-
+    # Connections come from the shared pool; conn.close() returns them to it.
+    return get_pool().acquire()
 
 
 def get_member_information(phone_number: str) -> dict:
@@ -41,61 +48,82 @@ def get_member_information(phone_number: str) -> dict:
     Returns:
         str: information about the member's name, contact information, age, gender, medical conditions, past and future appointments.
     """
-    # Check if the member information is already in the cache and it is up to date
-    print(f"member_info_cache: {member_info_cache}")
-    if (
-        phone_number in member_info_cache
-        and member_info_cache[phone_number]["up_to_date"]
-    ):
-        member_information = member_info_cache[phone_number]["info"]
+    # Check if the member information is already in the cache
+    member_information = member_info_cache.get(phone_number)
+    if member_information == NOT_FOUND:
+        return member_not_found(phone_number)
+    if member_information is not None:
         return member_information
+
     conn = connect_to_db()
-    cur = conn.cursor()
+    try:
+        cur = conn.cursor()
+        fetched = _fetch_member_information(cur, phone_number)
+    finally:
+        conn.close()
+    if fetched is None:
+        member_info_cache.set_not_found(phone_number)
+        return member_not_found(phone_number)
+
+    # Update the cache with the member information
+    member_id, member_info, provider_ids = fetched
+    member_info_cache.set(phone_number, member_info, member_id, provider_ids)
+    return member_info
+
+
+def member_not_found(phone_number):
+    return f"No Member information was found for the phone number {phone_number}"
 
-    query = f"""
-    SELECT 
-        id, first_name, last_name, phone_number, 
-        date_of_birth, gender, street_address, city, 
-        state, zip_code, email
-    FROM members
-    WHERE phone_number = '{phone_number}'
-    """
 
-    cur.execute(query)
+def _fetch_member_information(cur, phone_number):
+    execute_prepared(cur, "member_profile", MEMBER_PROFILE_QUERY, (phone_number,))
     result = cur.fetchone()
 
     if not result:
-        return f"No Member information was found for the phone number {phone_number}"
-
-    member_id = result[0]
-    first_name = result[1]
-    last_name = result[2]
-    date_of_birth = str(result[4])
-    gender = result[5]
-    street_address = result[6]
-    city = result[7]
-    state = result[8]
-    zip_code = result[9]
-    email = result[10]
-
-    # find all the member's appointments
-    query = f"""
-    SELECT 
-        a.id, a.date, a.time, a.street_address, a.city, 
-        a.state, a.zip_code,  a.status,
-        p.first_name AS provider_first_name, p.last_name AS provider_last_name
-    FROM appointments a
-    JOIN providers p ON a.provider_id = p.id
-    WHERE a.member_phone = '{phone_number}'
-    ORDER BY a.date DESC, a.time DESC
+        return None
+
+    appointments = profile_appointments(result[11])
+    return (result[0], render_member_information(result, appointments),
+            appointment_provider_ids(appointments))
+
+
+def profile_appointments(appointments):
     """
-    cur.execute(query)
-    appointments = cur.fetchall()
-    conn.close()
+    Turn the JSON appointments column of MEMBER_PROFILE_QUERY into rows
+    with date and time values.
+    """
+    if isinstance(appointments, str):
+        appointments = json.loads(appointments)
+    return [
+        (row[0], date.fromisoformat(row[1]), time.fromisoformat(row[2]), *row[3:])
+        for row in appointments
+    ]
+
+
+def appointment_provider_ids(appointments):
+    """The ids of the providers of rows returned by profile_appointments()."""
+    return {appointment[10] for appointment in appointments}
+
+
+def render_member_information(member, appointments) -> str:
+    """
+    Format a member row of MEMBER_PROFILE_QUERY and its appointment rows, as
+    returned by profile_appointments(), into the text given to the agent.
+    """
+    member_id = member[0]
+    first_name = member[1]
+    last_name = member[2]
+    phone_number = member[3]
+    date_of_birth = str(member[4])
+    gender = member[5]
+    street_address = member[6]
+    city = member[7]
+    state = member[8]
+    zip_code = member[9]
+    email = member[10]
 
     appointment_descriptions = []
     for appointment in appointments:
-        print(f'appointment: {appointment}')
         appointment_id = appointment[0]
         appointment_date = appointment[1].strftime("%B %d, %Y")
         appointment_time = appointment[2].strftime("%I:%M %p")
@@ -107,8 +135,8 @@ def get_member_information(phone_number: str) -> dict:
         description += f"Status: {appointment_status}."
 
         appointment_descriptions.append(description)
-        if len(appointment_descriptions) == 0:
-            appointment_descriptions.append("No past or future appointments.")
+    if len(appointment_descriptions) == 0:
+        appointment_descriptions.append("No past or future appointments.")
 
     member_info = f"""
     Member ID: {member_id}
@@ -122,46 +150,128 @@ def get_member_information(phone_number: str) -> dict:
     Appointments:
     {chr(10).join(f"- {appointment}" for appointment in appointment_descriptions)}
     """
-    # Update the cache with the member information
-    member_info_cache[phone_number] = {"info": member_info, "up_to_date": True}
     return member_info
 
 
+def render_provider_information(result) -> str:
+    provider_info = f"""
+    Provider Information:
+    ID: {result[0]}
+    Name: Dr. {result[1]} {result[2]} ({result[9]})
+    Contact:
+        Phone: {result[3]}
+        Email: {result[4]}
+    Address: {result[5]}, {result[6]}, {result[7]} {result[8]}
+    Procedures: {result[10]}
+    """
+    return provider_info
+
+
 @tool
 def get_provider_information(provider_id: str) -> dict:
     """Get provider information based on their provider ID
     Args:
         provider_id: the id number of the provider
     """
+    provider_information = provider_cache.get(str(provider_id))
+    if provider_information is not None:
+        return provider_information
 
     conn = connect_to_db()
-    cur = conn.cursor()
-    query = f"""
-    SELECT 
-        id, first_name, last_name, phone_number, 
-        email, street_address, city, state, zip_code, degree, procedures
-    FROM providers
-    WHERE id = {provider_id}
-    """
-
-    cur.execute(query)
-    result = cur.fetchone()
-    conn.close()
+    try:
+        cur = conn.cursor()
+        execute_prepared(cur, "provider_information", PROVIDER_QUERY, (provider_id,))
+        result = cur.fetchone()
+    finally:
+        conn.close()
 
     if not result:
         return {"error": "Provider not found"}
 
-    provider_info = f"""
-    Provider Information:
-    ID: {result[0]}
-    Name: Dr. {result[1]} {result[2]} ({result[9]})
-    Contact:
-        Phone: {result[3]}
-        Email: {result[4]}
-    Address: {result[5]}, {result[6]}, {result[7]} {result[8]}
-    Procedures: {result[10]}
+    provider_information = render_provider_information(result)
+    provider_cache.set(str(provider_id), provider_information)
+    return provider_information
+
+
+# Open appointment times offered by get_availability
+AVAILABILITY_DAYS = int(os.getenv("AVAILABILITY_DAYS", "14"))
+AVAILABILITY_LIMIT = int(os.getenv("AVAILABILITY_LIMIT", "20"))
+
+
+def member_zip_prefix(member_information):
+    """Three digit zip code prefix of the member in rendered member information, or None."""
+    found = re.search(r"^\s*Address: .*\b(\d{3})\d{2}(-\d{4})?\s*$",
+                      member_information, re.MULTILINE)
+    return found.group(1) if found else None
+
+
+def availability_window(today=None):
+    today = today or date.today()
+    return today + timedelta(days=1), today + timedelta(days=AVAILABILITY_DAYS)
+
+
+def render_availability(rows, zip_prefix) -> str:
+    if not rows:
+        return (f"No open appointment times near zip code {zip_prefix}xx "
+                f"in the next {AVAILABILITY_DAYS} days.")
+    lines = [
+        f"- {row[6].strftime('%A, %B %d, %Y')} between {row[7].strftime('%I:%M %p')} "
+        f"and {row[8].strftime('%I:%M %p')} with Dr. {row[1]} {row[2]} ({row[3]}), "
+        f"{row[4]}, {row[5]}"
+        for row in rows
+    ]
+    return f"Open appointment times near zip code {zip_prefix}xx:\n" + "\n".join(lines)
+
+
+def fetch_availability(cur, zip_prefix) -> str:
+    """Render the open times near zip_prefix and cache them."""
+    start, end = availability_window()
+    cur.execute(NEARBY_AVAILABILITY_QUERY, (f"{zip_prefix}%", start, end, AVAILABILITY_LIMIT))
+    availability = render_availability(cur.fetchall(), zip_prefix)
+    availability_cache.set(zip_prefix, availability)
+    return availability
+
+
+@tool
+def get_availability(member_phone: str) -> str:
+    """Get the open appointment times with providers near the member over the next two weeks.
+    Use it to offer the member times before scheduling an appointment.
+    Args:
+        member_phone: the phone number of the member
     """
-    return provider_info
+    member_information = get_member_information(member_phone)
+    zip_prefix = member_zip_prefix(member_information)
+    if zip_prefix is None:
+        return "Error: Member not found with the given phone number."
+    availability = availability_cache.get(zip_prefix)
+    if availability is not None:
+        return availability
+
+    conn = connect_to_db()
+    try:
+        return fetch_availability(conn.cursor(), zip_prefix)
+    finally:
+        conn.close()
+
+
+# Booking attempts before giving up on a slot contended by other callers,
+# and the pause between attempts while slots are held by in-flight bookings.
+BOOKING_MAX_ATTEMPTS = int(os.getenv("BOOKING_MAX_ATTEMPTS", "5"))
+BOOKING_RETRY_DELAY = float(os.getenv("BOOKING_RETRY_DELAY", "0.05"))
+
+SLOT_FULLY_BOOKED = (
+    "Error: No provider available at the specified date and time. "
+    "Every provider is fully booked then, please offer the member another time."
+)
+SLOT_BUSY = (
+    "Error: The remaining providers at the specified date and time are being "
+    "booked by other callers. Please try again in a moment or offer another time."
+)
+
+
+def booking_retry_delay(attempt: int) -> float:
+    """Backoff before booking attempt number attempt + 1, with jitter."""
+    return BOOKING_RETRY_DELAY * (attempt + 1) * (0.5 + random.random())
 
 
 @tool
@@ -178,91 +288,74 @@ def schedule_appointment(
     Returns:
         str: A confirmation message for the scheduled appointment.
     """
-    # update the member_info_cache
-    if member_phone in member_info_cache:
-        member_info_cache[member_phone]["up_to_date"] = False
     conn = connect_to_db()
     cur = conn.cursor()
 
     try:
         # Get member information
-        member_query = """
-        SELECT id, street_address, city, state, zip_code
-        FROM members
-        WHERE phone_number = %s
-        """
-        cur.execute(member_query, (member_phone,))
+        cur.execute(MEMBER_ADDRESS_QUERY, (member_phone,))
         member_result = cur.fetchone()
+        conn.commit()
 
         if not member_result:
             return "Error: Member not found with the given phone number."
 
         member_id, street_address, city, state, zip_code = member_result
 
-        # Find an available provider
-        availability_query = """
-        SELECT provider_id 
-        FROM availability 
-        WHERE date = %s
-        AND %s::time >= start_time 
-        AND %s::time < end_time
-        AND status = 'available'
-        LIMIT 1
-        """
-
-        cur.execute(
-            availability_query, (appointment_date, appointment_time, appointment_time)
-        )
-        availability_result = cur.fetchone()
-
-        if not availability_result:
-            return "Error: No provider available at the specified date and time."
-
-        provider_id = availability_result[0]
-        # update the provider availability to unavailable
-        update_availability_query = """
-        UPDATE availability
-        SET status = 'unavailable'
-        WHERE provider_id = %s
-        AND date = %s
-        AND %s::time >= start_time 
-        AND %s::time < end_time
-        """
-        print(f'update_availability_query: {update_availability_query}')
-        cur.execute(
-            update_availability_query,
-            (provider_id, appointment_date, appointment_time, appointment_time),
-        )
-        if cur.rowcount == 0:
-            conn.rollback()
-            return "Error: Failed to update provider availability."
-
-        # Insert the appointment
-        insert_query = """
-        INSERT INTO appointments (
-            member_id, provider_id, member_phone, date, time,
-            street_address, city, state, zip_code, status
-        )
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 'scheduled')
-        RETURNING id
-        """
-        cur.execute(
-            insert_query,
-            (
-                member_id,
-                provider_id,
-                member_phone,
-                appointment_date,
-                appointment_time,
-                street_address,
-                city,
-                state,
-                zip_code,
-            ),
-        )
-        appointment_id = cur.fetchone()[0]
-        conn.commit()
-        return f"Appointment scheduled successfully. Appointment ID: {appointment_id}"
+        # Slots that turned out to be taken despite being marked available
+        taken = []
+        for attempt in range(BOOKING_MAX_ATTEMPTS):
+            # Lock a free slot, skipping the ones concurrent bookings hold
+            cur.execute(
+                OPEN_SLOT_QUERY,
+                (appointment_date, appointment_time, appointment_time, taken),
+            )
+            slot = cur.fetchone()
+
+            if not slot:
+                conn.rollback()
+                cur.execute(
+                    OPEN_SLOT_EXISTS_QUERY,
+                    (appointment_date, appointment_time, appointment_time),
+                )
+                still_open = cur.fetchone()[0]
+                conn.rollback()
+                if not still_open:
+                    return SLOT_FULLY_BOOKED
+                # The open slots are locked by bookings that may still roll back
+                sleep(booking_retry_delay(attempt))
+                continue
+
+            slot_id, provider_id = slot
+            cur.execute(CLAIM_SLOT_QUERY, (slot_id,))
+
+            try:
+                cur.execute(
+                    INSERT_APPOINTMENT_QUERY,
+                    (
+                        member_id,
+                        provider_id,
+                        member_phone,
+                        appointment_date,
+                        appointment_time,
+                        street_address,
+                        city,
+                        state,
+                        zip_code,
+                        slot_id,
+                    ),
+                )
+            except psycopg2.errors.UniqueViolation:
+                # A scheduled appointment already holds this slot
+                conn.rollback()
+                taken.append(slot_id)
+                continue
+
+            appointment_id = cur.fetchone()[0]
+            conn.commit()
+            return f"Appointment scheduled successfully. Appointment ID: {appointment_id}"
+
+        return SLOT_BUSY
 
     except Exception as e:
         conn.rollback()
@@ -270,6 +363,8 @@ def schedule_appointment(
 
     finally:
         conn.close()
+        # The member's appointments changed, drop the cached information
+        member_info_cache.invalidate_phone(member_phone)
 
 
 @tool
@@ -283,55 +378,34 @@ def cancel_appointment(appointment_id: int, phone_number: str) -> str:
     Returns:
     str: confirmation of the cancelled appointment
     """
-    # update the member_info_cache
-    if phone_number in member_info_cache:
-        member_info_cache[phone_number]["up_to_date"] = False
     conn = connect_to_db()
     cur = conn.cursor()
 
     try:
         # First, get the appointment details
-        cur.execute(
-            """
-            SELECT provider_id, date, time
-            FROM appointments
-            WHERE id = %s AND status != 'cancelled'
-        """,
-            (appointment_id,),
-        )
+        cur.execute(ACTIVE_APPOINTMENT_QUERY, (appointment_id,))
 
         appointment = cur.fetchone()
         if not appointment:
             return f"Error: Appointment with ID {appointment_id} not found or already cancelled."
 
-        provider_id, appointment_date, appointment_time = appointment
+        provider_id, appointment_date, appointment_time, slot_id = appointment
 
         # Update the appointment status to 'cancelled'
-        cur.execute(
-            """
-            UPDATE appointments
-            SET status = 'cancelled'
-            WHERE id = %s
-        """,
-            (appointment_id,),
-        )
+        cur.execute(CANCEL_APPOINTMENT_QUERY, (appointment_id,))
 
         if cur.rowcount == 0:
             conn.rollback()
             return f"Error: Failed to cancel appointment with ID {appointment_id}."
 
         # Update the provider's availability back to 'available'
-        cur.execute(
-            """
-            UPDATE availability
-            SET status = 'available'
-            WHERE provider_id = %s
-            AND date = %s
-            AND %s::time >= start_time 
-            AND %s::time < end_time
-        """,
-            (provider_id, appointment_date, appointment_time, appointment_time),
-        )
+        if slot_id is not None:
+            cur.execute(RELEASE_SLOT_QUERY, (slot_id,))
+        else:
+            cur.execute(
+                RELEASE_AVAILABILITY_QUERY,
+                (provider_id, appointment_date, appointment_time, appointment_time),
+            )
 
         # Add this check
         if cur.rowcount == 0:
@@ -347,6 +421,8 @@ def cancel_appointment(appointment_id: int, phone_number: str) -> str:
 
     finally:
         conn.close()
+        # The member's appointments changed, drop the cached information
+        member_info_cache.invalidate_phone(phone_number)
 
 
 @tool
@@ -367,10 +443,7 @@ def escalate_call(phone_number, description):
     try:
         current_time = datetime.now()
         cur.execute(
-            """
-            INSERT INTO escalations (phone_number, status, description, created_at)
-            VALUES (%s, %s, %s, %s)
-        """,
+            INSERT_ESCALATION_QUERY,
             (phone_number, "escalated", description, current_time),
         )
 
@@ -387,3 +460,121 @@ def escalate_call(phone_number, description):
 
     finally:
         conn.close()
+
+
+_MEMBER_FIELD_PATTERNS = {
+    "email": (re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$"), "a valid email address"),
+    "state": (re.compile(r"^[A-Z]{2}$"), "a two-letter state code"),
+    "zip_code": (re.compile(r"^\d{5}(-\d{4})?$"), "a 5 digit zip code"),
+    "phone_number": (re.compile(r"^\d{3}-\d{3}-\d{4}$"), "formatted as XXX-XXX-XXXX"),
+}
+_MEMBER_FIELD_LENGTHS = {"email": 100, "street_address": 200, "city": 50}
+MEMBER_GENDERS = ("Male", "Female", "Other")
+
+
+def validate_member_update(**fields):
+    """
+    Normalize and validate new values for members columns. Fields that are
+    None are left out. Returns (changes, errors).
+    """
+    changes = {}
+    errors = []
+    for column, value in fields.items():
+        if value is None:
+            continue
+        value = value.strip()
+        if column == "state":
+            value = value.upper()
+        elif column == "gender":
+            value = value.capitalize()
+        elif column == "email":
+            value = value.lower()
+
+        pattern = _MEMBER_FIELD_PATTERNS.get(column)
+        if pattern is not None and not pattern[0].match(value):
+            errors.append(f"{column} must be {pattern[1]}, got '{value}'")
+        elif column == "gender" and value not in MEMBER_GENDERS:
+            errors.append(f"gender must be one of {', '.join(MEMBER_GENDERS)}")
+        elif not value:
+            errors.append(f"{column} cannot be empty")
+        elif len(value) > _MEMBER_FIELD_LENGTHS.get(column, 200):
+            errors.append(f"{column} is too long")
+        else:
+            changes[column] = value
+    return changes, errors
+
+
+def describe_member_update(changes) -> str:
+    return ", ".join(f"{column.replace('_', ' ')} to {value}" for column, value in changes.items())
+
+
+@tool
+def update_member_information(
+    phone_number: str,
+    email: Optional[str] = None,
+    street_address: Optional[str] = None,
+    city: Optional[str] = None,
+    state: Optional[str] = None,
+    zip_code: Optional[str] = None,
+    new_phone_number: Optional[str] = None,
+    gender: Optional[str] = None,
+) -> str:
+    """
+    Update the member's contact information or demographics. Only pass the fields that change.
+    Args:
+        phone_number (str): The member's current phone number, formatted as XXX-XXX-XXXX
+        email (str): New email address
+        street_address (str): New street address, e.g. 123 Main St
+        city (str): New city
+        state (str): New two-letter state code, e.g. NY
+        zip_code (str): New 5 digit zip code
+        new_phone_number (str): New phone number, formatted as XXX-XXX-XXXX
+        gender (str): Male, Female or Other
+
+    Returns:
+        str: confirmation of the update or the reason it was not made.
+    """
+    changes, errors = validate_member_update(
+        email=email,
+        street_address=street_address,
+        city=city,
+        state=state,
+        zip_code=zip_code,
+        phone_number=new_phone_number,
+        gender=gender,
+    )
+    if errors:
+        return "Error: " + "; ".join(errors)
+    if not changes:
+        return "Error: No changes were given."
+
+    conn = connect_to_db()
+    cur = conn.cursor()
+
+    try:
+        cur.execute(
+            member_update_query(list(changes)),
+            (*changes.values(), phone_number),
+        )
+        result = cur.fetchone()
+        if not result:
+            conn.rollback()
+            return "Error: Member not found with the given phone number."
+
+        conn.commit()
+        return f"Member information updated: {describe_member_update(changes)}."
+
+    except psycopg2.errors.UniqueViolation:
+        conn.rollback()
+        return "Error: That email address or phone number is already used by another member."
+
+    except Exception as e:
+        conn.rollback()
+        return f"Error updating member information: {str(e)}"
+
+    finally:
+        conn.close()
+        member_info_cache.invalidate_phone(phone_number)
+        if "phone_number" in changes:
+            # The new number may be cached as not belonging to any member
+            member_info_cache.invalidate_phone(changes["phone_number"])
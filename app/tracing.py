@@ -0,0 +1,359 @@
+"""
+Per-request tracing: nested, timed spans written as JSON lines.
+
+A turn of a call opens a root span with request(); the work it does opens
+spans nested under it: each agent step, LLM call (with its token counts),
+tool call and SQL statement (with its row count). Spans are written, one JSON
+object per line, to TRACE_PATH by a background thread, so a turn never waits
+on the file.
+
+Only TRACE_SAMPLE_RATE of the requests are traced; the decision is made once
+per request, and the others only pay for a context variable lookup per span.
+The request id comes from the X-Request-ID header when there is one.
+
+    {"trace_id": ..., "span_id": ..., "parent_id": ..., "name": "tool",
+     "start": 1760779920.12, "duration_ms": 12.4, "status": "ok",
+     "attributes": {"tool": "schedule_appointment"}}
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+TRACE_PATH = os.getenv("TRACE_PATH", "traces/spans.jsonl")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+
+# The request being served, and whether it is traced
+_request_id = contextvars.ContextVar("request_id", default=None)
+_trace = contextvars.ContextVar("trace", default=None)
+# The innermost open span of the traced request
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+def new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def set_request_id(request_id):
+    _request_id.set(request_id)
+
+
+def request_id():
+    return _request_id.get()
+
+
+def sampled() -> bool:
+    return _trace.get() is not None
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_id()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.status = "ok"
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._parent = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error):
+        self.status = "error"
+        self.attributes["error"] = f"{type(error).__name__}: {error}"[:300]
+
+    def end(self, duration=None):
+        if duration is None:
+            duration = time.perf_counter() - self._started
+        _exporter.export({
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(duration * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        })
+
+    def __enter__(self):
+        self._parent = _current.get()
+        _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            self.fail(exc)
+        # Set rather than reset a token: a span opened in a generator may be
+        # closed from another context
+        _current.set(self._parent)
+        self.end()
+        return False
+
+
+class _NoopSpan:
+    """Stands in for spans of requests that are not traced."""
+
+    def set(self, **attributes):
+        pass
+
+    def fail(self, error):
+        pass
+
+    def end(self, duration=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP = _NoopSpan()
+
+
+def start_span(name, parent=None, **attributes):
+    """A span of the traced request, not made current; end it with span.end()."""
+    trace_id = _trace.get()
+    if trace_id is None:
+        return NOOP
+    if parent is None:
+        parent = _current.get()
+    return Span(name, trace_id, parent.span_id if parent else None, attributes)
+
+
+def span(name, **attributes):
+    """Context manager timing the block as a span nested in the current one."""
+    return start_span(name, **attributes)
+
+
+def record(name, duration, **attributes):
+    """A span for work that has already finished and took duration seconds."""
+    s = start_span(name, **attributes)
+    if s is not NOOP:
+        s.start -= duration
+        if attributes.get("error"):
+            s.status = "error"
+        s.end(duration)
+
+
+class request:
+    """
+    Root span of a request. Decides whether the request is traced and, if it
+    is, makes the spans opened inside it part of its trace.
+    """
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.span = NOOP
+        self._reset = None
+
+    def __enter__(self):
+        rid = _request_id.get() or new_id()
+        if _trace.get() is not None or random.random() >= TRACE_SAMPLE_RATE:
+            # Nested in a traced request (it becomes a span of it), or not traced
+            self.span = start_span(self.name, **self.attributes)
+            return self.span.__enter__()
+        self._reset = (_request_id.set(rid), _trace.set(rid), _current.set(None))
+        self.span = Span(self.name, rid, None, dict(self.attributes))
+        return self.span.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.__exit__(exc_type, exc, tb)
+        if self._reset is not None:
+            request_token, trace_token, current_token = self._reset
+            _current.reset(current_token)
+            _trace.reset(trace_token)
+            _request_id.reset(request_token)
+        return False
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement(query) -> str:
+    """A SQL statement as recorded in spans: on one line, at most 200 characters."""
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    return _WHITESPACE.sub(" ", str(query)).strip()[:200]
+
+
+def record_query(logged):
+    """asyncpg query logger, see Connection.add_query_logger."""
+    if not sampled():
+        return
+    attributes = {"statement": statement(logged.query)}
+    if logged.exception is not None:
+        attributes["error"] = f"{type(logged.exception).__name__}: {logged.exception}"[:300]
+    record("sql", logged.elapsed, **attributes)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Spans for the LLM and tool calls LangChain makes during a traced request."""
+
+    # Run in the caller's context, so tool spans become the current span of the tool
+    run_inline = True
+
+    def __init__(self):
+        self._spans = {}
+
+    def _start(self, run_id, name, current=False, **attributes):
+        s = start_span(name, **attributes)
+        if s is not NOOP:
+            if current:
+                s.__enter__()
+            self._spans[run_id] = (s, current)
+
+    def _end(self, run_id, error=None, **attributes):
+        entry = self._spans.pop(run_id, None)
+        if entry is None:
+            return
+        s, current = entry
+        s.set(**attributes)
+        if error is not None:
+            s.fail(error)
+        if current:
+            _current.set(s._parent)
+        s.end()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        self._start(run_id, "llm", model=params.get("model") or params.get("model_name"),
+                    messages=sum(len(batch) for batch in messages))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        self._start(run_id, "llm", model=params.get("model") or params.get("model_name"))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id, **token_counts(response))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, "tool", current=True, tool=serialized.get("name"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+
+def token_counts(response) -> dict:
+    """Prompt, completion and cached prompt tokens of an LLMResult."""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                details = usage.get("input_token_details") or {}
+                return {
+                    "prompt_tokens": usage.get("input_tokens", 0),
+                    "completion_tokens": usage.get("output_tokens", 0),
+                    "cached_tokens": details.get("cache_read", 0),
+                }
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return {
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+        }
+    return {}
+
+
+def callbacks(existing=None):
+    """existing callbacks, plus the tracing handler when the current request is traced."""
+    existing = list(existing or [])
+    if sampled():
+        existing.append(TracingCallbackHandler())
+    return existing
+
+
+class Exporter:
+    """Writes finished spans to a JSON lines file from a background thread."""
+
+    def __init__(self, path, maxsize=10000):
+        self.path = path
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+
+    def export(self, span):
+        self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            # Never slow the request down for its trace
+            self.dropped += 1
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                batch = [self._queue.get()]
+                while not self._queue.empty() and len(batch) < 500:
+                    batch.append(self._queue.get_nowait())
+                try:
+                    f.write("".join(json.dumps(s, default=str) + "\n" for s in batch))
+                    f.flush()
+                    self.exported += len(batch)
+                except Exception as e:
+                    logging.error(f"Could not write trace spans: {e}")
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+
+    def flush(self, timeout=2.0):
+        """Wait, up to timeout seconds, for the queued spans to be written."""
+        deadline = time.monotonic() + timeout
+        while self._thread is not None and self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "sample_rate": TRACE_SAMPLE_RATE,
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+        }
+
+
+_exporter = Exporter(TRACE_PATH, TRACE_QUEUE_SIZE)
+atexit.register(_exporter.flush)
+
+
+def stats():
+    return _exporter.stats()
@@ -0,0 +1,173 @@
+# booking_stress.py
+"""
+Hammers one appointment slot with concurrent schedule_appointment calls and
+checks that every open provider is booked exactly once: as many bookings
+succeed as there are providers free at that time, the others are told the
+slot is fully booked, and no slot or provider ends up with two appointments.
+
+The slot is created on a far-future date for a few providers and removed
+afterwards. Needs DATABASE_URL and the schema migrations applied.
+
+    python bench/booking_stress.py --threads 50 --providers 3
+    python bench/booking_stress.py --threads 50 --providers 3 --async
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+
+def set_up_slot(conn, day, providers):
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM providers ORDER BY id LIMIT %s", (providers,))
+        provider_ids = [row[0] for row in cur.fetchall()]
+        if len(provider_ids) < providers:
+            sys.exit(f"Need {providers} providers, found {len(provider_ids)}")
+        cur.execute("SELECT phone_number FROM members ORDER BY id LIMIT 1")
+        row = cur.fetchone()
+        if row is None:
+            sys.exit("Need at least one member")
+        for provider_id in provider_ids:
+            cur.execute(
+                """
+                INSERT INTO availability (provider_id, date, start_time, end_time, status)
+                VALUES (%s, %s, '09:00', '12:00', 'available')
+                """,
+                (provider_id, day),
+            )
+    conn.commit()
+    return row[0]
+
+
+def tear_down_slot(conn, day):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM appointments WHERE date = %s", (day,))
+        cur.execute("DELETE FROM availability WHERE date = %s", (day,))
+    conn.commit()
+
+
+def run_threads(phone, day, threads):
+    import tools
+
+    barrier = threading.Barrier(threads)
+    results = [None] * threads
+
+    def book(i):
+        barrier.wait()
+        results[i] = tools.schedule_appointment.func(phone, day, "10:00")
+
+    workers = [threading.Thread(target=book, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def run_tasks(phone, day, tasks):
+    import async_tools
+    from async_db import close_async_pool
+
+    async def main():
+        try:
+            return await asyncio.gather(
+                *(async_tools.aschedule_appointment(phone, day, "10:00")
+                  for _ in range(tasks))
+            )
+        finally:
+            await close_async_pool()
+
+    return asyncio.run(main())
+
+
+def check(conn, day, results, providers):
+    failures = []
+    booked = [r for r in results if r.startswith("Appointment scheduled successfully")]
+    outcomes = Counter(r.split(".")[0] for r in results)
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT availability_id, provider_id FROM appointments
+            WHERE date = %s AND status = 'scheduled'
+            """,
+            (day,),
+        )
+        appointments = cur.fetchall()
+        cur.execute(
+            "SELECT count(*) FROM availability WHERE date = %s AND status = 'available'",
+            (day,),
+        )
+        still_open = cur.fetchone()[0]
+    conn.rollback()
+
+    slots = Counter(a[0] for a in appointments)
+    provider_bookings = Counter(a[1] for a in appointments)
+    if len(booked) != providers:
+        failures.append(f"{len(booked)} bookings succeeded, expected {providers}")
+    if len(appointments) != providers:
+        failures.append(f"{len(appointments)} appointments stored, expected {providers}")
+    if any(count > 1 for count in slots.values()):
+        failures.append(f"slot booked more than once: {dict(slots)}")
+    if any(count > 1 for count in provider_bookings.values()):
+        failures.append(f"provider double-booked: {dict(provider_bookings)}")
+    if still_open:
+        failures.append(f"{still_open} slot(s) left open")
+    return outcomes, failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=50,
+                        help="Concurrent bookings for the same slot")
+    parser.add_argument("--providers", type=int, default=3,
+                        help="Providers free at that time")
+    parser.add_argument("--date", default="2099-01-05",
+                        help="Date of the test slot, must have no other availability")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Book through the asyncpg tools instead of threads")
+    parser.add_argument("--rounds", type=int, default=1)
+    args = parser.parse_args()
+
+    # Enough connections for every booking to be in flight at once
+    os.environ.setdefault("DB_POOL_MAX", str(args.threads + 1))
+    os.environ.setdefault("DB_POOL_TIMEOUT", "30")
+
+    from db import get_pool
+
+    failed = False
+    with get_pool().connection() as conn:
+        for round_number in range(1, args.rounds + 1):
+            tear_down_slot(conn, args.date)
+            phone = set_up_slot(conn, args.date, args.providers)
+            start = time.perf_counter()
+            try:
+                if args.use_async:
+                    results = run_tasks(phone, args.date, args.threads)
+                else:
+                    results = run_threads(phone, args.date, args.threads)
+                elapsed = time.perf_counter() - start
+                outcomes, failures = check(conn, args.date, results, args.providers)
+            finally:
+                tear_down_slot(conn, args.date)
+
+            print(f"Round {round_number}: {args.threads} bookings in {elapsed:.2f}s")
+            for outcome, count in outcomes.most_common():
+                print(f"  {count:4d}  {outcome}")
+            for failure in failures:
+                print(f"  FAIL {failure}")
+            failed = failed or bool(failures)
+
+    if failed:
+        sys.exit(1)
+    print("OK: every open slot was booked exactly once.")
+
+
+if __name__ == "__main__":
+    main()
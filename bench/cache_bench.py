@@ -0,0 +1,143 @@
+# cache_bench.py
+"""
+Compares the in-process member cache with the SQLite one shared by worker
+processes (MEMBER_CACHE_BACKEND=sqlite):
+
+  - latency of a hit, a miss, a store and an invalidation in one process,
+  - the hit rate of --workers processes looking up the same members, each
+    with its own cache or all sharing one, and
+  - that an invalidation made by one process is seen by another on its next
+    lookup (fails otherwise).
+
+Needs no database: entries are made up, of the size of a member profile.
+
+    python bench/cache_bench.py --ops 20000 --workers 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from cache import MemberInfoCache
+from sqlite_cache import SQLiteMemberInfoCache
+
+INFO = "Member ID: {id}\nFirst Name: John\nLast Name: Smith\n" + "Appointments:\n" + (
+    "- Appointment ID 7: Appointment on May 02, 2030 at 10:00 AM. Status: Scheduled.\n" * 5)
+
+
+def phone(i):
+    return f"555-{i // 10000:03d}-{i % 10000:04d}"
+
+
+def make_cache(backend, path):
+    if backend == "sqlite":
+        return SQLiteMemberInfoCache(path)
+    return MemberInfoCache()
+
+
+def timed(ops, action):
+    samples = []
+    for i in range(ops):
+        start = time.perf_counter()
+        action(i)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples
+
+
+def report(name, samples):
+    print(f"  {name:<14} median {statistics.median(samples) * 1e6:8.1f} us   "
+          f"p99 {samples[int(len(samples) * 0.99)] * 1e6:8.1f} us")
+
+
+def latency(backend, path, ops, members):
+    cache = make_cache(backend, path)
+    for i in range(members):
+        cache.set(phone(i), INFO.format(id=i), i)
+    print(f"{backend}:")
+    report("hit", timed(ops, lambda i: cache.get(phone(i % members))))
+    report("miss", timed(ops, lambda i: cache.get(phone(members + i))))
+    report("store", timed(ops, lambda i: cache.set(phone(i % members), INFO.format(id=i), i)))
+    report("invalidate", timed(ops, lambda i: cache.invalidate_phone(phone(i % members))))
+
+
+def worker(backend, path, members, lookups, seed, results):
+    cache = make_cache(backend, path)
+    rng = random.Random(seed)
+    hits = 0
+    for _ in range(lookups):
+        i = rng.randrange(members)
+        if cache.get(phone(i)) is not None:
+            hits += 1
+        else:
+            # What get_member_information does after querying the database
+            cache.set(phone(i), INFO.format(id=i), i)
+    results.put(hits)
+
+
+def hit_rate(backend, path, workers, members, lookups):
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker,
+                                args=(backend, path, members, lookups, seed, results))
+        for seed in range(workers)
+    ]
+    for p in processes:
+        p.start()
+    hits = sum(results.get() for _ in processes)
+    for p in processes:
+        p.join()
+    return hits / (workers * lookups)
+
+
+def invalidate_in_child(path, phone_number):
+    SQLiteMemberInfoCache(path).invalidate_phone(phone_number)
+
+
+def check_visibility(path):
+    cache = SQLiteMemberInfoCache(path)
+    cache.set("555-000-0001", INFO.format(id=1), 1)
+    cache.set("555-000-0002", INFO.format(id=1), 1)
+    child = multiprocessing.Process(target=invalidate_in_child, args=(path, "555-000-0001"))
+    child.start()
+    child.join()
+    stale = [p for p in ("555-000-0001", "555-000-0002") if cache.get(p) is not None]
+    if stale:
+        print(f"FAIL invalidation in another process left {stale} cached")
+        sys.exit(1)
+    print("Invalidation in another process is seen, for every phone of the member")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lookups", type=int, default=2000, help="Lookups per worker")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Latency over {args.ops} operations, {args.members} members cached:")
+        for backend in ("memory", "sqlite"):
+            latency(backend, os.path.join(directory, "latency.sqlite3"), args.ops, args.members)
+
+        print(f"\nHit rate of {args.workers} workers, {args.lookups} lookups each "
+              f"over {args.members} members:")
+        for backend in ("memory", "sqlite"):
+            rate = hit_rate(backend, os.path.join(directory, "hit_rate.sqlite3"),
+                            args.workers, args.members, args.lookups)
+            print(f"  {backend:<14} {rate:.1%}")
+
+        print()
+        check_visibility(os.path.join(directory, "visibility.sqlite3"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# load_gen.py
+"""
+Replays scripted multi-turn calls concurrently against /run_agent and reports
+throughput and latency percentiles per scenario turn and per tool. Run it
+against the Flask or the ASGI server pointed at stub_llm.py, whose default
+script answers the scenarios below with the matching tool calls:
+
+    python bench/stub_llm.py --latency 0.3
+    OPENAI_BASE_URL=http://localhost:8000/v1 python app/app.py --server asgi
+    python bench/load_gen.py --calls 500 --concurrency 200
+
+Each call comes from its own member's phone number, read from DATABASE_URL
+(the members are reused once there are fewer members than calls), so the
+calls exercise the member caches and sessions as distinct callers would.
+--phone sets the numbers to call from instead.
+
+Per-tool latency is measured by the stub, from sending a tool call to
+receiving its result, and read from its /stats endpoint (--stub-url).
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+APP_DIR = os.path.join(os.path.dirname(__file__), "..", "app")
+
+GREETING = "Hello, thank you for calling our health center. Can you verify your name? "
+VERIFY = "Hi, this is John Smith."
+GOODBYE = "Thank you, goodbye."
+
+SCENARIOS = {
+    "verify_name": [VERIFY, GOODBYE],
+    "faq": [
+        VERIFY,
+        "Will I be charged for the health evaluation?",
+        "How long does the evaluation take?",
+        GOODBYE,
+    ],
+    "reschedule": [
+        VERIFY,
+        "I need to reschedule my appointment to next week.",
+        GOODBYE,
+    ],
+    "cancel": [VERIFY, "Please cancel my upcoming appointment.", GOODBYE],
+    "escalate": [
+        VERIFY,
+        "This is the third time I called, I want to talk to a supervisor.",
+        GOODBYE,
+    ],
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summary(values):
+    return (f"n {len(values):5d}  "
+            f"p50 {percentile(values, 50) * 1000:6.0f}ms  "
+            f"p95 {percentile(values, 95) * 1000:6.0f}ms  "
+            f"p99 {percentile(values, 99) * 1000:6.0f}ms")
+
+
+def member_phones(count):
+    """Phone numbers of up to count members, one per simulated call."""
+    sys.path.insert(0, APP_DIR)
+    from db import get_pool
+
+    conn = get_pool().acquire()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT phone_number FROM members ORDER BY id LIMIT %s", (count,))
+            phones = [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+    if not phones:
+        sys.exit("Need at least one member, or --phone")
+    return phones
+
+
+def run_call(url, phone_number, scenario):
+    """Play one call, returning the latency of each turn."""
+    session = httpx.Client(timeout=120)
+    call_id = str(uuid.uuid4())
+    transcript = [GREETING]
+    latencies = []
+    try:
+        for utterance in SCENARIOS[scenario]:
+            transcript.append(utterance)
+            start = time.perf_counter()
+            response = session.post(
+                f"{url}/run_agent",
+                json={"phone_number": phone_number, "call_id": call_id,
+                      "transcript": transcript},
+            )
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+            transcript.append(response.json()["result"])
+    finally:
+        session.post(f"{url}/call/end",
+                     json={"phone_number": phone_number, "call_id": call_id})
+        session.close()
+    return latencies
+
+
+def stub_stats(stub_url, reset=False):
+    try:
+        if reset:
+            httpx.post(f"{stub_url}/stats/reset", timeout=5)
+            return None
+        return httpx.get(f"{stub_url}/stats", timeout=5).json()
+    except httpx.HTTPError as e:
+        print(f"Could not reach the stub LLM at {stub_url}: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:5001")
+    parser.add_argument("--stub-url", default="http://localhost:8000",
+                        help="Stub LLM to read per-tool latency from ('' to skip)")
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--scenario", action="append", default=[],
+                        choices=sorted(SCENARIOS),
+                        help="Scenario to play (repeatable, default: all, in turn)")
+    parser.add_argument("--phone", action="append", default=[],
+                        help="Member phone number to call from (repeatable, "
+                             "default: one member per call)")
+    args = parser.parse_args()
+    phones = args.phone or member_phones(args.calls)
+    scenarios = args.scenario or list(SCENARIOS)
+
+    if args.stub_url:
+        stub_stats(args.stub_url, reset=True)
+
+    start = time.perf_counter()
+    turns = {}
+    errors = 0
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        futures = []
+        for i in range(args.calls):
+            scenario = scenarios[i % len(scenarios)]
+            future = executor.submit(run_call, args.url, phones[i % len(phones)], scenario)
+            futures.append((scenario, future))
+        for scenario, future in futures:
+            try:
+                for turn, latency in enumerate(future.result(), 1):
+                    turns.setdefault((scenario, turn), []).append(latency)
+            except Exception as e:
+                errors += 1
+                print(f"Call failed ({scenario}): {e}")
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for values in turns.values() for latency in values]
+    print(f"Calls: {args.calls}  concurrency: {args.concurrency}  errors: {errors}")
+    print(f"Throughput: {(args.calls - errors) / elapsed:.1f} calls/s, "
+          f"{len(latencies) / elapsed:.1f} turns/s over {elapsed:.2f}s")
+    if not latencies:
+        return
+    print(f"\nAll turns            {summary(latencies)}")
+    print("\nPer turn")
+    for (scenario, turn), values in sorted(turns.items()):
+        utterance = SCENARIOS[scenario][turn - 1]
+        print(f"  {scenario:12s} #{turn}  {summary(values)}  {utterance[:40]!r}")
+
+    stats = stub_stats(args.stub_url) if args.stub_url else None
+    if stats:
+        print(f"\nPer tool (LLM requests: {stats['requests']}, "
+              f"tool calls: {stats['tool_calls']}, unanswered: {stats['pending']})")
+        for name, values in sorted(stats["tools"].items()):
+            print(f"  {name:22s} {summary(values)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# prompt_prefix.py
+"""
+Checks that the agent's requests share a byte-identical prefix, so the
+provider's prompt cache can serve it, and reports how many tokens of each
+turn can come from the cache.
+
+Builds the chat completion payloads the agent would send for a few members
+over several turns, without calling the LLM, and fails if:
+  - the tool schemas and the static instructions are not a common prefix of
+    every request, whatever the member and the time, or
+  - a turn does not start with the whole previous turn of the same call
+    (static part and conversation), with only the per-turn context after it.
+
+Needs the same environment as the app (DATABASE_URL, OPENAI_API_KEY).
+
+    python bench/prompt_prefix.py
+"""
+
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+import agent
+from prompts import STATIC_INSTRUCTIONS, CALL_CONTEXT
+
+MEMBERS = [
+    ("215-932-4488", "Member ID: 1\nFirst Name: John\nLast Name: Smith\nAppointments:\n"
+     "- Appointment ID 7: Appointment on May 02, 2030 at 10:00 AM. Status: Scheduled."),
+    ("555-123-4567", "Member ID: 2\nFirst Name: Jane\nLast Name: Johnson\n"
+     "Appointments: No past or future appointments"),
+    ("312-555-0199", "Member ID: 3\nFirst Name: Carlos\nLast Name: Garcia\nAppointments:\n"
+     "- Appointment ID 12: Appointment on June 11, 2030 at 01:30 PM. Status: Cancelled."),
+]
+TURNS = [
+    "Hi, this is the member calling.",
+    "Will I be charged for the health evaluation?",
+    "Can I move my appointment to next week?",
+    "Thank you, goodbye.",
+]
+GREETING = "Hello, thank you for calling our health center. Can you verify your name? "
+
+
+def count_tokens():
+    try:
+        import tiktoken
+
+        encoding = tiktoken.encoding_for_model("gpt-4o-mini")
+        return lambda text: len(encoding.encode(text)), "tokens"
+    except Exception:
+        # No encoding files offline: about four characters per token
+        print("tiktoken encoding unavailable, estimating 4 characters per token")
+        return lambda text: len(text) // 4, "~tokens"
+
+
+def serialize(payload):
+    """Request in the order the provider caches it: tool schemas, then messages."""
+    parts = [json.dumps(payload.get("tools", []), sort_keys=True)]
+    parts.extend(json.dumps(message, sort_keys=True) for message in payload["messages"])
+    return parts
+
+
+def legacy_messages(history, utterance, context):
+    """The layout before the split: the per-turn context inside the first system message."""
+    return [SystemMessage(content=STATIC_INSTRUCTIONS + "\n" + context), *history,
+            HumanMessage(content=utterance)]
+
+
+def common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return a[:n]
+
+
+def build_calls(lc_agent, tools, legacy=False):
+    """{phone: [serialized request parts per turn]} for every member."""
+    calls = {}
+    start = datetime(2030, 4, 1, 9, 0)
+    for m, (phone, member_information) in enumerate(MEMBERS):
+        history = [AIMessage(content=GREETING)]
+        requests = []
+        for turn, utterance in enumerate(TURNS):
+            now = start + timedelta(minutes=7 * m + 3 * turn)
+            inputs = lc_agent._inputs(history, utterance, member_information)
+            inputs["current_time"] = now.strftime("%A, %B %d, %I:%M%p")
+            if legacy:
+                messages = legacy_messages(
+                    history, utterance,
+                    CALL_CONTEXT.format(faq=inputs["faq"],
+                                        current_time=inputs["current_time"],
+                                        member_information=member_information),
+                )
+            else:
+                messages = lc_agent.prompt.format_messages(**inputs, agent_scratchpad=[])
+            payload = agent.llm._get_request_payload(messages, tools=tools)
+            requests.append(serialize(payload))
+            history = history + [HumanMessage(content=utterance),
+                                 AIMessage(content=f"Answer to turn {turn + 1}.")]
+        calls[phone] = requests
+    return calls
+
+
+def cached_share(calls, tokens):
+    """Tokens of each turn equal to a prefix of the previous turn of the call."""
+    cached = total = 0
+    for requests in calls.values():
+        for previous, current in zip(requests, requests[1:]):
+            shared = "".join(common_prefix(previous, current))
+            cached += tokens(shared)
+            total += tokens("".join(current))
+    return cached, total
+
+
+def main():
+    tokens, unit = count_tokens()
+    lc_agent = agent.LangChainAgent(MEMBERS[0][0])
+    tools = [convert_to_openai_tool(tool) for tool in lc_agent.tools]
+
+    calls = build_calls(lc_agent, tools)
+    failures = []
+
+    # 1. Tools and static instructions are shared by every request
+    every_request = [request for requests in calls.values() for request in requests]
+    shared = every_request[0]
+    for request in every_request[1:]:
+        shared = common_prefix(shared, request)
+    static_parts = every_request[0][:2]
+    if shared[:2] != static_parts or json.loads(static_parts[1])["content"] != STATIC_INSTRUCTIONS:
+        failures.append("tool schemas and static instructions are not a common prefix "
+                        "of every request")
+
+    # 2. Each turn extends the previous one; only the per-turn context follows
+    for phone, requests in calls.items():
+        for turn, (previous, current) in enumerate(zip(requests, requests[1:]), 2):
+            history_end = len(previous) - 2  # previous minus its context and utterance
+            if current[:history_end] != previous[:history_end]:
+                failures.append(f"{phone} turn {turn} does not start with turn {turn - 1}")
+
+    static_tokens = tokens("".join(static_parts))
+    cached, total = cached_share(calls, tokens)
+    legacy_cached, legacy_total = cached_share(build_calls(lc_agent, tools, legacy=True), tokens)
+
+    print(f"Static prefix: {static_tokens:,} {unit} "
+          f"(tools {tokens(static_parts[0]):,}, instructions {tokens(static_parts[1]):,})")
+    print(f"Prefix shared by all {len(every_request)} requests: {tokens(''.join(shared)):,} {unit}")
+    print(f"Turns 2+ served from the previous turn's prefix: {cached:,}/{total:,} {unit} "
+          f"({cached / total:.0%})")
+    print(f"Same turns with the per-turn context in the first system message: "
+          f"{legacy_cached:,}/{legacy_total:,} {unit} ({legacy_cached / legacy_total:.0%})")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK: prompt prefix is stable across members and turns.")
+
+
+if __name__ == "__main__":
+    main()
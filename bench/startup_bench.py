@@ -0,0 +1,141 @@
+# startup_bench.py
+"""
+Measures how long a fresh server process takes to become useful.
+
+Each run starts a new Python process and reports:
+  - import: importing the Flask app module (agent, tools, caches...),
+  - first turn: the first /run_agent request, answered from the FAQ, so it
+    covers the lazily opened connection pool and the agent's construction
+    but not the LLM,
+  - first agent turn (with --stub-url): the first request needing the LLM,
+  - SQL agent: building the update_databse agent, with no schema snapshot
+    (cold) and with the snapshot the cold run saved (warm).
+
+With --dead-db the import is also timed with DATABASE_URL pointing at a
+closed port, to check that a database outage does not stop the process.
+
+Needs the same environment as the app (DATABASE_URL, OPENAI_API_KEY).
+
+    python bench/startup_bench.py --runs 5
+    python bench/startup_bench.py --runs 5 --stub-url http://127.0.0.1:8000/v1 --dead-db
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+import app
+result = {"import": time.perf_counter() - start}
+if sys.argv[1] == "import":
+    print(json.dumps(result))
+    sys.exit()
+client = app.app.test_client()
+start = time.perf_counter()
+response = client.post("/run_agent", json={
+    "phone_number": sys.argv[2],
+    "transcript": ["Hello", "Will I be charged for the health evaluation?"],
+})
+assert response.status_code == 200, response.status_code
+result["first turn"] = time.perf_counter() - start
+if sys.argv[3] == "agent":
+    start = time.perf_counter()
+    response = client.post("/run_agent", json={
+        "phone_number": sys.argv[2],
+        "transcript": ["Hello", "Can you tell me about my next visit?"],
+    })
+    assert response.status_code == 200, response.status_code
+    result["first agent turn"] = time.perf_counter() - start
+import tool_agents
+start = time.perf_counter()
+tool_agents.get_sql_agent()
+result["sql agent"] = time.perf_counter() - start
+print(json.dumps(result))
+"""
+
+
+def run_child(env, *args):
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD, *args],
+        cwd=APP_DIR, env=env, capture_output=True, text=True, timeout=300,
+    )
+    if completed.returncode != 0:
+        return None, completed.stderr.strip().splitlines()[-1:] or ["failed"]
+    return json.loads(completed.stdout.strip().splitlines()[-1]), None
+
+
+def any_phone():
+    sys.path.insert(0, APP_DIR)
+    from db import get_pool
+
+    conn = get_pool().acquire()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT phone_number FROM members ORDER BY id LIMIT 1")
+            row = cur.fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        sys.exit("Need at least one member")
+    return row[0]
+
+
+def report(name, values):
+    if not values:
+        return
+    print(f"  {name:<22} median {statistics.median(values) * 1000:8.1f} ms   "
+          f"min {min(values) * 1000:8.1f} ms   max {max(values) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--stub-url", default=None,
+                        help="OpenAI compatible URL (e.g. the stub LLM) for the agent turn")
+    parser.add_argument("--dead-db", action="store_true",
+                        help="Also import with the database unreachable")
+    args = parser.parse_args()
+
+    phone = any_phone()
+    env = dict(os.environ, TRACE_SAMPLE_RATE="0")
+    if args.stub_url:
+        env["OPENAI_BASE_URL"] = args.stub_url
+    mode = "agent" if args.stub_url else "faq"
+
+    results = {}
+    for run in range(args.runs):
+        with tempfile.TemporaryDirectory() as snapshots:
+            run_env = dict(env, SCHEMA_SNAPSHOT_DIR=snapshots)
+            cold, error = run_child(run_env, "turns", phone, mode)
+            if error:
+                sys.exit(f"Run {run + 1} failed: {error[0]}")
+            warm, error = run_child(run_env, "turns", phone, mode)
+            if error:
+                sys.exit(f"Run {run + 1} failed: {error[0]}")
+        for name, value in cold.items():
+            results.setdefault(name if name != "sql agent" else "sql agent (cold)", []).append(value)
+        results.setdefault("sql agent (snapshot)", []).append(warm["sql agent"])
+
+    print(f"Startup over {args.runs} runs:")
+    for name, values in results.items():
+        report(name, values)
+
+    if args.dead_db:
+        dead_env = dict(env, DATABASE_URL="postgresql://nobody@127.0.0.1:1/none")
+        result, error = run_child(dead_env, "import")
+        if error:
+            print(f"FAIL import with the database down: {error[0]}")
+            sys.exit(1)
+        report("import (db down)", [result["import"]])
+
+
+if __name__ == "__main__":
+    main()
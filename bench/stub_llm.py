@@ -0,0 +1,354 @@
+# stub_llm.py
+"""
+Local stand-in for the OpenAI chat completions API, for benchmarking the app
+without network calls or API cost.
+
+    python bench/stub_llm.py --port 8000 --latency 0.5
+    OPENAI_BASE_URL=http://localhost:8000/v1 python app/app.py --server asgi
+
+Replies follow a tool-call script: the first rule whose pattern matches the
+caller's last message answers with its steps of tool calls, one step per
+request, then with its reply once the tool results come back. Messages no
+rule matches get the plain --reply. A script is a JSON list of rules like
+DEFAULT_SCRIPT, passed with --script.
+
+Tool call arguments may use these placeholders:
+    {phone_number}    the member phone number from the system prompt
+    {appointment_id}  the newest appointment id seen in a tool result, or
+                      else the first scheduled appointment in the prompt
+    {date+N}          the date N days from today, YYYY-MM-DD
+
+The time from sending a tool call to receiving its result is the latency
+of the tool as seen by the agent; GET /stats reports it per tool, and
+POST /stats/reset clears it.
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "Thank you. Is there anything else I can help you with today?"
+
+DEFAULT_SCRIPT = [
+    {
+        "match": r"\breschedul",
+        "steps": [
+            [{"name": "cancel_appointment",
+              "arguments": {"appointment_id": "{appointment_id}",
+                            "phone_number": "{phone_number}"}}],
+            [{"name": "schedule_appointment",
+              "arguments": {"member_phone": "{phone_number}",
+                            "appointment_date": "{date+7}",
+                            "appointment_time": "10:00"}}],
+        ],
+        "reply": "Your appointment has been moved to next week at 10 AM. "
+                 "Is there anything else I can help you with?",
+    },
+    {
+        "match": r"\bcancel",
+        "steps": [
+            [{"name": "cancel_appointment",
+              "arguments": {"appointment_id": "{appointment_id}",
+                            "phone_number": "{phone_number}"}}],
+        ],
+        "reply": "Your appointment has been cancelled. Is there anything else I can help you with?",
+    },
+    {
+        "match": r"\b(book|schedule)",
+        "steps": [
+            [{"name": "schedule_appointment",
+              "arguments": {"member_phone": "{phone_number}",
+                            "appointment_date": "{date+3}",
+                            "appointment_time": "10:00"}}],
+        ],
+        "reply": "You are booked for 10 AM. Is there anything else I can help you with?",
+    },
+    {
+        "match": r"\b(supervisor|manager|complain)",
+        "steps": [
+            [{"name": "escalate_call",
+              "arguments": {"phone_number": "{phone_number}",
+                            "description": "Member asked for a supervisor."}}],
+        ],
+        "reply": "I have asked a supervisor to call you back today. Is there anything else?",
+    },
+]
+
+
+class ToolStats:
+    """Latency of each tool call, from sending it to receiving its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.pending = {}
+            self.latencies = {}
+            self.requests = 0
+            self.tool_calls = 0
+
+    def request(self):
+        with self._lock:
+            self.requests += 1
+
+    def sent(self, call_id, name):
+        with self._lock:
+            self.tool_calls += 1
+            self.pending[call_id] = (name, time.monotonic())
+
+    def received(self, call_id):
+        with self._lock:
+            entry = self.pending.pop(call_id, None)
+            if entry is not None:
+                name, sent_at = entry
+                self.latencies.setdefault(name, []).append(time.monotonic() - sent_at)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "tool_calls": self.tool_calls,
+                "pending": len(self.pending),
+                "tools": {name: list(values) for name, values in self.latencies.items()},
+            }
+
+
+def _text(message):
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def _fill(value, messages):
+    if not isinstance(value, str):
+        return value
+
+    def replace(match):
+        name = match.group(1)
+        if name == "phone_number":
+            for message in messages:
+                if message.get("role") == "system":
+                    found = re.search(r"Phone Number: *(\S+)", _text(message))
+                    if found:
+                        return found.group(1)
+            return "555-000-0000"
+        if name == "appointment_id":
+            for message in reversed(messages):
+                if message.get("role") == "tool":
+                    found = re.search(r"Appointment ID:? *(\d+)", _text(message))
+                    if found:
+                        return found.group(1)
+            for message in messages:
+                if message.get("role") == "system":
+                    found = re.search(
+                        r"Appointment ID (\d+):[^\n]*Status: Scheduled", _text(message)
+                    )
+                    if found:
+                        return found.group(1)
+            return "0"
+        days = int(name[len("date"):] or 0)
+        return (date.today() + timedelta(days=days)).isoformat()
+
+    return re.sub(r"\{(phone_number|appointment_id|date(?:[+-]\d+)?)\}", replace, value)
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+    script = DEFAULT_SCRIPT
+    stats = ToolStats()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/models"):
+            self._send_json({"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model"}]})
+        elif path.endswith("/stats"):
+            self._send_json(self.stats.snapshot())
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        if path.endswith("/stats/reset"):
+            self.stats.reset()
+            self._send_json({"status": "reset"})
+            return
+        if not path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(raw or b"{}")
+        messages = body.get("messages", [])
+        self.stats.request()
+        for message in messages:
+            if message.get("role") == "tool":
+                self.stats.received(message.get("tool_call_id"))
+
+        content, tool_calls = self._respond(messages)
+        time.sleep(self.config.latency)
+        if body.get("stream"):
+            self._stream(body, content, tool_calls)
+        else:
+            self._send_json(self._completion(body, content, tool_calls))
+        for call in tool_calls:
+            self.stats.sent(call["id"], call["function"]["name"])
+
+    def _respond(self, messages):
+        """The (content, tool_calls) answering messages, following the script."""
+        last_user = max(
+            (i for i, m in enumerate(messages) if m.get("role") == "user"), default=None
+        )
+        if last_user is None:
+            return self.config.reply, []
+        utterance = _text(messages[last_user])
+        for rule in self.script:
+            if re.search(rule["match"], utterance, re.IGNORECASE):
+                break
+        else:
+            return self.config.reply, []
+
+        # One step of tool calls per request, then the reply
+        done = sum(
+            1 for m in messages[last_user + 1:]
+            if m.get("role") == "assistant" and m.get("tool_calls")
+        )
+        steps = rule.get("steps", [])
+        if done >= len(steps):
+            return rule.get("reply", self.config.reply), []
+        tool_calls = []
+        for call in steps[done]:
+            arguments = {k: _fill(v, messages) for k, v in call.get("arguments", {}).items()}
+            tool_calls.append({
+                "id": f"call_{uuid.uuid4().hex[:24]}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(arguments)},
+            })
+        return None, tool_calls
+
+    def _completion(self, body, content, tool_calls):
+        tokens = len((content or "").split()) + 20 * len(tool_calls)
+        message = {"role": "assistant", "content": content}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": "tool_calls" if tool_calls else "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": 0,
+                "completion_tokens": tokens,
+                "total_tokens": tokens,
+            },
+        }
+
+    def _stream(self, body, content, tool_calls):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        delay = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second else 0
+        if tool_calls:
+            delta = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [dict(call, index=i) for i, call in enumerate(tool_calls)],
+            }
+            self._chunk(completion_id, body, delta, None)
+            time.sleep(delay * 20 * len(tool_calls))
+            self._chunk(completion_id, body, {}, "tool_calls")
+        else:
+            words = content.split(" ")
+            for i, word in enumerate(words):
+                token = word if i == 0 else " " + word
+                self._chunk(completion_id, body, {"content": token}, None)
+                time.sleep(delay)
+            self._chunk(completion_id, body, {}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            # Final chunk with the usage, as the API sends it
+            tokens = len((content or "").split()) + 20 * len(tool_calls)
+            prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4o-mini"),
+                "choices": [],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": tokens,
+                    "total_tokens": prompt_tokens + tokens,
+                },
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _chunk(self, completion_id, body, delta, finish_reason):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5,
+                        help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0,
+                        help="Token rate of streamed responses (0 for no delay)")
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    parser.add_argument("--script", default=None,
+                        help="JSON file of tool-call rules replacing the default script")
+    args = parser.parse_args()
+
+    StubLLMHandler.config = args
+    if args.script:
+        with open(args.script) as f:
+            StubLLMHandler.script = json.load(f)
+    server = ThreadingHTTPServer((args.host, args.port), StubLLMHandler)
+    server.daemon_threads = True
+    print(f"Stub LLM listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 # client.py
+import argparse
+import json
 import requests
+import uuid
 
 from datetime import datetime
 
@@ -13,6 +16,9 @@ transcript = [
 ]
 
 url = "http://localhost:5001/run_agent"
+ws_url = "ws://localhost:5001/call"
+phone_number = '215-932-4488'
+call_id = str(uuid.uuid4())
 
 
 def get_user_input():
@@ -21,22 +27,95 @@ def get_user_input():
 
 def get_ai_response(transcript):
     response = requests.post(
-        url, json={"phone_number": '215-932-4488', "transcript": transcript}
+        url,
+        json={"phone_number": phone_number, "call_id": call_id,
+              "transcript": transcript},
     )
     return response.json()["result"]
 
 
-print("AI: " + transcript[-1])
-
-while True:
-    user_input = get_user_input()
-    transcript.append(user_input)
-
-    ai_response = get_ai_response(transcript)
-    transcript.append(ai_response)
-
-    print("AI: " + ai_response)
-
-    if "goodbye" in user_input.lower() or "bye" in user_input.lower():
-        print("Call ended. Thank you for using our service!")
-        break
+def run_http_call():
+    print("AI: " + transcript[-1])
+
+    while True:
+        user_input = get_user_input()
+        transcript.append(user_input)
+
+        ai_response = get_ai_response(transcript)
+        transcript.append(ai_response)
+
+        print("AI: " + ai_response)
+
+        if "goodbye" in user_input.lower() or "bye" in user_input.lower():
+            requests.post("http://localhost:5001/call/end",
+                          json={"phone_number": phone_number, "call_id": call_id})
+            print("Call ended. Thank you for using our service!")
+            break
+
+
+def run_websocket_call():
+    # Only the new utterance is sent each turn; the server keeps the transcript
+    # and the client's copy only tells whether an utterance was recorded.
+    from websockets.exceptions import ConnectionClosed
+    from websockets.sync.client import connect
+
+    def open_call(call_id=None):
+        ws = connect(ws_url)
+        if call_id is not None:
+            ws.send(json.dumps({"type": "resume", "call_id": call_id,
+                                "phone_number": phone_number}))
+        else:
+            ws.send(json.dumps({"type": "start", "phone_number": phone_number,
+                                "greeting": transcript[0]}))
+        reply = json.loads(ws.recv())
+        if reply["type"] == "error":
+            raise RuntimeError(reply["message"])
+        return ws, reply
+
+    # The server gives the call its id
+    ws, started = open_call()
+    ws_call_id = started["call_id"]
+    print("AI: " + transcript[0])
+
+    while True:
+        user_input = get_user_input()
+        while True:
+            try:
+                ws.send(json.dumps({"type": "utterance", "text": user_input}))
+                while True:
+                    event = json.loads(ws.recv())
+                    if event["type"] in ("response", "error"):
+                        break
+                break
+            except ConnectionClosed:
+                print("Connection lost, resuming the call...")
+                ws, resumed = open_call(ws_call_id)
+                if resumed["turns"] > len(transcript):
+                    # The server answered before the connection dropped:
+                    # sending the utterance again would answer it twice
+                    event = {"type": "response", "text": resumed["last_response"]}
+                    break
+
+        if event["type"] == "error":
+            print("Error: " + event["message"])
+        else:
+            transcript.extend([user_input, event["text"]])
+            print("AI: " + event["text"])
+
+        if "goodbye" in user_input.lower() or "bye" in user_input.lower():
+            ws.send(json.dumps({"type": "end"}))
+            ws.close()
+            print("Call ended. Thank you for using our service!")
+            break
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ws', action='store_true',
+                        help='Use the WebSocket call endpoint (ASGI server only)')
+    args = parser.parse_args()
+
+    if args.ws:
+        run_websocket_call()
+    else:
+        run_http_call()
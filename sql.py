@@ -1,4 +1,8 @@
+import argparse
+import functools
+import io
 import os
+import sys
 import psycopg2
 from psycopg2 import sql
 from dotenv import load_dotenv
@@ -470,15 +474,361 @@ def insert_escalations_records():
             print("Escalation records inserted successfully.")
 
 
+def apply_migrations():
+    """
+    Bring the freshly created tables up to the latest schema version
+    (indexes and later changes) with the migrations in app/migrations.py.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
+    import migrations
+
+    conn = psycopg2.connect(connection_string)
+    try:
+        migrations.upgrade(conn)
+    finally:
+        conn.close()
 
 
-# Call the function
-if __name__ == "__main__":
+# ---------------------------------------------------------------------------
+# Synthetic data generator
+#
+#   python sql.py generate --members 1000000 --providers 2000 --seed 7
+#
+# Recreates the tables and loads production-sized data with COPY. Every row
+# is derived from the seed and its own index, so a member or provider is the
+# same whatever the batch size or the total count, and two runs with the same
+# arguments produce the same database.
+# ---------------------------------------------------------------------------
+
+GEN_FIRST_NAMES = [
+    ('James', 33), ('Mary', 30), ('Robert', 30), ('Patricia', 25), ('John', 32),
+    ('Jennifer', 24), ('Michael', 31), ('Linda', 22), ('David', 28), ('Elizabeth', 21),
+    ('William', 27), ('Barbara', 19), ('Richard', 18), ('Susan', 17), ('Joseph', 17),
+    ('Jessica', 16), ('Thomas', 15), ('Sarah', 15), ('Carlos', 10), ('Maria', 14),
+    ('Daniel', 14), ('Karen', 13), ('Wei', 6), ('Emily', 12), ('Anthony', 11),
+    ('Nancy', 11), ('Mark', 10), ('Lisa', 10), ('Jose', 9), ('Emma', 9),
+    ('Kevin', 8), ('Sandra', 8), ('Brian', 8), ('Ashley', 8), ('Priya', 4),
+    ('Ahmed', 4), ('Olivia', 7), ('Noah', 7), ('Sophia', 6), ('Liam', 6),
+]
+GEN_LAST_NAMES = [
+    ('Smith', 24), ('Johnson', 19), ('Williams', 16), ('Brown', 14), ('Jones', 14),
+    ('Garcia', 11), ('Miller', 11), ('Davis', 10), ('Rodriguez', 10), ('Martinez', 10),
+    ('Hernandez', 9), ('Lopez', 8), ('Gonzalez', 8), ('Wilson', 8), ('Anderson', 8),
+    ('Thomas', 7), ('Taylor', 7), ('Moore', 7), ('Jackson', 7), ('Martin', 7),
+    ('Lee', 6), ('Perez', 6), ('Thompson', 6), ('White', 6), ('Harris', 6),
+    ('Nguyen', 5), ('Clark', 5), ('Lewis', 5), ('Robinson', 5), ('Walker', 5),
+    ('Patel', 4), ('Kim', 4), ('Chen', 4), ('Wright', 4), ('Scott', 4),
+]
+# (city, state, area code, 3-digit zip prefix, population weight)
+GEN_LOCATIONS = [
+    ('New York', 'NY', '212', '100', 83), ('Los Angeles', 'CA', '213', '900', 39),
+    ('Chicago', 'IL', '312', '606', 27), ('Houston', 'TX', '713', '770', 23),
+    ('Phoenix', 'AZ', '602', '850', 16), ('Philadelphia', 'PA', '215', '191', 16),
+    ('San Antonio', 'TX', '210', '782', 15), ('San Diego', 'CA', '619', '921', 14),
+    ('Dallas', 'TX', '214', '752', 13), ('San Jose', 'CA', '408', '951', 10),
+    ('Austin', 'TX', '512', '787', 10), ('Jacksonville', 'FL', '904', '322', 9),
+    ('Columbus', 'OH', '614', '432', 9), ('Charlotte', 'NC', '704', '282', 9),
+    ('Indianapolis', 'IN', '317', '462', 9), ('Seattle', 'WA', '206', '981', 7),
+    ('Denver', 'CO', '303', '802', 7), ('Boston', 'MA', '617', '021', 7),
+    ('Nashville', 'TN', '615', '372', 7), ('Miami', 'FL', '305', '331', 4),
+    ('Atlanta', 'GA', '404', '303', 5), ('Portland', 'OR', '503', '972', 6),
+    ('Minneapolis', 'MN', '612', '554', 4), ('Albany', 'NY', '518', '122', 1),
+    ('Yonkers', 'NY', '914', '107', 2), ('Fresno', 'CA', '559', '937', 5),
+]
+GEN_STREETS = ['Main St', 'Oak Ave', 'Maple Dr', 'Cedar Ln', 'Pine St', 'Elm St',
+               'Washington Ave', 'Lake Rd', 'Hill St', 'Park Blvd', 'Sunset Blvd',
+               'River Rd', 'Church St', 'Highland Ave', 'Broadway']
+GEN_PROCEDURES = ['blood_work', 'vision_test', 'mental_health_eval']
+# Morning and afternoon slots, as in insert_availability_records
+GEN_SLOTS = [('09:00:00', '12:00:00'), ('12:00:00', '17:00:00')]
+
+
+def _weighted(pairs):
+    values = [value for value, _ in pairs]
+    cumulative = []
+    total = 0
+    for _, weight in pairs:
+        total += weight
+        cumulative.append(total)
+    return values, cumulative
+
+
+_FIRST_NAMES = _weighted(GEN_FIRST_NAMES)
+_LAST_NAMES = _weighted(GEN_LAST_NAMES)
+_LOCATIONS = _weighted([(location, location[4]) for location in GEN_LOCATIONS])
+
+
+def _pick(rng, weighted):
+    values, cumulative = weighted
+    return rng.choices(values, cum_weights=cumulative)[0]
+
+
+def _unique_number(index, salt):
+    """A distinct 7-digit number for each index below ten million."""
+    # 7_654_321 is coprime with 10**7, so this is a permutation of 0..10**7-1
+    return (index * 7_654_321 + salt) % 10_000_000
+
+
+def _phone(area_code, index, salt):
+    number = _unique_number(index, salt)
+    return f"{area_code}-{number // 10000:03d}-{number % 10000:04d}"
+
+
+def generate_member(seed, member_id, today):
+    rng = random.Random(f"{seed}:member:{member_id}")
+    first_name = _pick(rng, _FIRST_NAMES)
+    last_name = _pick(rng, _LAST_NAMES)
+    city, state, area_code, zip_prefix, _ = _pick(rng, _LOCATIONS)
+    # Members skew older, as in a health plan population
+    age_days = int(rng.triangular(18, 95, 67) * 365.25)
+    return (
+        member_id,
+        first_name,
+        last_name,
+        _phone(area_code, member_id, 1_000),
+        today - timedelta(days=age_days),
+        'Female' if rng.random() < 0.52 else 'Male',
+        f"{rng.randint(1, 9999)} {rng.choice(GEN_STREETS)}",
+        city,
+        state,
+        f"{zip_prefix}{rng.randint(0, 99):02d}",
+        f"{first_name.lower()}.{last_name.lower()}.{member_id}@example.com",
+    )
+
+
+def generate_provider(seed, provider_id, today):
+    rng = random.Random(f"{seed}:provider:{provider_id}")
+    first_name = _pick(rng, _FIRST_NAMES)
+    last_name = _pick(rng, _LAST_NAMES)
+    city, state, _, zip_prefix, _ = _pick(rng, _LOCATIONS)
+    age_days = int(rng.uniform(30, 70) * 365.25)
+    return (
+        provider_id,
+        first_name,
+        last_name,
+        # 555 is not a real area code, so provider phones never match a member
+        _phone('555', provider_id, 2_000),
+        today - timedelta(days=age_days),
+        rng.choice(['Female', 'Male']),
+        f"{rng.randint(1, 9999)} Medical Ave",
+        city,
+        state,
+        f"{zip_prefix}{rng.randint(0, 99):02d}",
+        f"{first_name.lower()}.{last_name.lower()}.{provider_id}@medprovider.com",
+        'MD' if rng.random() < 0.6 else 'NP',
+        '{' + ','.join(rng.sample(GEN_PROCEDURES, rng.randint(1, 3))) + '}',
+    )
+
+
+def generate_schedule(seed, provider_id, first_day, last_day, today, members,
+                      utilization):
+    """
+    Yield (slot, booking) for each availability slot of a provider, where
+    booking is None or (member_id, time, status). Providers work weekdays and
+    take the odd day off; past slots are booked more often than future ones,
+    which fill up as the date gets closer.
+    """
+    rng = random.Random(f"{seed}:schedule:{provider_id}")
+    day = first_day
+    while day <= last_day:
+        if day.weekday() < 5 and rng.random() >= 0.08:
+            for start, end in GEN_SLOTS:
+                days_ahead = (day - today).days
+                if days_ahead < 0:
+                    chance = utilization
+                else:
+                    chance = utilization * max(0.15, 1 - days_ahead / 60)
+                booking = None
+                if rng.random() < chance:
+                    # A few members make most of the appointments
+                    member_id = 1 + int(members * rng.random() ** 2.5)
+                    hour = rng.randint(int(start[:2]), int(end[:2]) - 1)
+                    time_of_day = f"{hour:02d}:{rng.choice(['00', '30'])}:00"
+                    cancelled = rng.random() < 0.12
+                    if days_ahead < 0:
+                        status = 'cancelled' if cancelled else 'completed'
+                    else:
+                        status = 'cancelled' if cancelled else 'scheduled'
+                    booking = (member_id, time_of_day, status)
+                yield (day, start, end), booking
+        day += timedelta(days=1)
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n'))
+
+
+def copy_rows(conn, table, columns, rows, total, batch_size):
+    """Load rows into table with one COPY per batch, reporting progress."""
+    copy_sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    loaded = 0
+    start = datetime.now()
+    rows = iter(rows)
+    while True:
+        buffer = io.StringIO()
+        count = 0
+        for row in rows:
+            buffer.write('\t'.join(_copy_value(value) for value in row))
+            buffer.write('\n')
+            count += 1
+            if count == batch_size:
+                break
+        if count == 0:
+            break
+        buffer.seek(0)
+        with conn.cursor() as cur:
+            cur.copy_expert(copy_sql, buffer)
+        conn.commit()
+        loaded += count
+        elapsed = (datetime.now() - start).total_seconds() or 1e-9
+        progress = f"{loaded:,}/{total:,}" if total else f"{loaded:,}"
+        print(f"  {table}: {progress} rows ({loaded / elapsed:,.0f} rows/s)", flush=True)
+    return loaded
+
+
+def set_user_triggers(conn, enabled):
+    """Enable or disable the triggers added by migrations on the generated tables."""
+    with conn.cursor() as cur:
+        for table in ['members', 'providers', 'availability', 'appointments']:
+            cur.execute(
+                sql.SQL("ALTER TABLE {} {} TRIGGER USER").format(
+                    sql.Identifier(table), sql.SQL('ENABLE' if enabled else 'DISABLE')))
+    conn.commit()
+
+
+def generate(members=100_000, providers=500, days_back=365, days_ahead=60,
+             utilization=0.6, escalations=None, seed=42, batch_size=50_000,
+             today=None):
+    if members >= 10_000_000 or providers >= 10_000_000:
+        raise ValueError("The generator supports fewer than 10 million members and providers")
+    today = today or datetime.now().date()
+    first_day = today - timedelta(days=days_back)
+    last_day = today + timedelta(days=days_ahead)
+    if escalations is None:
+        escalations = members // 200
+
+    for table in ['appointments', 'providers', 'members', 'availability',
+                  'escalations', 'schema_migrations']:
+        delete_table(table)
+    create_members_table()
+    create_providers_table()
+    create_appointments_table()
+    create_availability_table()
+    create_escalations_table()
+    # Migrations add the slot ids the appointments refer to
+    apply_migrations()
+
+    conn = psycopg2.connect(connection_string)
+    try:
+        # The cache invalidation triggers would send a notification per loaded row
+        set_user_triggers(conn, False)
+        print(f"Generating {members:,} members and {providers:,} providers "
+              f"from {first_day} to {last_day} (seed {seed})")
+        copy_rows(
+            conn, 'members',
+            ['id', 'first_name', 'last_name', 'phone_number', 'date_of_birth',
+             'gender', 'street_address', 'city', 'state', 'zip_code', 'email'],
+            (generate_member(seed, i, today) for i in range(1, members + 1)),
+            members, batch_size,
+        )
+        copy_rows(
+            conn, 'providers',
+            ['id', 'first_name', 'last_name', 'phone_number', 'date_of_birth',
+             'gender', 'street_address', 'city', 'state', 'zip_code', 'email',
+             'degree', 'procedures'],
+            (generate_provider(seed, i, today) for i in range(1, providers + 1)),
+            providers, batch_size,
+        )
+
+        def schedules():
+            """(slot id, slot, booking) of every provider, with ids assigned in order."""
+            slot_id = 0
+            for provider_id in range(1, providers + 1):
+                for slot, booking in generate_schedule(
+                        seed, provider_id, first_day, last_day, today, members,
+                        utilization):
+                    slot_id += 1
+                    yield provider_id, slot_id, slot, booking
+
+        def availability_rows():
+            for provider_id, slot_id, (day, start, end), booking in schedules():
+                taken = booking is not None and booking[2] != 'cancelled'
+                status = 'unavailable' if taken else 'available'
+                yield slot_id, provider_id, day, start, end, status
+
+        # Appointments keep coming back to the same frequent callers
+        member_record = functools.lru_cache(maxsize=100_000)(generate_member)
+
+        def appointment_rows():
+            appointment_id = 0
+            for provider_id, slot_id, (day, _, _), booking in schedules():
+                if booking is None:
+                    continue
+                member_id, time_of_day, status = booking
+                member = member_record(seed, member_id, today)
+                appointment_id += 1
+                yield (appointment_id, member_id, provider_id, member[3], day,
+                       time_of_day, member[6], member[7], member[8], member[9],
+                       slot_id, status)
+
+        copy_rows(
+            conn, 'availability',
+            ['id', 'provider_id', 'date', 'start_time', 'end_time', 'status'],
+            availability_rows(), None, batch_size,
+        )
+        copy_rows(
+            conn, 'appointments',
+            ['id', 'member_id', 'provider_id', 'member_phone', 'date', 'time',
+             'street_address', 'city', 'state', 'zip_code', 'availability_id',
+             'status'],
+            appointment_rows(), None, batch_size,
+        )
+
+        escalation_rng = random.Random(f"{seed}:escalations")
+        descriptions = ['Member requested supervisor to call back.',
+                        'Member expressed dissatisfaction with service.',
+                        'Billing question the agent could not answer.',
+                        'Member asked to speak with a nurse.']
+        step = max(1, members // max(1, escalations))
+        copy_rows(
+            conn, 'escalations', ['phone_number', 'status', 'description'],
+            ((generate_member(seed, member_id, today)[3],
+              escalation_rng.choice(['escalated', 'de_escalated']),
+              escalation_rng.choice(descriptions))
+             for member_id in range(1, members + 1, step)),
+            min(escalations, members), batch_size,
+        )
+
+        with conn.cursor() as cur:
+            # Rows were loaded with explicit ids, move the sequences past them
+            for table in ['members', 'providers', 'availability', 'appointments']:
+                cur.execute(
+                    sql.SQL("SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                            "COALESCE((SELECT max(id) FROM {}), 0) + 1, false)")
+                    .format(sql.Identifier(table)),
+                    (table,),
+                )
+        conn.commit()
+        set_user_triggers(conn, True)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE")
+        print("Synthetic data generated.")
+    finally:
+        conn.close()
+
+
+def seed():
+    """The original small sample dataset."""
     delete_table('appointments')
     delete_table('providers')
     delete_table('members')
     delete_table('availability')
     delete_table('escalations')
+    delete_table('schema_migrations')
     create_members_table()
     insert_members_records()
     create_providers_table()
@@ -489,3 +839,45 @@ if __name__ == "__main__":
     insert_availability_records()
     create_escalations_table()
     insert_escalations_records()
+    apply_migrations()
+
+
+# Call the function
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create the tables and load sample data (the default) or "
+                    "generate a large synthetic dataset.")
+    parser.add_argument("command", nargs="?", default="seed",
+                        choices=["seed", "generate"])
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--providers", type=int, default=500)
+    parser.add_argument("--days-back", type=int, default=365,
+                        help="Days of past availability and appointments")
+    parser.add_argument("--days-ahead", type=int, default=60,
+                        help="Days of future availability")
+    parser.add_argument("--utilization", type=float, default=0.6,
+                        help="Share of past slots that were booked")
+    parser.add_argument("--escalations", type=int, default=None,
+                        help="Escalations to create (default: 0.5%% of members)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=50_000,
+                        help="Rows per COPY batch")
+    parser.add_argument("--today", type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                        default=None,
+                        help="Date the data is generated around (YYYY-MM-DD, default today)")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        generate(
+            members=args.members,
+            providers=args.providers,
+            days_back=args.days_back,
+            days_ahead=args.days_ahead,
+            utilization=args.utilization,
+            escalations=args.escalations,
+            seed=args.seed,
+            batch_size=args.batch_size,
+            today=args.today,
+        )
+    else:
+        seed()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The app modules import each other by bare name, as when run from app/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+# agent.py builds its LLM client at import; the tests never call it
+os.environ.setdefault("OPENAI_API_KEY", "test")
@@ -0,0 +1,71 @@
+import pytest
+
+import cache
+from cache import NOT_FOUND, MemberInfoCache, TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_their_ttl(clock):
+    c = TTLCache(ttl=10)
+    c.set("a", 1)
+    c.set("b", 2, ttl=30)
+    clock[0] += 10
+    assert c.get("a") is None
+    assert c.get("b") == 2
+    assert c.stats()["expirations"] == 1
+
+
+def test_least_recently_used_is_evicted(clock):
+    c = TTLCache(maxsize=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert (c.get("a"), c.get("c")) == (1, 3)
+    assert c.stats()["evictions"] == 1
+
+
+def test_hit_rate_counts_hits_and_misses(clock):
+    c = TTLCache()
+    c.set("a", 1)
+    c.get("a")
+    c.get("missing")
+    stats = c.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_not_found_uses_the_negative_ttl(clock):
+    c = MemberInfoCache(ttl=300, negative_ttl=60)
+    c.set_not_found("555-000-0001")
+    assert c.get("555-000-0001") == NOT_FOUND
+    clock[0] += 60
+    assert c.get("555-000-0001") is None
+
+
+def test_invalidating_a_phone_drops_the_members_other_phones(clock):
+    c = MemberInfoCache()
+    c.set("555-000-0001", "info", 7)
+    c.set("555-000-0002", "info", 7)
+    c.set("555-000-0003", "other", 8)
+    c.invalidate_phone("555-000-0001")
+    assert c.get("555-000-0002") is None
+    assert c.get("555-000-0003") == "other"
+
+
+def test_indexes_follow_replacement_and_eviction(clock):
+    c = MemberInfoCache(maxsize=2)
+    c.set("555-000-0001", "info", 7, {10})
+    c.set("555-000-0001", "info", 8, {11})
+    assert 7 not in c._phones_by_member
+    assert 10 not in c._phones_by_provider
+    c.set("555-000-0002", "info", 9)
+    c.set("555-000-0003", "info", 9)
+    assert c._phones_by_member == {9: {"555-000-0002", "555-000-0003"}}
+    assert c._phones_by_provider == {}
@@ -0,0 +1,68 @@
+import json
+
+import httpx
+import pytest
+
+from cassette import Cassette, CassetteMiss
+
+
+def request(body, path="/v1/chat/completions"):
+    return httpx.Request("POST", f"https://api.openai.com{path}", content=json.dumps(body))
+
+
+def chat(content, tool_call_id="call_abc123"):
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {"role": "system", "content": content},
+            {"role": "tool", "tool_call_id": tool_call_id, "content": "ok"},
+        ],
+    }
+
+
+@pytest.fixture
+def cassette(tmp_path):
+    return Cassette(str(tmp_path / "llm.jsonl.gz"), mode="record")
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Now is 2030-01-02 10:15:00.123", "Now is 2031-05-06T23:59"),
+    ("It is Sunday, October 18, 03:12PM", "It is Monday, October 19, 11:40AM"),
+])
+def test_timestamps_are_masked(cassette, first, second):
+    assert cassette.key(request(chat(first))) == cassette.key(request(chat(second)))
+
+
+def test_tool_call_ids_are_masked(cassette):
+    assert cassette.key(request(chat("hi", "call_abc123"))) == \
+        cassette.key(request(chat("hi", "call_XYZ789")))
+
+
+def test_other_changes_change_the_key(cassette):
+    key = cassette.key(request(chat("Member: Lisa")))
+    assert cassette.key(request(chat("Member: John"))) != key
+    assert cassette.key(request(chat("Member: Lisa"), path="/v1/embeddings")) != key
+
+
+def test_key_ignores_json_key_order(cassette):
+    body = chat("hi")
+    reordered = dict(reversed(list(body.items())))
+    assert cassette.key(request(body)) == cassette.key(request(reordered))
+
+
+def test_ignore_patterns_are_masked(tmp_path):
+    cassette = Cassette(str(tmp_path / "llm.jsonl.gz"), mode="record",
+                        ignore=[r"session-\d+"])
+    assert cassette.key(request(chat("session-1"))) == cassette.key(request(chat("session-2")))
+
+
+def test_replay_serves_recorded_responses_in_order(cassette):
+    req = request(chat("Now is 2030-01-02 10:15"))
+    for body in (b'{"n": 1}', b'{"n": 2}'):
+        cassette.record(req, httpx.Response(200), body, 0.1)
+    replay = Cassette(cassette.path, mode="replay")
+    later = request(chat("Now is 2030-01-03 09:00"))
+    assert [replay.lookup(later)["body"] for _ in range(3)] == \
+        ['{"n": 1}', '{"n": 2}', '{"n": 2}']
+    with pytest.raises(CassetteMiss):
+        replay.lookup(request(chat("something else")))
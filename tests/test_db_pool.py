@@ -0,0 +1,92 @@
+import psycopg2.extensions
+import pytest
+
+import db
+
+
+class FakeConnection:
+    """Stands in for a PooledConnection: close() is PooledConnection.close."""
+
+    def __init__(self):
+        self.closed = 0
+        self.really_closed = False
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        pass
+
+    def really_close(self):
+        self.really_closed = True
+        self.closed = 1
+
+    def close(self):
+        db.PooledConnection.close(self)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(db.psycopg2, "connect", lambda *args, **kwargs: FakeConnection())
+    return db.ConnectionPool("postgresql://test", min_size=0, max_size=2, timeout=0.05)
+
+
+def test_release_returns_connection_to_idle(pool):
+    conn = pool.acquire()
+    conn.close()
+    stats = pool.stats()
+    assert (stats["size"], stats["idle"], stats["in_use"]) == (1, 1, 0)
+    assert pool.acquire() is conn
+
+
+def test_closing_twice_releases_once(pool):
+    conn = pool.acquire()
+    conn.close()
+    conn.close()
+    stats = pool.stats()
+    assert (stats["size"], stats["idle"], stats["in_use"]) == (1, 1, 0)
+    # Handed out once, not to two callers
+    assert pool.acquire() is conn
+    assert pool.acquire() is not conn
+
+
+def test_closing_a_broken_connection_frees_its_slot(pool):
+    for _ in range(5):
+        conn = pool.acquire()
+        conn.closed = 2  # dropped by the server
+        conn.close()
+        assert conn.really_closed
+    stats = pool.stats()
+    assert (stats["size"], stats["idle"], stats["in_use"]) == (0, 0, 0)
+    assert stats["closed"] == 5
+    # Both slots are still usable
+    pool.acquire()
+    pool.acquire()
+
+
+def test_discarded_connection_leaves_the_pool(pool):
+    conn = pool.acquire()
+    conn.closed = 2
+    conn.close()
+    # A second close() goes to psycopg2, not to the pool's counters again
+    assert conn.pool is None
+    assert pool.stats()["in_use"] == 0
+
+
+def test_acquire_times_out_when_all_connections_are_in_use(pool):
+    pool.acquire()
+    pool.acquire()
+    with pytest.raises(db.PoolTimeout):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_connection_is_replaced_after_max_uses(monkeypatch):
+    monkeypatch.setattr(db.psycopg2, "connect", lambda *args, **kwargs: FakeConnection())
+    pool = db.ConnectionPool("postgresql://test", min_size=0, max_size=1, max_uses=2)
+    first = pool.acquire()
+    first.close()
+    assert pool.acquire() is first
+    first.close()
+    assert first.really_closed
+    assert pool.acquire() is not first
@@ -0,0 +1,57 @@
+import pytest
+
+import faq
+
+
+@pytest.fixture(scope="module")
+def index():
+    return faq.load()
+
+
+def test_asking_an_faq_question_gets_its_answer(index):
+    entry = index.direct_answer("Will I be charged for the health evaluation?")
+    assert entry["question"] == "Will I be charged for the health evaluation?"
+
+
+def test_rephrased_question_gets_its_answer(index):
+    entry = index.direct_answer("how long does the evaluation take")
+    assert entry["question"] == "How long does an evaluation take?"
+
+
+@pytest.mark.parametrize("utterance", [
+    # Nothing in common with the FAQ
+    "I moved to a new street address",
+    # Only stopwords
+    "yes please",
+])
+def test_no_direct_answer_without_a_clear_match(index, utterance):
+    assert index.direct_answer(utterance) is None
+
+
+@pytest.mark.parametrize("utterance, threshold, passing, disabled", [
+    # Scores 0.58 of the scheduling question's own score
+    ("schedule my visit", "FAQ_DIRECT_MIN_SCORE", 0.5, {}),
+    # The "after my evaluation" and "during my visit" questions score close
+    ("what happens during the visit", "FAQ_DIRECT_MAX_RUNNER_UP", 0.9,
+     {"FAQ_DIRECT_MIN_SCORE": 0.0, "FAQ_DIRECT_MIN_COVERAGE": 0.0}),
+    # Three of the seven terms are in the question
+    ("How long does an evaluation take and can you move my appointment to Friday at 3?",
+     "FAQ_DIRECT_MIN_COVERAGE", 0.4, {}),
+])
+def test_each_threshold_decides_alone(index, monkeypatch, utterance, threshold, passing, disabled):
+    for name, value in disabled.items():
+        monkeypatch.setattr(faq, name, value)
+    assert index.direct_answer(utterance) is None
+    monkeypatch.setattr(faq, threshold, passing)
+    assert index.direct_answer(utterance) is not None
+
+
+def test_search_ranks_the_matching_entry_first(index):
+    results = index.search("is my health information kept safe", k=2)
+    assert len(results) == 2
+    assert results[0]["question"] == "Is my personal health information safe?"
+
+
+def test_tokenize_drops_stopwords_and_suffixes():
+    assert faq.tokenize("Are my evaluations scheduled?") == ["evaluation", "schedul"]
+    assert faq.tokenize("scheduling an evaluation") == ["schedul", "evaluation"]
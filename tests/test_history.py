@@ -0,0 +1,101 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import history
+from history import HistoryManager
+
+
+class FakeLLM:
+    def __init__(self):
+        self.requests = []
+
+    def invoke(self, messages, config=None):
+        self.requests.append(messages)
+        return AIMessage(content=f"summary {len(self.requests)}")
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(history, "count_tokens", lambda text: len(text.split()))
+
+
+def conversation(turns):
+    messages = [AIMessage(content="Hello, can you verify your name?")]
+    for i in range(turns):
+        messages += [HumanMessage(content=f"question {i}"), AIMessage(content=f"answer {i}")]
+    return messages
+
+
+def test_short_call_is_sent_verbatim():
+    llm = FakeLLM()
+    manager = HistoryManager(llm, max_turns=6, token_budget=1000, fold_turns=2)
+    messages = conversation(3)
+    assert manager.window(messages) == messages
+    assert llm.requests == []
+
+
+def test_old_turns_are_folded_into_a_summary():
+    llm = FakeLLM()
+    manager = HistoryManager(llm, max_turns=2, token_budget=1000, fold_turns=2)
+    messages = conversation(5)
+    window = manager.window(messages)
+    assert isinstance(window[0], SystemMessage)
+    assert "summary 1" in window[0].content
+    assert window[1:] == messages[-len(window) + 1:]
+    assert len(window) - 1 <= 2 * 2 + 1
+
+
+def test_summary_is_only_extended_every_fold_turns():
+    llm = FakeLLM()
+    manager = HistoryManager(llm, max_turns=2, token_budget=1000, fold_turns=2)
+    messages = conversation(5)
+    manager.window(messages)
+    messages += [HumanMessage(content="question 5"), AIMessage(content="answer 5")]
+    manager.window(messages)
+    assert len(llm.requests) == 1
+    messages += [HumanMessage(content="question 6"), AIMessage(content="answer 6")]
+    manager.window(messages)
+    assert len(llm.requests) == 2
+
+
+def test_token_budget_keeps_at_least_the_last_exchange():
+    manager = HistoryManager(FakeLLM(), max_turns=6, token_budget=1, fold_turns=1)
+    messages = conversation(3)
+    assert manager.window(messages)[-2:] == messages[-2:]
+
+
+def test_identity_and_actions_are_pinned_word_for_word():
+    llm = FakeLLM()
+    manager = HistoryManager(llm, max_turns=1, token_budget=1000, fold_turns=2)
+    messages = [
+        AIMessage(content="Hello, can you verify your name?"),
+        HumanMessage(content="My name is Lisa Davis"),
+        AIMessage(content="Thank you, your identity is verified."),
+        HumanMessage(content="What time is it?"),
+        AIMessage(content="It is noon."),
+        HumanMessage(content="Cancel my appointment"),
+        AIMessage(content="Appointment ID 7 has been cancelled."),
+    ]
+    context = manager.window(messages)[0].content
+    assert "- Member: My name is Lisa Davis" in context
+    assert "- Agent: Thank you, your identity is verified." in context
+    assert "What time is it?" not in context
+
+
+def test_failed_summary_sends_the_turns_verbatim():
+    class FailingLLM:
+        def invoke(self, messages, config=None):
+            raise RuntimeError("rate limited")
+
+    manager = HistoryManager(FailingLLM(), max_turns=1, token_budget=1000, fold_turns=1)
+    messages = conversation(4)
+    assert manager.window(messages) == messages
+
+
+def test_other_conversation_starts_over():
+    llm = FakeLLM()
+    manager = HistoryManager(llm, max_turns=2, token_budget=1000, fold_turns=2)
+    manager.window(conversation(5))
+    other = [AIMessage(content="Hi")] + [HumanMessage(content="new"), AIMessage(content="call")]
+    assert manager.window(other) == other
+    assert manager.summary == ""
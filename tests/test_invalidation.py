@@ -0,0 +1,95 @@
+import pytest
+
+import invalidation
+import shared
+from shared import availability_cache, member_info_cache, provider_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    invalidation.clear_caches()
+    yield
+    shared.set_listening(False)
+    invalidation.clear_caches()
+
+
+def test_long_ttls_only_while_listening():
+    short = (member_info_cache.ttl, member_info_cache.negative_ttl, provider_cache.ttl,
+             availability_cache.ttl)
+    shared.set_listening(True)
+    assert member_info_cache.ttl > short[0]
+    assert member_info_cache.negative_ttl > short[1]
+    assert provider_cache.ttl > short[2]
+    assert availability_cache.ttl > short[3]
+    shared.set_listening(False)
+    assert (member_info_cache.ttl, member_info_cache.negative_ttl, provider_cache.ttl,
+            availability_cache.ttl) == short
+
+
+def test_member_change_drops_every_phone_of_the_member():
+    member_info_cache.set("555-000-0001", "info", 7)
+    member_info_cache.set("555-000-0002", "info", 7)
+    member_info_cache.set("555-000-0003", "other", 8)
+    invalidation.invalidate({"table": "members", "op": "UPDATE",
+                             "member_ids": [7], "phones": ["555-000-0001"]})
+    assert member_info_cache.get("555-000-0001") is None
+    assert member_info_cache.get("555-000-0002") is None
+    assert member_info_cache.get("555-000-0003") == "other"
+
+
+def test_new_member_drops_a_cached_not_found():
+    member_info_cache.set_not_found("555-000-0009")
+    invalidation.invalidate({"table": "members", "op": "INSERT",
+                             "member_ids": [9], "phones": ["555-000-0009"]})
+    assert member_info_cache.get("555-000-0009") is None
+
+
+def test_availability_change_drops_the_zip_prefix():
+    availability_cache.set("921", "slots")
+    availability_cache.set("100", "slots")
+    invalidation.invalidate({"table": "availability", "op": "UPDATE", "zip_prefixes": ["921"]})
+    assert availability_cache.get("921") is None
+    assert availability_cache.get("100") == "slots"
+
+
+def test_bad_notification_is_counted_not_raised():
+    listener = invalidation.Listener("postgresql://test", "channel")
+    listener.handle("not json")
+    assert listener.stats()["errors"] == 1
+
+
+def test_provider_change_drops_only_that_providers_members():
+    member_info_cache.set("555-000-0001", "with Dr. A", 1, {10})
+    member_info_cache.set("555-000-0002", "with Dr. A and Dr. B", 2, {10, 11})
+    member_info_cache.set("555-000-0003", "with Dr. B", 3, {11})
+    invalidation.invalidate({"table": "providers", "op": "UPDATE",
+                             "provider_ids": [10], "zip_prefixes": ["921"]})
+    assert member_info_cache.get("555-000-0001") is None
+    assert member_info_cache.get("555-000-0002") is None
+    assert member_info_cache.get("555-000-0003") == "with Dr. B"
+    assert 10 not in member_info_cache._phones_by_provider
+    assert member_info_cache._phones_by_provider[11] == {"555-000-0003"}
+
+
+def test_new_provider_keeps_member_information():
+    member_info_cache.set("555-000-0001", "with Dr. A", 1, {10})
+    invalidation.invalidate({"table": "providers", "op": "INSERT",
+                             "provider_ids": [10], "zip_prefixes": ["921"]})
+    assert member_info_cache.get("555-000-0001") == "with Dr. A"
+
+
+def test_sqlite_cache_invalidates_by_provider(tmp_path):
+    from sqlite_cache import SQLiteMemberInfoCache
+
+    cache = SQLiteMemberInfoCache(str(tmp_path / "members.sqlite3"))
+    cache.set("555-000-0001", "with Dr. A", 1, {10})
+    cache.set("555-000-0002", "with Dr. B", 2, {11})
+    # Replacing an entry replaces the providers it mentions
+    cache.set("555-000-0002", "with Dr. A", 2, {10})
+    cache.invalidate_provider_id(11)
+    assert cache.get("555-000-0002") == "with Dr. A"
+    cache.invalidate_provider_id(10)
+    assert cache.get("555-000-0001") is None
+    assert cache.get("555-000-0002") is None
+    rows = cache._connection().execute("SELECT count(*) FROM member_info_provider").fetchone()
+    assert rows[0] == 0
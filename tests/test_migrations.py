@@ -0,0 +1,44 @@
+import re
+
+import migrations
+
+
+class FakeCursor:
+    def __init__(self, invalid):
+        self.invalid = invalid
+        self.executed = []
+        self._row = None
+
+    def execute(self, statement, params=None):
+        self.executed.append(statement)
+        if statement.startswith("SELECT NOT indisvalid"):
+            self._row = (params[0] in self.invalid,)
+
+    def fetchone(self):
+        return self._row
+
+
+def concurrent_statements():
+    return [s for m in migrations.MIGRATIONS for s in m.statements
+            if re.search(r"INDEX\s+CONCURRENTLY", s)]
+
+
+def test_every_concurrent_index_can_be_rebuilt():
+    statements = concurrent_statements()
+    assert statements
+    for statement in statements:
+        assert migrations.CONCURRENT_INDEX.search(statement)
+
+
+def test_invalid_index_is_dropped_before_it_is_built_again():
+    statement = concurrent_statements()[0]
+    name = migrations.CONCURRENT_INDEX.search(statement).group(1)
+    cur = FakeCursor(invalid={name})
+    assert migrations._drop_invalid_index(cur, statement)
+    assert cur.executed[-1] == f"DROP INDEX CONCURRENTLY IF EXISTS {name}"
+
+
+def test_valid_index_is_kept():
+    cur = FakeCursor(invalid=set())
+    assert not migrations._drop_invalid_index(cur, concurrent_statements()[0])
+    assert not any(s.startswith("DROP") for s in cur.executed)
@@ -0,0 +1,51 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from parallel_executor import ParallelAgentExecutor, _Deferred, _pooled_plan
+
+
+def deferred(*tools):
+    return [_Deferred(SimpleNamespace(tool=tool), ()) for tool in tools]
+
+
+def names(groups):
+    return [[d.action.tool for d in group] for group in groups]
+
+
+def test_writes_stay_with_the_caller():
+    pooled, own = _pooled_plan(deferred("get_provider_information", "update_databse",
+                                        "get_availability", "cancel_appointment"), 3)
+    assert names(pooled) == [["get_provider_information"], ["get_availability"]]
+    assert names([own]) == [["update_databse", "cancel_appointment"]]
+
+
+def test_reads_use_at_most_the_call_concurrency():
+    pooled, own = _pooled_plan(deferred(*[f"read_{i}" for i in range(7)]), 3)
+    assert names(pooled) == [["read_0", "read_3", "read_6"], ["read_1", "read_4"]]
+    assert names([own]) == [["read_2", "read_5"]]
+
+
+@pytest.mark.parametrize("tools", [(), ("get_provider_information",)])
+def test_small_steps_run_on_the_caller(tools):
+    pooled, own = _pooled_plan(deferred(*tools), 3)
+    assert pooled == []
+    assert names([own]) == [list(tools)]
+
+
+def test_observations_keep_the_models_order_and_writes_never_use_the_pool():
+    threads = {}
+
+    def run_group(group):
+        for d in group:
+            threads[d.action.tool] = threading.current_thread().name
+        return [(d, d.action.tool) for d in group]
+
+    executor = SimpleNamespace(_run_group=run_group)
+    calls = deferred("get_provider_information", "update_databse", "get_availability")
+    steps = list(ParallelAgentExecutor._run_deferred(executor, calls))
+    assert steps == ["get_provider_information", "update_databse", "get_availability"]
+    assert threads["update_databse"] == threading.current_thread().name
+    assert threads["get_availability"].startswith("tool")
+
@@ -0,0 +1,31 @@
+import pytest
+
+import agent
+import prefetch
+from sessions import SessionRegistry
+
+
+class FakeAgent:
+    def __init__(self, phone_number):
+        self.phone_number = phone_number
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    registry = SessionRegistry()
+    monkeypatch.setattr(agent, "LangChainAgent", FakeAgent)
+    monkeypatch.setattr(agent, "agent_sessions", registry)
+    return registry
+
+
+def test_prefetch_with_another_callers_call_id_leaves_that_call_alone(sessions):
+    call = agent.get_agent("555-000-0001", "call-1")
+    prefetch._build_agent("555-000-0002", "call-1")
+    assert agent.get_agent("555-000-0001", "call-1") is call
+    assert sessions.get(agent.session_key("555-000-0002", "call-1")).phone_number == \
+        "555-000-0002"
+
+
+def test_prefetch_without_call_id_builds_no_session(sessions):
+    prefetch._build_agent("555-000-0001", None)
+    assert sessions.stats()["live_sessions"] == 0
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_openai import ChatOpenAI
+
+import agent
+import response_cache
+from prompts import STATIC_INSTRUCTIONS
+
+MEMBERS = {
+    "215-932-4488": "Member ID: 1\nFirst Name: John\nLast Name: Smith\nAppointments:\n"
+                    "- Appointment ID 7: Appointment on May 02, 2030 at 10:00 AM. "
+                    "Status: Scheduled.",
+    "555-123-4567": "Member ID: 2\nFirst Name: Jane\nLast Name: Johnson\n"
+                    "Appointments: No past or future appointments",
+}
+GREETING = "Hello, thank you for calling our health center. Can you verify your name? "
+TURNS = ["Hi, this is the member calling.", "Can I move my appointment to next week?"]
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    """The serialized chat completion requests the agent sends, with the LLM and database stubbed."""
+    sent = []
+
+    def stream(self, messages, stop=None, run_manager=None, **kwargs):
+        payload = self._get_request_payload(messages, stop=stop, **kwargs)
+        sent.append([json.dumps(payload.get("tools", []), sort_keys=True)]
+                    + [json.dumps(m, sort_keys=True) for m in payload["messages"]])
+        yield ChatGenerationChunk(message=AIMessageChunk(content=f"Answer {len(sent)}."))
+
+    monkeypatch.setattr(ChatOpenAI, "_stream", stream)
+    monkeypatch.setattr(agent.t, "get_member_information", MEMBERS.get)
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_ENABLED", False)
+    monkeypatch.setattr(agent.faq, "FAQ_DIRECT_ANSWERS", False)
+    return sent
+
+
+def play_call(phone_number):
+    """Play the turns of a call from phone_number through the agent."""
+    lc_agent = agent.LangChainAgent(phone_number)
+    transcript = [GREETING]
+    for utterance in TURNS:
+        transcript.append(utterance)
+        transcript.append(lc_agent.get_response(transcript))
+
+
+def test_static_prefix_is_identical_for_every_member_and_turn(requests):
+    for phone_number in MEMBERS:
+        play_call(phone_number)
+    assert len(requests) == len(MEMBERS) * len(TURNS)
+    tools, instructions = requests[0][:2]
+    assert json.loads(tools)
+    assert json.loads(instructions)["content"] == STATIC_INSTRUCTIONS
+    for request in requests:
+        assert request[:2] == [tools, instructions]
+
+
+def test_member_data_only_follows_the_conversation(requests):
+    play_call("215-932-4488")
+    first, second = requests
+    # The previous turn without its per-turn context and utterance starts the next one
+    assert second[:len(first) - 2] == first[:-2]
+    for request in requests:
+        assert "John" not in "".join(request[:-2])
+        assert "John" in request[-2]
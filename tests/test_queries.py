@@ -0,0 +1,32 @@
+import pytest
+
+from queries import EDITABLE_MEMBER_COLUMNS, member_update_query, numbered_params
+
+
+def test_numbered_params_numbers_each_placeholder():
+    assert numbered_params("SELECT %s, %s FROM t WHERE a = %s") == \
+        "SELECT $1, $2 FROM t WHERE a = $3"
+
+
+def test_numbered_params_leaves_queries_without_placeholders():
+    assert numbered_params("SELECT 1") == "SELECT 1"
+
+
+def test_member_update_query_sets_the_given_columns():
+    query = member_update_query(["email", "city"])
+    assert "SET email = %s, city = %s" in query
+    assert "WHERE phone_number = %s" in query
+    assert query.count("%s") == 3
+
+
+@pytest.mark.parametrize("column", [
+    "id", "first_name", "date_of_birth", "medical_conditions",
+    "email = 'x', id", "email; DROP TABLE members",
+])
+def test_member_update_query_rejects_other_columns(column):
+    with pytest.raises(ValueError):
+        member_update_query(["email", column])
+
+
+def test_every_editable_column_can_be_updated():
+    member_update_query(list(EDITABLE_MEMBER_COLUMNS))
@@ -0,0 +1,91 @@
+from datetime import date, time
+
+import pytest
+
+from response_cache import FIRST_NAME, ResponseCache, member_values
+from tools import render_member_information
+
+MEMBER = (8, "Lisa", "Davis", "555-192-7854", date(1981, 4, 17), "Female",
+          "415 Main St", "San Diego", "CA", "92101", "lisa.davis@example.com")
+APPOINTMENTS = [
+    (31, date(2030, 5, 2), time(10, 0), "77 Oak Ave", "La Jolla", "CA", "92037",
+     "scheduled", "Gregory", "Hale", 4),
+]
+INFO = render_member_information(MEMBER, APPOINTMENTS)
+OTHER_INFO = render_member_information(
+    (9, "Omar", "Reyes", "555-000-1111", date(1990, 1, 1), "Male", "1 Elm St", "Austin",
+     "TX", "73301", "omar@example.com"),
+    [],
+)
+
+
+@pytest.fixture
+def cache():
+    return ResponseCache(maxsize=10, ttl=60)
+
+
+def test_member_values_cover_every_field_but_the_first_name():
+    values = member_values(INFO)
+    assert "Lisa" not in values
+    for value in ["Davis", "555-192-7854", "1981-04-17", "Female", "415 Main St",
+                  "San Diego", "CA", "92101", "lisa.davis@example.com", "8",
+                  "May 02, 2030", "10:00 AM", "Gregory Hale", "Gregory", "Hale",
+                  "77 Oak Ave", "La Jolla", "92037", "Scheduled"]:
+        assert value in values, value
+
+
+@pytest.mark.parametrize("answer", [
+    "Lisa, our San Diego office can help with that.",
+    "Lisa, the clinic in La Jolla is open on weekdays.",
+    "As a female patient, Lisa, you can ask for a female clinician.",
+    "Dr. Hale will walk you through it.",
+    "Gregory is one of our best providers.",
+    "Davis family members are welcome too.",
+    "Everyone in CA is covered.",
+    "Your visit is Scheduled, Lisa.",
+    "We will write to lisa.davis@example.com.",
+    "Your birthday is 1981-04-17.",
+    "See you at 10:00 AM.",
+])
+def test_answers_with_member_data_are_not_cached(cache, answer):
+    key = ("will i be charged", "member:scheduled")
+    assert not cache.store(key, answer, INFO, latency=1.0)
+    assert cache.get(key) is None
+    assert cache.stats()["rejected"] == 1
+
+
+def test_generic_answer_is_served_to_the_next_caller_with_their_name(cache):
+    key = ("will i be charged", "member")
+    answer = "No, Lisa, the health evaluation is free of charge."
+    assert cache.store(key, answer, INFO, latency=1.5)
+    assert cache.get(key)[0] == f"No, {FIRST_NAME}, the health evaluation is free of charge."
+    assert cache.lookup(key, OTHER_INFO) == "No, Omar, the health evaluation is free of charge."
+    assert cache.stats()["latency_saved"] == 1.5
+
+
+def test_answers_produced_with_tools_are_not_cached(cache):
+    assert not cache.store(("q", "member"), "It is free.", INFO, latency=1.0, used_tools=True)
+
+
+def test_placeholder_answer_needs_a_first_name(cache):
+    key = ("q", "member")
+    cache.store(key, "Hi Lisa, it is free.", INFO, latency=1.0)
+    assert cache.lookup(key, "") is None
+
+
+@pytest.mark.parametrize("utterance", [
+    "When is my appointment?",
+    "Can I cancel?",
+    "My number is 555 1234",
+])
+def test_member_specific_turns_have_no_key(cache, utterance):
+    assert cache.key(utterance, INFO) is None
+
+
+def test_key_separates_callers_by_member_state(cache):
+    utterance = "Will I be charged for the health evaluation?"
+    key = cache.key(utterance, INFO)
+    assert key is not None
+    assert key[1] == "member:scheduled"
+    assert cache.key(utterance, OTHER_INFO)[1] == "member"
+    assert cache.key(utterance, "")[1] == "unknown"
@@ -0,0 +1,35 @@
+import pickle
+
+import pytest
+
+import tool_agents
+
+
+def write_snapshot(path, value):
+    data = pickle.dumps(value)
+    path.write_bytes(tool_agents._signature(data) + b"\n" + data)
+
+
+def test_signed_snapshot_is_read(tmp_path):
+    path = tmp_path / "schema.pickle"
+    write_snapshot(path, {"tables": ["members"]})
+    assert tool_agents._read_snapshot(path) == {"tables": ["members"]}
+
+
+def test_changed_snapshot_is_not_unpickled(tmp_path, monkeypatch):
+    path = tmp_path / "schema.pickle"
+    write_snapshot(path, {"tables": ["members"]})
+    path.write_bytes(path.read_bytes().replace(b"members", b"payload"))
+    loads = []
+    monkeypatch.setattr(tool_agents.pickle, "loads", loads.append)
+    with pytest.raises(ValueError):
+        tool_agents._read_snapshot(path)
+    assert loads == []
+
+
+def test_snapshot_signed_with_another_key_is_rejected(tmp_path, monkeypatch):
+    path = tmp_path / "schema.pickle"
+    write_snapshot(path, {"tables": ["members"]})
+    monkeypatch.setattr(tool_agents, "SCHEMA_SNAPSHOT_KEY", "another database")
+    with pytest.raises(ValueError):
+        tool_agents._read_snapshot(path)
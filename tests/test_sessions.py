@@ -0,0 +1,95 @@
+import pytest
+
+import sessions
+from sessions import SessionRegistry
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(sessions.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_session_is_built_once_per_id(clock):
+    registry = SessionRegistry()
+    built = []
+    factory = lambda: built.append(object()) or built[-1]
+    first = registry.get_or_create("call-1", factory)
+    assert registry.get_or_create("call-1", factory) is first
+    assert registry.get_or_create("call-2", factory) is not first
+    assert len(built) == 2
+    assert (registry.stats()["hits"], registry.stats()["misses"]) == (1, 2)
+
+
+def test_idle_sessions_expire(clock):
+    registry = SessionRegistry(idle_ttl=60)
+    registry.get_or_create("idle", object)
+    clock[0] += 30
+    registry.get_or_create("active", object)
+    clock[0] += 30
+    assert registry.get("idle") is None
+    assert registry.get("active") is not None
+    assert registry.stats()["expirations"] == 1
+
+
+def test_use_keeps_a_session_alive(clock):
+    registry = SessionRegistry(idle_ttl=60)
+    session = registry.get_or_create("call", object)
+    for _ in range(3):
+        clock[0] += 45
+        assert registry.get("call") is session
+
+
+def test_least_recently_used_session_is_evicted(clock):
+    registry = SessionRegistry(max_sessions=2)
+    registry.get_or_create("a", object)
+    registry.get_or_create("b", object)
+    registry.get("a")
+    registry.get_or_create("c", object)
+    assert registry.get("b") is None
+    assert registry.get("a") is not None
+    assert registry.stats()["evictions"] == 1
+
+
+def test_ended_session_is_dropped(clock):
+    registry = SessionRegistry()
+    session = registry.get_or_create("call", object)
+    assert registry.end("call") is session
+    assert registry.end("call") is None
+    assert registry.get("call") is None
+
+
+class FakeAgent:
+    def __init__(self, phone_number):
+        self.phone_number = phone_number
+
+
+@pytest.fixture
+def agents(monkeypatch):
+    import agent
+
+    monkeypatch.setattr(agent, "LangChainAgent", FakeAgent)
+    monkeypatch.setattr(agent, "agent_sessions", SessionRegistry())
+    return agent
+
+
+def test_call_id_from_another_phone_gets_another_agent(agents):
+    call = agents.get_agent("555-000-0001", "call-1")
+    assert agents.get_agent("555-000-0001", "call-1") is call
+    other = agents.get_agent("555-000-0002", "call-1")
+    assert other is not call
+    assert other.phone_number == "555-000-0002"
+
+
+def test_requests_without_call_id_do_not_share_an_agent(agents):
+    first = agents.get_agent("555-000-0001")
+    assert agents.get_agent("555-000-0001") is not first
+    assert agents.agent_sessions.stats()["live_sessions"] == 0
+
+
+def test_only_the_caller_can_end_a_call(agents):
+    agents.get_agent("555-000-0001", "call-1")
+    assert not agents.end_call("555-000-0002", "call-1")
+    assert agents.end_call("555-000-0001", "call-1")
+    assert not agents.end_call("555-000-0001", None)
@@ -0,0 +1,77 @@
+import json
+
+from streaming import SentenceBuffer, StreamingCallbackHandler, sse, stream_text
+
+
+def feed_all(tokens):
+    buffer = SentenceBuffer()
+    sentences = []
+    for token in tokens:
+        sentences += buffer.feed(token)
+    return sentences + buffer.flush()
+
+
+def test_sentences_are_split_on_terminal_punctuation():
+    assert feed_all(["Hello there. How", " are you? Fine!", " Bye"]) == [
+        "Hello there.", "How are you?", "Fine!", "Bye",
+    ]
+
+
+def test_sentence_is_released_only_once_followed_by_whitespace():
+    buffer = SentenceBuffer()
+    assert buffer.feed("It costs 4.") == []
+    assert buffer.feed("5 dollars. ") == ["It costs 4.5 dollars."]
+
+
+def test_abbreviations_and_initials_do_not_end_a_sentence():
+    assert feed_all(["See Dr. Smith at 10 a.m. tomorrow. J. R. R. Tolkien wrote it."]) == [
+        "See Dr. Smith at 10 a.m. tomorrow.", "J. R. R. Tolkien wrote it.",
+    ]
+
+
+def test_newlines_end_a_sentence():
+    assert feed_all(["First line\nSecond line"]) == ["First line", "Second line"]
+
+
+def test_closing_quotes_stay_with_their_sentence():
+    assert feed_all(['He said "yes." Then left.']) == ['He said "yes."', "Then left."]
+
+
+def recording_handler():
+    events = []
+    return StreamingCallbackHandler(lambda event, data: events.append((event, data))), events
+
+
+def test_tokens_generated_while_a_tool_runs_are_dropped():
+    handler, events = recording_handler()
+    handler.on_llm_new_token("Let me check. One")
+    handler.on_tool_start({"name": "get_availability"}, "")
+    handler.on_llm_new_token("SELECT 1")
+    handler.on_tool_end("", name="get_availability")
+    handler.on_llm_new_token(" moment.")
+    handler.finish()
+    assert [e for e in events if e[0] == "sentence"] == [
+        ("sentence", {"text": "Let me check."}),
+        ("sentence", {"text": "One"}),
+        ("sentence", {"text": "moment."}),
+    ]
+    assert ("token", {"text": "SELECT 1"}) not in events
+
+
+def test_answers_found_without_the_llm_are_streamed_as_sentences():
+    handler, events = recording_handler()
+    stream_text([object(), handler], "No, it is free. It is part of your plan.")
+    handler.finish()
+    assert events == [
+        ("token", {"text": "No, it is free. It is part of your plan."}),
+        ("sentence", {"text": "No, it is free."}),
+        ("sentence", {"text": "It is part of your plan."}),
+    ]
+
+
+def test_sse_format():
+    event = sse("sentence", {"text": "Hi."})
+    assert event.endswith("\n\n")
+    name, data = event.strip().split("\n")
+    assert name == "event: sentence"
+    assert json.loads(data[len("data: "):]) == {"text": "Hi."}